@@ -1,26 +1,46 @@
 from dotenv import load_dotenv
-import os
 load_dotenv()
 
 \
 import os
 from datetime import datetime, timedelta
-from decimal import Decimal
 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, session
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, stream_with_context, jsonify, make_response, render_template, request, redirect, url_for, flash, send_from_directory, session
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 
-from models import db, User, Shop, Category, MenuItem, Table, Order, OrderItem, Ingredient, Recipe, Inventory, Member, Payment, Subscription
-from utils.promptpay import build_promptpay_qr_png, PromptPayIDType
-import qrcode, io, base64
+from models import db, User, Shop, Category, MenuItem, Table, Order, OrderItem, Ingredient, Recipe, Inventory, Member, Payment, Subscription, Receipt
+from utils.promptpay import build_promptpay_payload, render_qr_png, payload_etag, qr_cache, PromptPayIDType
+from utils.rollups import (record_sale, sales_summary, hourly_sales, rebuild_rollups, top_items as top_selling_items,
+                           top_items_from_orders, TOP_ITEM_METRICS)
+from utils.events import init_events, publish, stream as event_stream
+from utils.tenant import load_user, current_shop
+from utils.menu_cache import get_menu, bump_menu_version, resolve_table_token, new_table_token
+from utils.cart import price_cart, CartLine
+from utils.orders import (add_to_table, find_open_order, resolve_lines, order_to_dict, submit_once, prune_submissions,
+                          LineError, SUBMISSION_KEY_RE)
+from utils.images import store_upload, parse_variant, render_variant, image_sources, InvalidImage
+from utils import migrations
+from utils import metrics
+from utils.database import configure_database, init_database, read_session
+from utils.pagination import page_args
+from utils.exports import EXPORTS, FORMATS, stream_export
+from utils.listings import (members_page, member_to_dict, menu_page, menu_item_to_dict, stock_page, stock_to_dict,
+                            categories_page, category_to_dict, paid_orders_page, paid_order_to_dict)
+from utils.inventory import deduct_for_order, apply_movements, stock_drift, rebuild_stock, adopt_stock
+from utils.cart_store import init_cart_store, get_store as cart_store, cart_key as store_cart_key, new_cart_id, COOKIE as CART_COOKIE
+from utils.qr_sheet import ensure_tokens, render_sheet, sheet_digest, find_font, page_count, FORMATS as SHEET_FORMATS
+from utils.receipts import freeze_receipt, get_receipt, escpos_bytes
+from utils.jobs import init_jobs, job, enqueue, run_worker, queue_stats, prune_jobs
+from utils.archive import archive_batch, archive_stats
+from sqlalchemy import update
+from sqlalchemy.orm import selectinload
+import click
+import base64, hashlib, hmac
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")  # created on first upload
 
 def create_app():
     app = Flask(__name__)
@@ -28,21 +48,49 @@ def create_app():
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(BASE_DIR, "pos.db"))
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-
+    app.config["EVENT_BACKEND"] = os.getenv("EVENT_BACKEND", "memory")
+    app.config["MENU_CACHE_TTL"] = float(os.getenv("MENU_CACHE_TTL", "60"))
+    app.config["IMAGE_WORKERS"] = int(os.getenv("IMAGE_WORKERS", "2"))
+    app.config["SLOW_REQUEST_MS"] = float(os.getenv("SLOW_REQUEST_MS", "0"))
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN", "")
+    app.config["QR_SHEET_WORKERS"] = int(os.getenv("QR_SHEET_WORKERS", str(min(4, os.cpu_count() or 1))))
+    app.config["QR_SHEET_FONT"] = find_font(os.getenv("QR_SHEET_FONT"))
+    app.config["ESCPOS_COLUMNS"] = int(os.getenv("ESCPOS_COLUMNS", "32"))
+    app.config["ESCPOS_CODE_PAGE"] = int(os.getenv("ESCPOS_CODE_PAGE", "21"))
+    app.config["CART_STORE"] = os.getenv("CART_STORE", "memory")
+    app.config["CART_TTL_SECONDS"] = float(os.getenv("CART_TTL_SECONDS", str(3 * 3600)))
+    app.config["CART_MAX"] = int(os.getenv("CART_MAX", "10000"))
+    app.config["CART_SWEEP_SECONDS"] = float(os.getenv("CART_SWEEP_SECONDS", "300"))
+    app.config["JOB_MODE"] = os.getenv("JOB_MODE", "thread")
+    app.config["JOB_POLL_SECONDS"] = float(os.getenv("JOB_POLL_SECONDS", "1"))
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+    qr_cache.max_entries = int(os.getenv("QR_CACHE_MAX_ENTRIES", "512"))
+    qr_cache.max_bytes = int(os.getenv("QR_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+    configure_database(app)
     db.init_app(app)
+    init_database(app)
+    init_events(app)
+    metrics.init_metrics(app)
+    init_jobs(app)
+    init_cart_store(app)
 
     login_manager = LoginManager(app)
     login_manager.login_view = "login"
+    login_manager.user_loader(load_user)
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
-
-    with app.app_context():
-        db.create_all()
+    # no database I/O at import; the schema is brought up by `flask db-upgrade`
+    if os.getenv("AUTO_MIGRATE", "0") == "1":
+        with app.app_context():
+            migrations.upgrade(db.engine, log=app.logger.info)
     return app
 
 app = create_app()
+metrics.gauge("pos_qr_cache_entries", "Rendered QR PNGs held in this process.", lambda: len(qr_cache))
+metrics.gauge("pos_qr_cache_bytes", "Bytes held by the QR PNG cache.", lambda: qr_cache.size_bytes)
+metrics.gauge("pos_qr_cache_hits_total", "QR PNG cache hits since start.", lambda: qr_cache.hits, kind="counter")
+metrics.gauge("pos_qr_cache_misses_total", "QR PNG cache misses since start.", lambda: qr_cache.misses, kind="counter")
+metrics.gauge("pos_carts", "Self-order carts held by the cart store (expired ones until swept; counted at most once per sweep interval).", lambda: len(app.extensions["cart_store"]))
 
 # ---- System owner config (from .env) ----
 SYSTEM_PROMPTPAY_ID = os.getenv("SYSTEM_PROMPTPAY_ID", "0812345678")
@@ -63,7 +111,7 @@ def shop_required(fn):
             flash("กรุณาสร้าง/เข้าร่วมร้านค้าก่อน", "warning")
             return redirect(url_for("register"))
         # check subscription valid
-        shop = Shop.query.get(current_user.shop_id)
+        shop = current_shop()
         if shop.plan_expiry and shop.plan_expiry < datetime.utcnow().date():
             allowed = {"subscriptions", "logout", "set_subscription_paid"}
             if request.endpoint not in allowed:
@@ -72,18 +120,41 @@ def shop_required(fn):
         return fn(*args, **kwargs)
     return wrapper
 
-def _rand_token(n=16):
-    import secrets, string
-    alphabet = string.ascii_letters + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(n))
+def _order_payload(shop, order):
+    return build_promptpay_payload(
+        shop.promptpay_id or "0812345678", PromptPayIDType[shop.promptpay_kind or "PHONE"], float(order.total_amount),
+        merchant_name=shop.name, merchant_city="BANGKOK",
+        reference=f"ORDER{order.id}", dynamic=True
+    )
+
+def _subscription_payload(sub):
+    return build_promptpay_payload(
+        SYSTEM_PROMPTPAY_ID, PromptPayIDType[SYSTEM_PROMPTPAY_KIND], float(sub.price),
+        merchant_name=SYSTEM_MERCHANT_NAME, merchant_city=SYSTEM_MERCHANT_CITY,
+        reference=f"SUB{sub.id}", dynamic=True
+    )
+
+def _qr_png_response(payload, digest, url_for_digest):
+    # the URL embeds the payload digest, so its content can never change
+    etag = payload_etag(payload)
+    if digest != etag:
+        return redirect(url_for_digest(etag))
+    resp = Response(mimetype="image/png")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    if request.if_none_match.contains(etag):
+        resp.status_code = 304
+        return resp
+    resp.set_data(render_qr_png(payload))
+    return resp
 
 def ensure_table_token(table):
     try:
         if not getattr(table, "token", None):
-            table.token = _rand_token(16)
+            table.token = new_table_token()
             db.session.commit()
         elif not table.token:
-            table.token = _rand_token(16)
+            table.token = new_table_token()
             db.session.commit()
     except Exception:
         pass
@@ -136,24 +207,19 @@ def logout():
 @login_required
 @shop_required
 def dashboard():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     today = datetime.utcnow().date()
-    orders = Order.query.filter_by(shop_id=shop.id, status="PAID").all()
-    day_sales = sum([o.total_amount for o in orders if o.closed_at and o.closed_at.date() == today])
-    week_sales = sum([o.total_amount for o in orders if o.closed_at and (today - o.closed_at.date()).days <= 7])
-    month_sales = sum([o.total_amount for o in orders if o.closed_at and o.closed_at.date().month == today.month and o.closed_at.date().year == today.year])
-    top = {}
-    for o in orders:
-        for it in o.items:
-            top[it.menu_item.name] = top.get(it.menu_item.name, 0) + it.quantity
-    top_items = sorted(top.items(), key=lambda x: x[1], reverse=True)[:5]
+    reader = read_session()
+    sales = sales_summary(shop.id, today, session=reader)
+    day_sales, week_sales, month_sales = sales["day"], sales["week"], sales["month"]
+    top_items = [(name, qty) for name, qty, _ in top_selling_items(shop.id, limit=5, session=reader)]
     return render_template("dashboard.html", shop=shop, day_sales=day_sales, week_sales=week_sales, month_sales=month_sales, top_items=top_items)
 
 # Subscriptions
 @app.route("/subscriptions", methods=["GET","POST"])
 @login_required
 def subscriptions():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     plans = [
         {"code":"MONTHLY","name":"รายเดือน","days":30,"price":299.0},
         {"code":"ANNUAL","name":"รายปี","days":365,"price":2990.0},
@@ -171,24 +237,26 @@ def subscriptions():
 @app.route("/subscriptions/<int:sub_id>/pay")
 @login_required
 def pay_subscription(sub_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     sub = Subscription.query.get_or_404(sub_id)
     if sub.shop_id != shop.id: 
         flash("ไม่พบรายการของร้านคุณ","danger"); return redirect(url_for("subscriptions"))
-    receiver = SYSTEM_PROMPTPAY_ID
-    kind = SYSTEM_PROMPTPAY_KIND
-    amount = float(sub.price)
-    png_bytes = build_promptpay_qr_png(
-        receiver, PromptPayIDType[kind], amount,
-        merchant_name=SYSTEM_MERCHANT_NAME, merchant_city=SYSTEM_MERCHANT_CITY,
-        reference=f"SUB{sub.id}", dynamic=True
-    )
-    return render_template("subscription_pay.html", shop=shop, sub=sub, qr_png=b"data:image/png;base64,"+png_bytes.encode())
+    qr_url = url_for("subscription_promptpay_png", sub_id=sub.id, digest=payload_etag(_subscription_payload(sub)))
+    return render_template("subscription_pay.html", shop=shop, sub=sub, qr_url=qr_url)
+
+@app.route("/subscriptions/<int:sub_id>/promptpay/<digest>.png")
+@login_required
+def subscription_promptpay_png(sub_id, digest):
+    sub = Subscription.query.get_or_404(sub_id)
+    if sub.shop_id != current_user.shop_id:
+        return "Not found", 404
+    return _qr_png_response(_subscription_payload(sub), digest,
+                            lambda d: url_for("subscription_promptpay_png", sub_id=sub.id, digest=d))
 
 @app.route("/subscriptions/<int:sub_id>/mark_paid", methods=["POST"])
 @login_required
 def set_subscription_paid(sub_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     sub = Subscription.query.get_or_404(sub_id)
     if sub.shop_id != shop.id: 
         flash("ไม่พบรายการของร้านคุณ","danger"); return redirect(url_for("subscriptions"))
@@ -204,13 +272,14 @@ def set_subscription_paid(sub_id):
 @login_required
 @shop_required
 def settings():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     if request.method == "POST":
         shop.name = request.form["name"]
         shop.promptpay_id = request.form.get("promptpay_id","").strip()
         shop.promptpay_kind = request.form.get("promptpay_kind","PHONE")
         shop.point_rate = float(request.form.get("point_rate", "1.0"))
         db.session.commit()
+        bump_menu_version(shop.id)
         flash("บันทึกการตั้งค่าแล้ว","success")
         return redirect(url_for("settings"))
     return render_template("settings.html", shop=shop)
@@ -220,13 +289,15 @@ def settings():
 @login_required
 @shop_required
 def categories():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     if request.method == "POST":
         name = request.form["name"]
         db.session.add(Category(shop_id=shop.id, name=name)); db.session.commit()
+        bump_menu_version(shop.id)
         return redirect(url_for("categories"))
-    cats = Category.query.filter_by(shop_id=shop.id).all()
-    return render_template("categories.html", cats=cats)
+    q, after, limit = page_args(request.args)
+    page = categories_page(shop.id, q, after, limit)
+    return render_template("categories.html", cats=page.rows, q=q, next_cursor=page.next_cursor)
 
 @app.route("/categories/<int:cat_id>/delete", methods=["POST"])
 @login_required
@@ -235,27 +306,31 @@ def del_category(cat_id):
     if cat.shop_id != current_user.shop_id: 
         flash("ไม่พบหมวดหมู่ของร้านคุณ","danger"); return redirect(url_for("categories"))
     db.session.delete(cat); db.session.commit()
+    bump_menu_version(cat.shop_id)
     return redirect(url_for("categories"))
 
 @app.route("/menu", methods=["GET","POST"])
 @login_required
 @shop_required
 def menu():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     cats = Category.query.filter_by(shop_id=shop.id).all()
-    if request.method == "POST"]:
+    if request.method == "POST":
         name = request.form["name"]; price = float(request.form["price"]); cat_id = int(request.form["category_id"])
         img = request.files.get("image")
         img_path = None
         if img and img.filename:
-            fname = datetime.utcnow().strftime("%Y%m%d%H%M%S_") + secure_filename(img.filename)
-            img.save(os.path.join(app.config["UPLOAD_FOLDER"], fname))
-            img_path = f"/static/uploads/{fname}"
+            try:
+                img_path = store_upload(img, app.config["UPLOAD_FOLDER"], app.config["IMAGE_WORKERS"])
+            except InvalidImage:
+                flash("ไฟล์รูปภาพไม่ถูกต้อง","danger"); return redirect(url_for("menu"))
         db.session.add(MenuItem(shop_id=shop.id, name=name, price=price, category_id=cat_id, image_url=img_path))
         db.session.commit()
+        bump_menu_version(shop.id)
         return redirect(url_for("menu"))
-    items = MenuItem.query.filter_by(shop_id=shop.id).all()
-    return render_template("menu.html", items=items, cats=cats)
+    q, after, limit = page_args(request.args)
+    page = menu_page(shop.id, q, after, limit)
+    return render_template("menu.html", items=page.rows, cats=cats, q=q, next_cursor=page.next_cursor)
 
 @app.route("/menu/<int:item_id>/delete", methods=["POST"])
 @login_required
@@ -264,6 +339,7 @@ def del_menu_item(item_id):
     if it.shop_id != current_user.shop_id: 
         flash("ไม่พบเมนูของร้านคุณ","danger"); return redirect(url_for("menu"))
     db.session.delete(it); db.session.commit()
+    bump_menu_version(it.shop_id)
     return redirect(url_for("menu"))
 
 # Tables & Orders
@@ -271,7 +347,7 @@ def del_menu_item(item_id):
 @login_required
 @shop_required
 def tables():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     if request.method == "POST":
         name = request.form["name"]
         db.session.add(Table(shop_id=shop.id, name=name, status="FREE")); db.session.commit()
@@ -283,142 +359,293 @@ def tables():
 @login_required
 @shop_required
 def table_qr(table_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     table = Table.query.get_or_404(table_id)
     if table.shop_id != shop.id:
         flash("ไม่พบโต๊ะของร้านคุณ","danger"); return redirect(url_for("tables"))
     token = ensure_table_token(table)
     public_url = url_for("public_order", token=token, _external=True)
-    img = qrcode.make(public_url)
-    bio = io.BytesIO(); img.save(bio, format="PNG")
-    b64 = base64.b64encode(bio.getvalue()).decode("utf-8")
+    b64 = base64.b64encode(render_qr_png(public_url, box_size=10)).decode("utf-8")
     return render_template("table_qr.html", table=table, public_url=public_url, qr_png=b64)
 
+def _qr_sheet_cards(shop):
+    return [(url_for("public_order", token=t.token, _external=True), t.name) for t in ensure_tokens(shop.id)]
+
+def _render_qr_sheet(shop, cards, fmt, page=None):
+    return render_sheet(shop.name, cards, fmt, page, app.config["QR_SHEET_FONT"], app.config["QR_SHEET_WORKERS"])[1]
+
+@app.route("/tables/qr-sheet.<fmt>")
+@login_required
+@shop_required
+def tables_qr_sheet(fmt):
+    """QR cards for every table, A4 (PDF: all pages; PNG: ?page=N)."""
+    if fmt not in SHEET_FORMATS:
+        return "Not found", 404
+    shop = current_shop()
+    page = request.args.get("page", 1, type=int) if fmt == "png" else None
+    cards = _qr_sheet_cards(shop)
+    digest = sheet_digest(shop.name, cards, fmt, page)  # revalidation needs no rendering
+    resp = Response(mimetype=SHEET_FORMATS[fmt])
+    resp.set_etag(digest)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.headers["X-Page-Count"] = str(page_count(len(cards)))
+    if request.if_none_match.contains(digest):
+        resp.status_code = 304
+        return resp
+    resp.set_data(_render_qr_sheet(shop, cards, fmt, page))
+    return resp
+
 @app.route("/orders/new/<int:table_id>", methods=["GET","POST"])
 @login_required
 @shop_required
 def new_order(table_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     table = Table.query.get_or_404(table_id)
     if table.shop_id != shop.id: 
         flash("ไม่พบโต๊ะของร้านคุณ","danger"); return redirect(url_for("tables"))
     if request.method == "POST":
         item_id = int(request.form["item_id"]); qty = int(request.form["qty"])
-        order = Order.query.filter_by(shop_id=shop.id, table_id=table.id, status="OPEN").first()
-        if not order:
-            order = Order(shop_id=shop.id, table_id=table.id, status="OPEN", created_at=datetime.utcnow(), total_amount=0.0)
-            db.session.add(order); db.session.commit()
-            table.status="BUSY"; db.session.commit()
-        menu_item = MenuItem.query.get(item_id)
-        db.session.add(OrderItem(order_id=order.id, menu_item_id=item_id, quantity=qty, unit_price=menu_item.price)); db.session.commit()
-        order.total_amount = sum([it.quantity*it.unit_price for it in order.items]); db.session.commit()
+        menu_item = MenuItem.query.filter_by(id=item_id, shop_id=shop.id).first()
+        if not menu_item or qty < 1:
+            flash("ไม่พบเมนูของร้านคุณ","danger"); return redirect(url_for("new_order", table_id=table.id))
+        note = request.form.get("note", "").strip()[:200] or None
+        add_to_table(shop.id, table.id, [CartLine(menu_item.id, menu_item.name, menu_item.price, qty, note)])
+        db.session.commit()
         flash("เพิ่มรายการแล้ว","success")
         return redirect(url_for("new_order", table_id=table.id))
     items = MenuItem.query.filter_by(shop_id=shop.id).all()
-    order = Order.query.filter_by(shop_id=shop.id, table_id=table.id, status="OPEN").first()
+    order = find_open_order(shop.id, table.id)
     return render_template("order_new.html", table=table, items=items, order=order)
 
+@app.route("/api/tables/<int:table_id>/order", methods=["GET","POST"])
+@login_required
+@shop_required
+def api_table_order(table_id):
+    shop = current_shop()
+    table = Table.query.get_or_404(table_id)
+    if table.shop_id != shop.id:
+        return jsonify(error="table not found"), 404
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify(error="expected a JSON object"), 400
+        try:
+            lines = resolve_lines(shop.id, body.get("lines"))
+        except LineError as e:
+            return jsonify(error="invalid lines", details=e.errors), 400
+        order = add_to_table(shop.id, table.id, lines)
+        db.session.commit()
+        return jsonify(order=order_to_dict(order))
+    return jsonify(order=order_to_dict(find_open_order(shop.id, table.id)))
+
 @app.route("/kitchen")
 @login_required
 @shop_required
 def kitchen():
-    shop = Shop.query.get(current_user.shop_id)
-    orders = Order.query.filter_by(shop_id=shop.id, status="OPEN").all()
-    return render_template("kitchen.html", orders=orders)
+    shop = current_shop()
+    # cursor first: anything committed after it is replayed by the stream
+    # (lines already on the page are skipped by id)
+    last_event_id = app.extensions["events"].cursor(shop.id)
+    orders = (Order.query.filter_by(shop_id=shop.id, status="OPEN")
+              .options(selectinload(Order.items).joinedload(OrderItem.menu_item))
+              .order_by(Order.id).all())
+    return render_template("kitchen.html", orders=orders, last_event_id=last_event_id)
+
+@app.route("/kitchen/stream")
+@login_required
+@shop_required
+def kitchen_stream():
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id") or 0
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        last_id = 0
+    resp = Response(event_stream(current_user.shop_id, last_id), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 @app.route("/orders/<int:order_id>/close", methods=["GET","POST"])
 @login_required
 @shop_required
 def close_order(order_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     order = Order.query.get_or_404(order_id)
     if order.shop_id != shop.id:
         flash("ไม่พบออเดอร์ของร้านคุณ","danger"); return redirect(url_for("tables"))
+    if order.status == "PAID":
+        return redirect(url_for("receipt", order_id=order.id))
     if request.method == "POST":
         method = request.form["method"]
         member_phone = request.form.get("member_phone","").strip()
         if member_phone:
-            member = Member.query.filter_by(shop_id=shop.id, phone=member_phone).first()
-            if not member:
-                member = Member(shop_id=shop.id, name=member_phone, phone=member_phone, points=0)
-                db.session.add(member); db.session.commit()
-            earn = int(order.total_amount // shop.point_rate) if shop.point_rate else 0
-            member.points += earn; db.session.commit()
+            enqueue("member_points", {"shop_id": shop.id, "phone": member_phone, "order_id": order.id}, shop_id=shop.id)
+            db.session.commit()
         if method == "PROMPTPAY":
             return redirect(url_for("pay_order_promptpay", order_id=order.id))
-        _finalize_order(order)
-        flash("รับเงินสดและปิดบิลแล้ว","success")
+        if _finalize_order(order, "CASH"):
+            flash("รับเงินสดและปิดบิลแล้ว","success")
         return redirect(url_for("receipt", order_id=order.id))
     return render_template("close_order.html", order=order, shop=shop)
 
-def _finalize_order(order: Order):
-    for it in order.items:
-        recipes = Recipe.query.filter_by(menu_item_id=it.menu_item_id).all()
-        for r in recipes:
-            inv = Inventory.query.filter_by(shop_id=order.shop_id, ingredient_id=r.ingredient_id).first()
-            if inv:
-                inv.quantity -= (r.quantity * it.quantity)
-    order.status = "PAID"
-    order.closed_at = datetime.utcnow()
+def _finalize_order(order: Order, method: str) -> bool:
+    """Mark an OPEN bill PAID; False (nothing recorded) if it was already closed."""
+    # the cashier only waits for the payment; stock and rollups follow in a job
+    if order.status == "PAID":
+        return False
+    closed = db.session.execute(
+        update(Order).where(Order.id == order.id, Order.status == "OPEN").values(status="PAID", closed_at=datetime.utcnow())
+    ).rowcount
+    if not closed:  # closed meanwhile by another request
+        db.session.rollback()
+        return False
+    db.session.add(Payment(order_id=order.id, method=method, amount=order.total_amount, created_at=order.closed_at))
+    freeze_receipt(order, current_shop())
+    enqueue("order_closed", {"order_id": order.id}, shop_id=order.shop_id)
+    publish(order.shop_id, "order_closed", {"order_id": order.id, "table_id": order.table_id})
     db.session.commit()
+    return True
+
+@job("order_closed")
+def _order_closed_job(payload):
+    order = db.session.get(Order, payload["order_id"])
+    if order is None or order.status != "PAID":
+        return
+    deduct_for_order(order)
+    record_sale(order)
+
+@job("member_points")
+def _member_points_job(payload):
+    shop = db.session.get(Shop, payload["shop_id"])
+    order = db.session.get(Order, payload["order_id"])
+    if shop is None or order is None:
+        return
+    member = Member.query.filter_by(shop_id=shop.id, phone=payload["phone"]).first()
+    if not member:
+        member = Member(shop_id=shop.id, name=payload["phone"], phone=payload["phone"], points=0)
+        db.session.add(member)
+    earn = int(order.total_amount // shop.point_rate) if shop.point_rate else 0
+    member.points = (member.points or 0) + earn
 
 @app.route("/orders/<int:order_id>/pay_promptpay")
 @login_required
 @shop_required
 def pay_order_promptpay(order_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     order = Order.query.get_or_404(order_id)
     if order.shop_id != shop.id:
         flash("ไม่พบออเดอร์ของร้านคุณ","danger"); return redirect(url_for("tables"))
-    receiver = shop.promptpay_id or "0812345678"
-    kind = shop.promptpay_kind or "PHONE"
-    png_b64 = build_promptpay_qr_png(
-        receiver, PromptPayIDType[kind], float(order.total_amount),
-        merchant_name=shop.name, merchant_city="BANGKOK",
-        reference=f"ORDER{order.id}", dynamic=True
-    )
-    return render_template("pay_promptpay.html", order=order, qr_png=b"data:image/png;base64,"+png_b64.encode())
+    qr_url = url_for("order_promptpay_png", order_id=order.id, digest=payload_etag(_order_payload(shop, order)))
+    return render_template("pay_promptpay.html", order=order, qr_url=qr_url)
+
+@app.route("/orders/<int:order_id>/promptpay/<digest>.png")
+@login_required
+@shop_required
+def order_promptpay_png(order_id, digest):
+    shop = current_shop()
+    order = Order.query.get_or_404(order_id)
+    if order.shop_id != shop.id:
+        return "Not found", 404
+    return _qr_png_response(_order_payload(shop, order), digest,
+                            lambda d: url_for("order_promptpay_png", order_id=order.id, digest=d))
 
 @app.route("/orders/<int:order_id>/mark_paid", methods=["POST"])
 @login_required
 @shop_required
 def mark_paid(order_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     order = Order.query.get_or_404(order_id)
     if order.shop_id != shop.id:
         flash("ไม่พบออเดอร์ของร้านคุณ","danger"); return redirect(url_for("tables"))
-    _finalize_order(order)
-    flash("ทำเครื่องหมายชำระเงินแล้ว","success")
+    if _finalize_order(order, "PROMPTPAY"):
+        flash("ทำเครื่องหมายชำระเงินแล้ว","success")
     return redirect(url_for("receipt", order_id=order.id))
 
+@job("archive_orders")
+def _archive_orders_job(payload):
+    batch = payload.get("batch", 500)
+    moved, _ = archive_batch(datetime.utcnow() - timedelta(days=payload["days"]), batch)
+    if moved >= batch:
+        enqueue("archive_orders", payload)  # next chunk in its own transaction
+
+def _receipt_for(shop, order_id):
+    """(order, receipt) of a bill of this shop; order is None once the bill is
+    archived, receipt is None if the shop has no such bill."""
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return None, Receipt.query.filter_by(order_id=order_id, shop_id=shop.id).first()
+    if order.shop_id != shop.id:
+        return None, None
+    return order, get_receipt(order, shop)
+
 @app.route("/receipt/<int:order_id>")
 @login_required
 @shop_required
 def receipt(order_id):
-    order = Order.query.get_or_404(order_id)
-    shop = Shop.query.get(current_user.shop_id)
-    return render_template("receipt.html", order=order, shop=shop)
+    shop = current_shop()
+    order, r = _receipt_for(shop, order_id)
+    if r is None:
+        return "Not found", 404
+    paid = order is None or order.status == "PAID"
+    # a paid receipt never changes; keep pending flash messages from being swallowed by a 304
+    if paid and "_flashes" not in session:
+        resp = Response(mimetype="text/html")
+        resp.set_etag(r.etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        if request.if_none_match.contains(r.etag):
+            resp.status_code = 304
+            return resp
+        resp.set_data(render_template("receipt.html", receipt=r))
+        return resp
+    return render_template("receipt.html", receipt=r)
+
+@app.route("/receipt/<int:order_id>.escpos")
+@login_required
+@shop_required
+def receipt_escpos(order_id):
+    """Raw ESC/POS print job (?width=32 for 58 mm paper, 48 for 80 mm)."""
+    shop = current_shop()
+    order, r = _receipt_for(shop, order_id)
+    if r is None:
+        return "Not found", 404
+    width = min(max(request.args.get("width", app.config["ESCPOS_COLUMNS"], type=int), 24), 64)
+    code_page = app.config["ESCPOS_CODE_PAGE"]
+    headers = {"Content-Disposition": f'attachment; filename="receipt-{r.order_id}.bin"'}
+    if order is not None and order.status != "PAID":
+        data = escpos_bytes(r, width, code_page, _order_payload(shop, order))
+        return Response(data, mimetype="application/octet-stream", headers={**headers, "Cache-Control": "no-store"})
+    etag = f"{r.etag}-{width}-{code_page}"
+    resp = Response(mimetype="application/octet-stream", headers={**headers, "Cache-Control": "private, no-cache"})
+    resp.set_etag(etag)
+    if request.if_none_match.contains(etag):
+        resp.status_code = 304
+        return resp
+    resp.set_data(escpos_bytes(r, width, code_page))
+    return resp
 
 # Inventory & Recipes
 @app.route("/inventory", methods=["GET","POST"])
 @login_required
 @shop_required
 def inventory():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     if request.method == "POST":
         name = request.form["name"]; qty = float(request.form["quantity"]); unit = request.form["unit"]
         ing = Ingredient(shop_id=shop.id, name=name, unit=unit)
         db.session.add(ing); db.session.commit()
-        db.session.add(Inventory(shop_id=shop.id, ingredient_id=ing.id, quantity=qty)); db.session.commit()
+        db.session.add(Inventory(shop_id=shop.id, ingredient_id=ing.id, quantity=0.0)); db.session.flush()
+        apply_movements(shop.id, {ing.id: qty}, "OPENING")
+        db.session.commit()
         return redirect(url_for("inventory"))
-    invs = db.session.query(Inventory, Ingredient).join(Ingredient, Inventory.ingredient_id==Ingredient.id).filter(Inventory.shop_id==shop.id).all()
-    return render_template("inventory.html", invs=invs)
+    q, after, limit = page_args(request.args)
+    page = stock_page(shop.id, q, after, limit)
+    return render_template("inventory.html", invs=page.rows, q=q, next_cursor=page.next_cursor)
 
 @app.route("/recipes/<int:menu_id>", methods=["GET","POST"])
 @login_required
 @shop_required
 def recipes(menu_id):
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     item = MenuItem.query.get_or_404(menu_id)
     if item.shop_id != shop.id: 
         flash("ไม่พบเมนูของร้านคุณ","danger"); return redirect(url_for("menu"))
@@ -435,99 +662,336 @@ def recipes(menu_id):
 @login_required
 @shop_required
 def members():
-    shop = Shop.query.get(current_user.shop_id)
+    shop = current_shop()
     if request.method == "POST":
         name = request.form["name"]; phone = request.form["phone"]
         db.session.add(Member(shop_id=shop.id, name=name, phone=phone, points=0)); db.session.commit()
         return redirect(url_for("members"))
-    ms = Member.query.filter_by(shop_id=shop.id).all()
-    return render_template("members.html", members=ms)
+    q, after, limit = page_args(request.args)
+    page = members_page(shop.id, q, after, limit)
+    return render_template("members.html", members=page.rows, q=q, next_cursor=page.next_cursor)
+
+# Paid order history
+@app.route("/orders/history")
+@login_required
+@shop_required
+def orders_history():
+    start = _parse_date(request.args.get("start"), None)
+    end = _parse_date(request.args.get("end"), None)
+    _, after, limit = page_args(request.args)
+    page = paid_orders_page(current_shop().id, start, end, after, limit, session=read_session())
+    return render_template("orders_history.html", orders=page.rows, start=start, end=end, next_cursor=page.next_cursor)
+
+# JSON variants of the paged lists (?q=&after=<cursor>&limit=)
+def _page_json(page, to_dict):
+    return jsonify(items=[to_dict(r) for r in page.rows], next=page.next_cursor)
+
+@app.route("/api/members")
+@login_required
+@shop_required
+def api_members():
+    return _page_json(members_page(current_shop().id, *page_args(request.args)), member_to_dict)
+
+@app.route("/api/menu")
+@login_required
+@shop_required
+def api_menu():
+    return _page_json(menu_page(current_shop().id, *page_args(request.args)), menu_item_to_dict)
+
+@app.route("/api/inventory")
+@login_required
+@shop_required
+def api_inventory():
+    return _page_json(stock_page(current_shop().id, *page_args(request.args)), stock_to_dict)
+
+@app.route("/api/categories")
+@login_required
+@shop_required
+def api_categories():
+    return _page_json(categories_page(current_shop().id, *page_args(request.args)), category_to_dict)
+
+@app.route("/api/orders/history")
+@login_required
+@shop_required
+def api_orders_history():
+    start = _parse_date(request.args.get("start"), None)
+    end = _parse_date(request.args.get("end"), None)
+    _, after, limit = page_args(request.args)
+    page = paid_orders_page(current_shop().id, start, end, after, limit, session=read_session())
+    return _page_json(page, paid_order_to_dict)
 
 # Reports
 @app.route("/reports")
 @login_required
 @shop_required
 def reports():
-    shop = Shop.query.get(current_user.shop_id)
-    orders = Order.query.filter_by(shop_id=shop.id, status="PAID").all()
-    total = sum([o.total_amount for o in orders])
+    shop = current_shop()
+    today = datetime.utcnow().date()
+    reader = read_session()
+    sales = sales_summary(shop.id, today, session=reader)
+    hourly = hourly_sales(shop.id, today, session=reader)
+    start = _parse_date(request.args.get("start"), today - timedelta(days=30))
+    end = _parse_date(request.args.get("end"), today)
+    by = request.args.get("by", "quantity")
+    if by not in TOP_ITEM_METRICS:
+        by = "quantity"
+    top = top_selling_items(shop.id, start, end, by=by, limit=20, session=reader)
+    return render_template("reports.html", total=sales["total"], daily=sales["day"], weekly=sales["week"], monthly=sales["month"], hourly=hourly,
+                           top=top, start=start, end=end, by=by)
+
+# Exports
+@app.route("/exports/<kind>.<fmt>")
+@login_required
+@shop_required
+def export_data(kind, fmt):
+    if kind not in EXPORTS or fmt not in FORMATS:
+        return "Unknown export", 404
     today = datetime.utcnow().date()
-    daily = sum([o.total_amount for o in orders if o.closed_at and o.closed_at.date()==today])
-    weekly = sum([o.total_amount for o in orders if o.closed_at and (today - o.closed_at.date()).days <= 7])
-    monthly = sum([o.total_amount for o in orders if o.closed_at and o.closed_at.date().month==today.month and o.closed_at.date().year==today.year])
-    return render_template("reports.html", total=total, daily=daily, weekly=weekly, monthly=monthly)
+    start = _parse_date(request.args.get("start"), today - timedelta(days=30))
+    end = _parse_date(request.args.get("end"), today)
+    gz = request.args.get("gzip") == "1"
+    body = stream_export(read_session(), kind, fmt, current_shop().id,
+                         datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time()), gz)
+    filename = f"{kind}_{start}_{end}.{fmt}" + (".gz" if gz else "")
+    resp = Response(stream_with_context(body), mimetype="application/gzip" if gz else FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+def _parse_date(value, default):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else default
+    except ValueError:
+        return default
 
 # Public ordering
 @app.route("/p/<token>", methods=["GET","POST"])
 def public_order(token):
-    table = Table.query.filter_by(token=token).first()
+    table = resolve_table_token(token)
     if not table:
         return "Invalid table token", 404
-    shop = Shop.query.get(table.shop_id)
-    cart_key = f"cart_{token}"
-    cart = session.get(cart_key, {})
+    cart_id = request.cookies.get(CART_COOKIE)
+    key = store_cart_key(cart_id, table.id)
     if request.method == "POST":
         item_id = int(request.form["item_id"]); qty = int(request.form.get("qty", 1))
-        cart[str(item_id)] = cart.get(str(item_id), 0) + qty
-        session[cart_key] = cart
-        session.modified = True
+        if key is None:
+            cart_id = new_cart_id()
+            key = store_cart_key(cart_id, table.id)
+        cart_store().add(key, item_id, qty)
         flash("เพิ่มรายการแล้ว", "success")
-        return redirect(url_for("public_order", token=token))
-    categories = Category.query.filter_by(shop_id=shop.id).all()
-    items = MenuItem.query.filter_by(shop_id=shop.id).all()
-    items_by_cat = {}
-    for c in categories:
-        items_by_cat[c.id] = []
-    for it in items:
-        items_by_cat.setdefault(it.category_id, []).append(it)
-    cart_items, total = [], 0.0
-    for k,v in cart.items():
-        it = MenuItem.query.get(int(k))
-        if not it: continue
-        cart_items.append({"name":it.name, "qty":v, "subtotal":it.price*v, "price":it.price, "id":it.id})
-        total += it.price * v
-    return render_template("public_order.html", shop=shop, table=table, categories=categories, items_by_cat=items_by_cat, cart_items=cart_items, total=total)
+        resp = redirect(url_for("public_order", token=token))
+        resp.set_cookie(CART_COOKIE, cart_id, max_age=int(app.config["CART_TTL_SECONDS"]), path="/p/",
+                        httponly=True, samesite="Lax", secure=request.is_secure)
+        return resp
+    cart = cart_store().get(key) if key else {}
+    menu = get_menu(table.shop_id)
+    etag = None
+    if not session.get("_flashes"):
+        # the page only depends on the menu and this table's cart
+        cart_sig = ",".join(f"{k}:{v}" for k, v in sorted(cart.items()))
+        etag = f"{menu.etag}-{hashlib.sha1(f'{table.id}|{cart_sig}'.encode()).hexdigest()[:12]}"
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+    priced = price_cart(table.shop_id, cart, menu=menu)
+    resp = make_response(render_template("public_order.html", menu=menu, table=table, categories=menu.categories, items_by_cat=menu.items_by_cat, cart_items=priced.lines, total=priced.total))
+    if etag:
+        resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 @app.route("/p/<token>/remove/<int:item_id>")
 def public_remove(token, item_id):
-    cart_key = f"cart_{token}"
-    cart = session.get(cart_key, {})
-    if str(item_id) in cart:
-        cart.pop(str(item_id))
-        session[cart_key] = cart
-        session.modified = True
+    table = resolve_table_token(token)
+    key = store_cart_key(request.cookies.get(CART_COOKIE), table.id) if table else None
+    if key:
+        cart_store().remove(key, item_id)
     return redirect(url_for("public_order", token=token))
 
 @app.route("/p/<token>/checkout", methods=["POST"])
 def public_checkout(token):
-    table = Table.query.filter_by(token=token).first()
-    if not table:
+    ref = resolve_table_token(token)
+    if not ref:
         return "Invalid table token", 404
-    shop = Shop.query.get(table.shop_id)
-    cart_key = f"cart_{token}"
-    cart = session.get(cart_key, {})
-    if not cart:
+    key = store_cart_key(request.cookies.get(CART_COOKIE), ref.id)
+    priced = price_cart(ref.shop_id, cart_store().get(key) if key else {})
+    if not priced:
         flash("ตะกร้าว่างเปล่า", "warning")
         return redirect(url_for("public_order", token=token))
-    order = Order.query.filter_by(shop_id=shop.id, table_id=table.id, status="OPEN").first()
-    if not order:
-        order = Order(shop_id=shop.id, table_id=table.id, status="OPEN", created_at=datetime.utcnow(), total_amount=0.0)
-        db.session.add(order); db.session.commit()
-        table.status = "BUSY"; db.session.commit()
-    for k,qty in cart.items():
-        it = MenuItem.query.get(int(k))
-        if not it: continue
-        db.session.add(OrderItem(order_id=order.id, menu_item_id=it.id, quantity=int(qty), unit_price=it.price))
+    add_to_table(ref.shop_id, ref.id, priced.lines)
     db.session.commit()
-    order.total_amount = sum([it.quantity*it.unit_price for it in order.items]); db.session.commit()
-    session.pop(cart_key, None)
+    cart_store().clear(key)
     flash("ส่งออเดอร์เข้าครัวแล้ว! แจ้งพนักงานเมื่อพร้อมชำระเงิน", "success")
     return redirect(url_for("public_order", token=token))
 
+# Metrics
+@app.route("/metrics")
+def metrics_endpoint():
+    token = app.config["METRICS_TOKEN"]
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return "Forbidden", 403
+    return metrics.metrics_response()
+
+@app.route("/p/<token>/submit", methods=["POST"])
+def public_submit(token):
+    """JSON checkout for the client-side cart: {"key": ..., "lines": [{item_id, qty, note}]}.
+    Safe to retry with the same key."""
+    ref = resolve_table_token(token)
+    if not ref:
+        return jsonify(error="invalid table token"), 404
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not SUBMISSION_KEY_RE.match(str(body.get("key", ""))):
+        return jsonify(error="expected a JSON object with a submission key"), 400
+    try:
+        lines = resolve_lines(ref.shop_id, body.get("lines"))
+    except LineError as e:
+        return jsonify(error="invalid lines", details=e.errors), 400
+    sub, duplicate = submit_once(ref.shop_id, ref.id, body["key"], lines)
+    return jsonify(order_id=sub.order_id, lines=sub.line_count, amount=sub.amount, duplicate=duplicate)
+
+@app.route("/p/sw.js")
+def public_service_worker():
+    # served under /p/ so its scope covers the self-order pages only
+    resp = send_from_directory(app.static_folder, "sw.js", mimetype="text/javascript", max_age=0)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
 # Static uploads
 @app.route("/static/uploads/<path:filename>")
 def uploaded_file(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    variant = parse_variant(filename)
+    if variant and not os.path.exists(os.path.join(UPLOAD_FOLDER, filename)):
+        # background pool hasn't produced it yet
+        render_variant(UPLOAD_FOLDER, *variant)
+    resp = send_from_directory(UPLOAD_FOLDER, filename)
+    if variant:
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+app.add_template_global(image_sources)
+
+# CLI
+@app.cli.command("rollups-backfill")
+@click.option("--shop-id", type=int, default=None, help="Only rebuild this shop (default: all shops)")
+def rollups_backfill(shop_id):
+    """Rebuild daily/hourly sales rollups from Order history."""
+    n = rebuild_rollups(shop_id)
+    click.echo(f"rebuilt sales rollups from {n} paid orders")
+
+@app.cli.command("rollups-check")
+@click.option("--shop-id", type=int, default=None, help="Only check this shop (default: all shops)")
+@click.option("--days", type=int, default=30, show_default=True, help="Window ending today")
+@click.option("--limit", type=int, default=20, show_default=True)
+def rollups_check(shop_id, days, limit):
+    """Compare the per-item sales counters with the raw order lines (exit 1 on drift)."""
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+    shop_ids = [shop_id] if shop_id is not None else [sid for (sid,) in db.session.query(Shop.id).order_by(Shop.id)]
+    drift = 0
+    for sid in shop_ids:
+        for by in TOP_ITEM_METRICS:
+            counters = top_selling_items(sid, start, end, by, limit)
+            raw = top_items_from_orders(sid, start, end, by, limit)
+            if [(n, q, round(r, 2)) for n, q, r in counters] != [(n, q, round(r, 2)) for n, q, r in raw]:
+                drift += 1
+                click.echo(f"shop={sid} by={by}: counters={counters} orders={raw}")
+    if drift:
+        # counters trail bills whose order_closed job hasn't run yet; `rollups-backfill` rebuilds them
+        raise click.ClickException(f"{drift} mismatching top-item lists")
+    click.echo(f"top items match the order lines for {len(shop_ids)} shop(s), {start} .. {end}")
+
+@app.cli.command("stock-audit")
+@click.option("--shop-id", type=int, default=None)
+@click.option("--rebuild", is_flag=True, help="Reset inventory to the ledger balance")
+@click.option("--adopt", is_flag=True, help="Write ADJUST movements so the ledger matches inventory")
+def stock_audit(shop_id, rebuild, adopt):
+    """Compare inventory levels with the stock movement ledger."""
+    for sid, ing_id, qty, balance in stock_drift(shop_id):
+        click.echo(f"shop={sid} ingredient={ing_id} on_hand={qty} ledger={balance}")
+    if rebuild:
+        click.echo(f"rebuilt {rebuild_stock(shop_id)} inventory rows from the ledger")
+    elif adopt:
+        click.echo(f"adopted {adopt_stock(shop_id)} inventory rows into the ledger")
+
+@app.cli.command("submissions-prune")
+@click.option("--days", type=int, default=7, show_default=True)
+def submissions_prune(days):
+    """Forget self-order submission keys older than --days."""
+    click.echo(f"deleted {prune_submissions(timedelta(days=days))} submission keys")
+
+@app.cli.command("tables-qr-sheet")
+@click.option("--shop-id", type=int, required=True)
+@click.option("--base-url", required=True, help="Public URL of the app, e.g. https://pos.example.com")
+@click.option("--out", type=click.Path(dir_okay=False), required=True, help="Output .pdf (all pages) or .png (first page)")
+def tables_qr_sheet_cli(shop_id, base_url, out):
+    """Give every table of a shop a QR token and write a printable QR sheet."""
+    shop = db.session.get(Shop, shop_id)
+    if shop is None:
+        raise click.ClickException(f"no shop {shop_id}")
+    fmt = "png" if out.lower().endswith(".png") else "pdf"
+    with app.test_request_context(base_url=base_url):
+        cards = _qr_sheet_cards(shop)
+        data = _render_qr_sheet(shop, cards, fmt, 1 if fmt == "png" else None)
+    with open(out, "wb") as f:
+        f.write(data)
+    click.echo(f"wrote {out} ({page_count(len(cards))} page(s), {len(data)} bytes)")
+
+@app.cli.command("jobs-worker")
+@click.option("--once", is_flag=True, help="Exit when the queue is empty")
+@click.option("--batch", type=int, default=20, show_default=True)
+def jobs_worker(once, batch):
+    """Run queued background jobs (bill side effects, points)."""
+    run_worker(app, app.config["JOB_POLL_SECONDS"], batch, once=once)
+
+@app.cli.command("jobs-status")
+@click.option("--prune-days", type=int, default=None, help="Also delete DONE jobs older than this")
+def jobs_status(prune_days):
+    """Show queued/running/failed job counts."""
+    for name, status, count, oldest in queue_stats():
+        click.echo(f"{name:<16} {status:<8} {count:>6}  oldest={oldest:%Y-%m-%d %H:%M:%S}")
+    if prune_days is not None:
+        click.echo(f"deleted {prune_jobs(timedelta(days=prune_days))} finished jobs")
+
+@app.cli.command("orders-archive")
+@click.option("--days", type=int, default=None, help="Archive bills paid more than this many days ago (default ARCHIVE_AFTER_DAYS)")
+@click.option("--batch", type=int, default=500, show_default=True)
+@click.option("--background", is_flag=True, help="Queue an archive job instead of running here")
+def orders_archive(days, batch, background):
+    """Move old PAID bills and their lines to the monthly archive tables."""
+    days = app.config["ARCHIVE_AFTER_DAYS"] if days is None else days
+    if background:
+        enqueue("archive_orders", {"days": days, "batch": batch})
+        db.session.commit()
+        click.echo(f"queued archiving of bills older than {days} days")
+        return
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    total = lines = 0
+    while True:
+        moved, n = archive_batch(cutoff, batch)
+        db.session.commit()
+        total, lines = total + moved, lines + n
+        if moved < batch:
+            break
+    click.echo(f"archived {total} bills ({lines} lines) paid before {cutoff:%Y-%m-%d}")
+    for month, orders, n in archive_stats():
+        click.echo(f"{month:%Y-%m}  {orders:>8} bills  {n:>9} lines")
+
+@app.cli.command("db-upgrade")
+@click.option("--to", "target", type=int, default=None, help="Stop at this schema version")
+def db_upgrade(target):
+    """Apply pending schema migrations."""
+    applied = migrations.upgrade(db.engine, target, log=click.echo)
+    click.echo(f"schema at version {migrations.current_version(db.engine)}" + ("" if applied else " (nothing to do)"))
+
+@app.cli.command("db-version")
+def db_version():
+    """Show the schema version and pending migrations."""
+    click.echo(f"schema at version {migrations.current_version(db.engine)}")
+    for version, name in migrations.pending(db.engine):
+        click.echo(f"pending {version:04d} {name}")
 
 if __name__ == "__main__":
+    with app.app_context():
+        migrations.upgrade(db.engine, log=app.logger.info)
     app.run(debug=True)
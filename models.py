@@ -11,6 +11,8 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"))
 
+    shop = db.relationship("Shop", foreign_keys=[shop_id])
+
 class Shop(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -25,6 +27,8 @@ class Category(db.Model):
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
     name = db.Column(db.String(120), nullable=False)
 
+    __table_args__ = (db.Index("ix_category_shop", "shop_id"),)
+
 class MenuItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
@@ -33,6 +37,15 @@ class MenuItem(db.Model):
     price = db.Column(db.Float, nullable=False)
     image_url = db.Column(db.String(255))
 
+    __table_args__ = (
+        db.Index("ix_menu_item_shop", "shop_id", "category_id"),
+        # name lists and prefix search: pattern ops so Postgres LIKE 'x%' can use it,
+        # plus a default-opclass copy for the ORDER BY name, id keyset under a non-C
+        # collation (elsewhere the first index already sorts, ending in the row id)
+        db.Index("ix_menu_item_shop_name", "shop_id", "name", postgresql_ops={"name": "varchar_pattern_ops"}),
+        db.Index("ix_menu_item_shop_name_id", "shop_id", "name", "id").ddl_if(dialect="postgresql"),
+    )
+
 class Table(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
@@ -40,6 +53,8 @@ class Table(db.Model):
     status = db.Column(db.String(20), default="FREE")  # FREE/BUSY
     token = db.Column(db.String(32), unique=True)  # for public QR access
 
+    __table_args__ = (db.Index("ix_table_shop", "shop_id"),)
+
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
@@ -51,33 +66,56 @@ class Order(db.Model):
 
     items = db.relationship("OrderItem", backref="order", lazy=True)
 
+    __table_args__ = (
+        # at most one OPEN bill per table; MySQL has no partial indexes and gets
+        # a unique index on a generated column instead (migrations.m0003)
+        db.Index("uq_order_open_table", "table_id", unique=True,
+                 sqlite_where=db.text("status = 'OPEN'"), postgresql_where=db.text("status = 'OPEN'"))
+        .ddl_if(dialect=("sqlite", "postgresql")),
+        db.Index("ix_order_shop_status_closed", "shop_id", "status", "closed_at"),
+        db.Index("ix_order_shop_table_status", "shop_id", "table_id", "status"),
+    )
+
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=False)
     menu_item_id = db.Column(db.Integer, db.ForeignKey("menu_item.id"), nullable=False)
     quantity = db.Column(db.Integer, default=1)
     unit_price = db.Column(db.Float, nullable=False)
+    note = db.Column(db.String(200))  # e.g. "no chili"
 
     menu_item = db.relationship("MenuItem", foreign_keys=[menu_item_id])
 
+    __table_args__ = (db.Index("ix_order_item_order", "order_id"),)
+
 class Ingredient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
     name = db.Column(db.String(120), nullable=False)
     unit = db.Column(db.String(50), nullable=False)  # e.g., g, ml, piece
 
+    __table_args__ = (
+        db.Index("ix_ingredient_shop", "shop_id"),
+        db.Index("ix_ingredient_shop_name", "shop_id", "name", postgresql_ops={"name": "varchar_pattern_ops"}),
+        db.Index("ix_ingredient_shop_name_id", "shop_id", "name", "id").ddl_if(dialect="postgresql"),
+    )
+
 class Recipe(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     menu_item_id = db.Column(db.Integer, db.ForeignKey("menu_item.id"), nullable=False)
     ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredient.id"), nullable=False)
     quantity = db.Column(db.Float, nullable=False)  # quantity per 1 menu item
 
+    __table_args__ = (db.Index("ix_recipe_menu_item", "menu_item_id"),)
+
 class Inventory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
     ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredient.id"), nullable=False)
     quantity = db.Column(db.Float, default=0.0)
 
+    __table_args__ = (db.Index("ix_inventory_shop_ingredient", "shop_id", "ingredient_id"),)
+
 class Member(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
@@ -85,13 +123,21 @@ class Member(db.Model):
     phone = db.Column(db.String(20), unique=False)
     points = db.Column(db.Integer, default=0)
 
+    __table_args__ = (
+        db.Index("ix_member_shop_phone", "shop_id", "phone"),
+        db.Index("ix_member_shop_name", "shop_id", "name", postgresql_ops={"name": "varchar_pattern_ops"}),
+        db.Index("ix_member_shop_name_id", "shop_id", "name", "id").ddl_if(dialect="postgresql"),
+    )
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey("order.id"))
+    order_id = db.Column(db.Integer)  # no FK: old bills move to the order archive
     method = db.Column(db.String(20))  # CASH, PROMPTPAY
     amount = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index("ix_payment_order", "order_id"),)
+
 class Subscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
@@ -100,3 +146,125 @@ class Subscription(db.Model):
     days = db.Column(db.Integer)
     status = db.Column(db.String(20), default="PENDING")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SalesDaily(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    total_amount = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint("shop_id", "day"),)
+
+class SalesHourly(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)  # 0-23 (UTC, same as Order.closed_at)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    total_amount = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint("shop_id", "day", "hour"),)
+
+class KitchenEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False, index=True)
+    type = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class StockMovement(db.Model):
+    # append-only ledger; Inventory.quantity == sum(delta) per (shop, ingredient)
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredient.id"), nullable=False)
+    order_id = db.Column(db.Integer)  # may be archived (utils/archive.py)
+    delta = db.Column(db.Float, nullable=False)  # negative = consumed
+    reason = db.Column(db.String(20), nullable=False)  # OPENING/SALE/ADJUST
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_stock_movement_shop_ingredient", "shop_id", "ingredient_id"),
+        db.Index("ix_stock_movement_shop_created", "shop_id", "created_at"),  # date-range exports
+    )
+
+class ItemSalesDaily(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey("menu_item.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint("shop_id", "day", "menu_item_id"),)
+
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(120), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class OrderSubmission(db.Model):
+    # one row per self-order checkout; a retried submit with the same key
+    # returns this row instead of adding the lines again
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
+    table_id = db.Column(db.Integer, db.ForeignKey("table.id"), nullable=False)
+    key = db.Column(db.String(64), nullable=False)  # generated by the client
+    order_id = db.Column(db.Integer)  # may be archived
+    line_count = db.Column(db.Integer, default=0, nullable=False)
+    amount = db.Column(db.Float, default=0.0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (db.UniqueConstraint("shop_id", "key", name="uq_order_submission_key"),)
+
+class Job(db.Model):
+    # deferred side effects (utils/jobs.py); rows are written in the same
+    # transaction as the change that needs them
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"))
+    name = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")  # JSON
+    status = db.Column(db.String(10), nullable=False, default="QUEUED")  # QUEUED/RUNNING/DONE/FAILED
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index("ix_job_status_run_at", "status", "run_at"),)
+
+class Receipt(db.Model):
+    # frozen copy of a PAID bill (utils/receipts.py): later menu renames and
+    # price changes don't touch it
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, unique=True)  # outlives the order row once archived
+    shop_id = db.Column(db.Integer, db.ForeignKey("shop.id"), nullable=False)
+    shop_name = db.Column(db.String(120))
+    closed_at = db.Column(db.DateTime)
+    total_amount = db.Column(db.Float, default=0.0, nullable=False)
+    lines = db.Column(db.Text, nullable=False, default="[]")  # JSON [{name, qty, unit_price, amount, note}]
+    html = db.Column(db.Text)  # rendered _receipt_body.html
+    etag = db.Column(db.String(40))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Cart(db.Model):
+    # server-side self-order carts (utils/cart_store.py, CART_STORE=database);
+    # the browser only holds the opaque key
+    key = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class CartItem(db.Model):
+    cart_key = db.Column(db.String(64), db.ForeignKey("cart.key"), primary_key=True)
+    menu_item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    qty = db.Column(db.Integer, nullable=False, default=0)
+
+class OrderArchiveMonth(db.Model):
+    # months whose PAID bills were moved to order_archive_YYYY_MM /
+    # order_item_archive_YYYY_MM (utils/archive.py)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    orders = db.Column(db.Integer, default=0, nullable=False)
+    lines = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
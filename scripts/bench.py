@@ -0,0 +1,387 @@
+"""
+Dinner-rush benchmark: seed a database with realistic shops and history,
+then drive the app in-process (Flask test client) with a mixed workload
+and report throughput, p50/p95/p99 latency and SQL queries per endpoint.
+
+    python scripts/bench.py seed --db sqlite:////tmp/bench.db --shops 5
+    python scripts/bench.py run --db sqlite:////tmp/bench.db --requests 3000 --save bench-baseline.json
+    python scripts/bench.py run --db sqlite:////tmp/bench.db --compare bench-baseline.json
+
+`run --compare` exits with status 1 when an endpoint regressed against the
+baseline (slower p95 beyond the tolerance, more SQL queries, or errors).
+Compare runs against the same seed sizes and database backend.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+PASSWORD = "bench"
+
+# endpoint -> weight in the mixed workload (roughly a busy dinner hour:
+# mostly guests browsing the QR menu, staff adding/closing bills, a
+# kitchen screen refreshing, owners glancing at the numbers)
+WORKLOAD = {
+    "qr_menu": 40,
+    "qr_add": 15,
+    "qr_checkout": 8,
+    "new_order": 10,
+    "kitchen": 15,
+    "close_order": 6,
+    "dashboard": 4,
+    "reports": 2,
+}
+
+
+def _load_app(db_url: str):
+    os.environ["DATABASE_URL"] = db_url
+    from app import app
+    app.config["TESTING"] = True
+    return app
+
+
+# ---- seed ----
+
+def seed(args):
+    app = _load_app(args.db)
+    from sqlalchemy import insert, update
+    from werkzeug.security import generate_password_hash
+    from models import (db, Category, Ingredient, Inventory, Member, MenuItem, Order, OrderItem, Recipe, Shop,
+                        Table, User)
+    from utils import migrations
+    from utils.inventory import adopt_stock
+    from utils.rollups import rebuild_rollups
+
+    rnd = random.Random(args.seed)
+    pw_hash = generate_password_hash(PASSWORD)
+    started = time.perf_counter()
+    with app.app_context():
+        migrations.upgrade(db.engine, log=lambda *_: None)  # the app no longer migrates on import
+        if db.session.query(Shop.id).first() is not None:
+            if not args.reset:
+                sys.exit("database already has shops; pass --reset to wipe it")
+            db.session.remove()
+            db.drop_all()
+            migrations.upgrade(db.engine, log=lambda *_: None)
+
+        now = datetime.utcnow()
+        for n in range(args.shops):
+            user = User(email=f"shop{n}@bench.local", password_hash=pw_hash)
+            db.session.add(user)
+            db.session.flush()
+            shop = Shop(name=f"Bench Shop {n}", owner_user_id=user.id, promptpay_id="0812345678",
+                        promptpay_kind="PHONE", point_rate=100.0, plan_expiry=(now + timedelta(days=365)).date())
+            db.session.add(shop)
+            db.session.flush()
+            user.shop_id = shop.id
+
+            cats = [Category(shop_id=shop.id, name=f"Category {c}") for c in range(args.categories)]
+            db.session.add_all(cats)
+            db.session.flush()
+            items = [MenuItem(shop_id=shop.id, category_id=cats[i % len(cats)].id, name=f"Dish {i}",
+                              price=float(rnd.randrange(40, 400, 5))) for i in range(args.items)]
+            ingredients = [Ingredient(shop_id=shop.id, name=f"Ingredient {i}", unit="g") for i in range(args.ingredients)]
+            db.session.add_all(items + ingredients)
+            db.session.flush()
+            db.session.execute(insert(Recipe), [
+                {"menu_item_id": it.id, "ingredient_id": ing.id, "quantity": float(rnd.randint(5, 150))}
+                for it in items for ing in rnd.sample(ingredients, min(3, len(ingredients)))
+            ])
+            db.session.execute(insert(Inventory), [
+                {"shop_id": shop.id, "ingredient_id": ing.id, "quantity": 1e9} for ing in ingredients
+            ])
+            db.session.execute(insert(Table), [
+                {"shop_id": shop.id, "name": f"T{t + 1}", "status": "FREE", "token": f"bench{shop.id}x{t}"}
+                for t in range(args.tables)
+            ])
+            table_ids = [tid for (tid,) in db.session.query(Table.id).filter_by(shop_id=shop.id)]
+            db.session.execute(insert(Member), [
+                {"shop_id": shop.id, "name": f"Member {m}", "phone": f"08{shop.id:02d}{m:06d}", "points": rnd.randint(0, 500)}
+                for m in range(args.members)
+            ])
+
+            # paid history, busiest around lunch and dinner
+            hours = list(range(10, 23))
+            hour_weights = [2, 6, 9, 6, 3, 2, 3, 6, 10, 10, 7, 4, 2]
+            for day in range(args.days, 0, -1):
+                base = (now - timedelta(days=day)).replace(hour=0, minute=0, second=0, microsecond=0)
+                orders = []
+                for _ in range(args.orders_per_day):
+                    opened = base + timedelta(hours=rnd.choices(hours, hour_weights)[0], minutes=rnd.randint(0, 59))
+                    orders.append({"shop_id": shop.id, "table_id": rnd.choice(table_ids), "status": "PAID",
+                                   "created_at": opened, "closed_at": opened + timedelta(minutes=rnd.randint(20, 90)),
+                                   "total_amount": 0.0})
+                ids = db.session.execute(insert(Order).returning(Order.id, sort_by_parameter_order=True), orders).scalars().all()
+                lines, totals = [], []
+                for oid in ids:
+                    total = 0.0
+                    for it in rnd.sample(items, rnd.randint(1, 6)):
+                        qty = rnd.choice((1, 1, 1, 2, 2, 3))
+                        lines.append({"order_id": oid, "menu_item_id": it.id, "quantity": qty, "unit_price": it.price})
+                        total += qty * it.price
+                    totals.append({"id": oid, "total_amount": total})
+                db.session.execute(insert(OrderItem), lines)
+                db.session.execute(update(Order), totals)
+            db.session.commit()
+            adopt_stock(shop.id)
+            print(f"seeded shop {shop.id}: {args.items} items, {args.tables} tables, "
+                  f"{args.members} members, {args.days * args.orders_per_day} paid orders")
+        scanned = rebuild_rollups()
+        print(f"rollups rebuilt from {scanned} orders in {time.perf_counter() - started:.1f}s")
+
+
+# ---- run ----
+
+class QueryCounter:
+    """Counts SQL statements executed by the current thread."""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        from sqlalchemy import event
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self._local.n = getattr(self._local, "n", 0) + 1
+
+    def reset(self):
+        self._local.n = 0
+
+    @property
+    def count(self) -> int:
+        return getattr(self._local, "n", 0)
+
+
+class Worker:
+    def __init__(self, app, shops: list, rnd: random.Random):
+        self.app, self.shops, self.rnd = app, shops, rnd
+        self.staff = {}
+        for s in shops:
+            c = app.test_client()
+            r = c.post("/login", data={"email": s["email"], "password": PASSWORD})
+            if r.status_code != 302:
+                raise RuntimeError(f"login failed for {s['email']}")
+            self.staff[s["id"]] = c
+        self.guest = app.test_client()
+
+    def open_order_id(self, shop_id: int):
+        from models import db, Order
+        with self.app.app_context():
+            row = (db.session.query(Order.id).filter_by(shop_id=shop_id, status="OPEN")
+                   .order_by(Order.id).limit(20).all())
+            db.session.remove()
+        return self.rnd.choice(row)[0] if row else None
+
+    def request(self, op: str):
+        """(method, client, url, data, expected statuses) for one operation."""
+        shop = self.rnd.choice(self.shops)
+        staff, rnd = self.staff[shop["id"]], self.rnd
+        token = rnd.choice(shop["tokens"])
+        if op == "qr_menu":
+            return self.guest.get, f"/p/{token}", None, (200, 304)
+        if op == "qr_add":
+            return self.guest.post, f"/p/{token}", {"item_id": rnd.choice(shop["items"]), "qty": rnd.randint(1, 3)}, (302,)
+        if op == "qr_checkout":
+            self.guest.post(f"/p/{token}", data={"item_id": rnd.choice(shop["items"]), "qty": 1})
+            return self.guest.post, f"/p/{token}/checkout", None, (302,)
+        if op == "new_order":
+            return staff.post, f"/orders/new/{rnd.choice(shop['tables'])}", {
+                "item_id": rnd.choice(shop["items"]), "qty": rnd.randint(1, 3), "note": ""}, (302,)
+        if op == "kitchen":
+            return staff.get, "/kitchen", None, (200,)
+        if op == "close_order":
+            order_id = self.open_order_id(shop["id"])
+            if order_id is None:
+                return None
+            phone = rnd.choice(shop["phones"]) if rnd.random() < 0.3 else ""
+            return staff.post, f"/orders/{order_id}/close", {"method": "CASH", "member_phone": phone}, (302,)
+        if op == "dashboard":
+            return staff.get, "/dashboard", None, (200,)
+        if op == "reports":
+            return staff.get, "/reports", None, (200,)
+        raise ValueError(op)
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def run(args):
+    app = _load_app(args.db)
+    from models import db, Member, MenuItem, Shop, Table, User
+
+    with app.app_context():
+        shops = []
+        for shop_id, email in db.session.query(Shop.id, User.email).join(User, User.id == Shop.owner_user_id).order_by(Shop.id):
+            if not email.endswith("@bench.local"):
+                continue
+            shops.append({
+                "id": shop_id, "email": email,
+                "items": [i for (i,) in db.session.query(MenuItem.id).filter_by(shop_id=shop_id)],
+                "tables": [t for (t,) in db.session.query(Table.id).filter_by(shop_id=shop_id)],
+                "tokens": [t for (t,) in db.session.query(Table.token).filter_by(shop_id=shop_id)],
+                "phones": [p for (p,) in db.session.query(Member.phone).filter_by(shop_id=shop_id).limit(200)],
+            })
+        counter = QueryCounter(db.engine)
+    if not shops:
+        sys.exit("no bench shops found; run `bench.py seed` first")
+
+    ops, weights = list(WORKLOAD), list(WORKLOAD.values())
+    samples = {op: [] for op in ops}  # op -> [(ms, queries)]
+    errors = {op: 0 for op in ops}
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+
+    def drive(n: int, seed: int):
+        rnd = random.Random(seed)
+        worker = Worker(app, shops, rnd)
+        for i in range(n + args.warmup):
+            op = rnd.choices(ops, weights)[0]
+            req = worker.request(op)
+            if req is None:
+                continue
+            call, url, data, expected = req
+            counter.reset()
+            t0 = time.perf_counter()
+            resp = call(url, data=data)
+            ms = (time.perf_counter() - t0) * 1000.0
+            queries = counter.count
+            if i < args.warmup:
+                continue
+            with lock:
+                samples[op].append((ms, queries))
+                if resp.status_code not in expected:
+                    errors[op] += 1
+
+    threads = [threading.Thread(target=drive, args=(per_thread, args.seed + t)) for t in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    endpoints = {}
+    for op in ops:
+        if not samples[op]:
+            continue
+        lat = sorted(ms for ms, _ in samples[op])
+        qs = [q for _, q in samples[op]]
+        endpoints[op] = {
+            "n": len(lat),
+            "rps": round(len(lat) / wall, 1),
+            "p50_ms": round(percentile(lat, 50), 2),
+            "p95_ms": round(percentile(lat, 95), 2),
+            "p99_ms": round(percentile(lat, 99), 2),
+            "sql_avg": round(sum(qs) / len(qs), 2),
+            "sql_max": max(qs),
+            "errors": errors[op],
+        }
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    result = {
+        "meta": {
+            "created": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "dialect": dialect,
+            "shops": len(shops),
+            "threads": args.threads,
+            "requests": sum(e["n"] for e in endpoints.values()),
+            "wall_s": round(wall, 2),
+            "rps": round(sum(e["n"] for e in endpoints.values()) / wall, 1),
+        },
+        "endpoints": endpoints,
+    }
+    print_report(result)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        flags = regressions(baseline, result, args.tolerance, args.noise_ms)
+        for line in flags:
+            print("REGRESSION", line)
+        if not flags:
+            print(f"no regressions against {args.compare}")
+        status = 1 if flags else 0
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.save}")
+    return status
+
+
+def print_report(result: dict):
+    m = result["meta"]
+    print(f"{m['requests']} requests in {m['wall_s']}s ({m['rps']} req/s, {m['threads']} thread(s), {m['dialect']})")
+    print(f"{'endpoint':<12} {'n':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql avg':>8} {'sql max':>8} {'errors':>6}")
+    for op, e in result["endpoints"].items():
+        print(f"{op:<12} {e['n']:>6} {e['rps']:>7} {e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8} "
+              f"{e['sql_avg']:>8} {e['sql_max']:>8} {e['errors']:>6}")
+
+
+def regressions(baseline: dict, result: dict, tolerance: float, noise_ms: float) -> list:
+    """Human-readable regression flags. Latency must grow by more than both
+    `tolerance` (fraction) and `noise_ms`; SQL counts are compared exactly."""
+    flags = []
+    for op, now in result["endpoints"].items():
+        then = baseline.get("endpoints", {}).get(op)
+        if then is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if now[key] > then[key] * (1 + tolerance) and now[key] - then[key] > noise_ms:
+                flags.append(f"{op}: {key} {then[key]} -> {now[key]}")
+        if now["sql_avg"] > then["sql_avg"] + 0.5 or now["sql_max"] > then["sql_max"]:
+            flags.append(f"{op}: SQL queries avg {then['sql_avg']} -> {now['sql_avg']}, max {then['sql_max']} -> {now['sql_max']}")
+        if now["errors"] > then.get("errors", 0):
+            flags.append(f"{op}: {now['errors']} unexpected responses")
+    return flags
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("seed", help="fill a database with bench shops and paid history")
+    s.add_argument("--db", default=os.getenv("DATABASE_URL", "sqlite:///bench.db"))
+    s.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    s.add_argument("--seed", type=int, default=1)
+    s.add_argument("--shops", type=int, default=3)
+    s.add_argument("--tables", type=int, default=20)
+    s.add_argument("--categories", type=int, default=6)
+    s.add_argument("--items", type=int, default=60)
+    s.add_argument("--ingredients", type=int, default=30)
+    s.add_argument("--members", type=int, default=500)
+    s.add_argument("--days", type=int, default=90)
+    s.add_argument("--orders-per-day", type=int, default=80)
+
+    r = sub.add_parser("run", help="drive the mixed workload and report per-endpoint stats")
+    r.add_argument("--db", default=os.getenv("DATABASE_URL", "sqlite:///bench.db"))
+    r.add_argument("--seed", type=int, default=1)
+    r.add_argument("--requests", type=int, default=2000)
+    r.add_argument("--threads", type=int, default=1)
+    r.add_argument("--warmup", type=int, default=50, help="untimed requests per thread")
+    r.add_argument("--save", metavar="JSON", help="write the results as a baseline")
+    r.add_argument("--compare", metavar="JSON", help="flag regressions against a saved baseline")
+    r.add_argument("--tolerance", type=float, default=0.25, help="allowed p95/p99 growth (fraction)")
+    r.add_argument("--noise-ms", type=float, default=2.0, help="ignore latency changes smaller than this")
+
+    args = p.parse_args(argv)
+    if args.cmd == "seed":
+        seed(args)
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+EXPLAIN the hot-path queries and fail if any of them falls back to a
+sequential scan.
+
+    DATABASE_URL=sqlite:///pos.db python scripts/check_query_plans.py
+    DATABASE_URL=postgresql://... python scripts/check_query_plans.py
+
+The schema is brought up to date first (migrations are idempotent). On
+Postgres `enable_seqscan` is switched off for the session, so a Seq Scan
+in the plan means no usable index exists rather than "the table is small".
+"""
+
+import json
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("AUTO_MIGRATE", "0")
+
+from sqlalchemy import func, select
+
+from app import app
+from models import (db, Category, Ingredient, Inventory, ItemSalesDaily, KitchenEvent, Member, MenuItem, Order,
+                    OrderItem, Recipe, SalesDaily, StockMovement, Table)
+from utils import migrations
+from utils.pagination import prefix_match
+
+SHOP, TABLE, ORDER = 1, 1, 1
+
+
+def hot_queries(dialect: str):
+    return {
+        "kitchen: open orders of a shop": select(Order).where(Order.shop_id == SHOP, Order.status == "OPEN"),
+        "new_order: open order of a table": select(Order).where(Order.shop_id == SHOP, Order.table_id == TABLE, Order.status == "OPEN"),
+        "history: paid orders by close time": select(Order).where(Order.shop_id == SHOP, Order.status == "PAID", Order.closed_at >= datetime(2024, 1, 1)),
+        "order lines": select(OrderItem).where(OrderItem.order_id == ORDER),
+        "recipes of menu items": select(Recipe).where(Recipe.menu_item_id.in_([1, 2, 3])),
+        "inventory row": select(Inventory).where(Inventory.shop_id == SHOP, Inventory.ingredient_id == 1),
+        "member by phone": select(Member).where(Member.shop_id == SHOP, Member.phone == "0812345678"),
+        "menu items of a shop": select(MenuItem).where(MenuItem.shop_id == SHOP),
+        "categories of a shop": select(Category).where(Category.shop_id == SHOP),
+        "tables of a shop": select(Table).where(Table.shop_id == SHOP),
+        "table by QR token": select(Table).where(Table.token == "abc"),
+        "sales rollup of a shop": select(func.sum(SalesDaily.total_amount)).where(SalesDaily.shop_id == SHOP),
+        "top items in a window": select(ItemSalesDaily.menu_item_id, func.sum(ItemSalesDaily.quantity))
+            .where(ItemSalesDaily.shop_id == SHOP, ItemSalesDaily.day >= date(2024, 1, 1))
+            .group_by(ItemSalesDaily.menu_item_id),
+        "kitchen events of a shop": select(KitchenEvent).where(KitchenEvent.shop_id == SHOP, KitchenEvent.id > 0),
+        "stock ledger of an ingredient": select(StockMovement).where(StockMovement.shop_id == SHOP, StockMovement.ingredient_id == 1),
+        "members page by name": select(Member).where(Member.shop_id == SHOP, prefix_match(Member.name, "Som", dialect))
+            .order_by(Member.name, Member.id).limit(51),
+        "members by phone prefix": select(Member).where(Member.shop_id == SHOP, prefix_match(Member.phone, "0812", dialect))
+            .order_by(Member.phone, Member.id).limit(51),
+        "menu page by name": select(MenuItem).where(MenuItem.shop_id == SHOP, prefix_match(MenuItem.name, "Kao", dialect)),
+        "ingredients by name": select(Ingredient).where(Ingredient.shop_id == SHOP, prefix_match(Ingredient.name, "Ri", dialect)),
+        "paid history page": select(Order).where(Order.shop_id == SHOP, Order.status == "PAID")
+            .order_by(Order.closed_at.desc(), Order.id.desc()).limit(51),
+    }
+
+
+def _driver_sql(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[k] for k in compiled.positiontup)
+    return str(compiled), params
+
+
+def sqlite_seq_scans(conn, stmt) -> tuple:
+    sql, params = _driver_sql(conn, stmt)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    details = [r[-1] for r in rows]
+    # "SCAN t" = full table scan; "SCAN t USING [COVERING] INDEX" is fine
+    return [d for d in details if d.startswith("SCAN ") and "USING" not in d], details
+
+
+def postgres_seq_scans(conn, stmt) -> tuple:
+    sql, params = _driver_sql(conn, stmt)
+    conn.exec_driver_sql("SET enable_seqscan = off")
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql, params).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    details, nodes = [], [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        details.append(f"{node.get('Node Type')} {node.get('Index Name') or node.get('Relation Name') or ''}".strip())
+        nodes.extend(node.get("Plans", []))
+    return [d for d in details if d.startswith("Seq Scan")], details
+
+
+def main() -> int:
+    with app.app_context():
+        migrations.upgrade(db.engine, log=lambda *_: None)
+        dialect = db.engine.dialect.name
+        check = {"sqlite": sqlite_seq_scans, "postgresql": postgres_seq_scans}.get(dialect)
+        if check is None:
+            print(f"unsupported dialect {dialect}")
+            return 2
+        failures = 0
+        with db.engine.connect() as conn:
+            queries = hot_queries(dialect)
+            for name, stmt in queries.items():
+                bad, plan = check(conn, stmt)
+                status = "SEQ SCAN" if bad else "ok"
+                print(f"[{status:8}] {name}: {'; '.join(bad or plan)}")
+                failures += bool(bad)
+        print(f"{failures} of {len(queries)} queries use a sequential scan ({dialect})")
+        return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
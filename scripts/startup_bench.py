@@ -0,0 +1,111 @@
+"""
+Cold-start benchmark: how long a fresh worker process takes to import the
+app and to answer its first request.
+
+Each sample is a new Python interpreter (as a gunicorn worker or a new
+container would be) that imports `app`, then sends one request through the
+test client. Reported per sample: interpreter wall time, `import app` time,
+first-request time, and which heavy optional modules (qrcode, PIL) were
+loaded along the way (they should load on first use only).
+
+    python scripts/startup_bench.py --db sqlite:////tmp/bench.db --runs 10 --save startup-baseline.json
+    python scripts/startup_bench.py --db sqlite:////tmp/bench.db --compare startup-baseline.json
+
+`--compare` exits with status 1 when the median import or first-request
+time got slower than the baseline beyond the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HEAVY = ("qrcode", "PIL")
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app as appmod
+t1 = time.perf_counter()
+r = appmod.app.test_client().get(sys.argv[1])
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_request_ms": (t2 - t1) * 1000, "status": r.status_code,
+                  "heavy": sorted(m for m in %r if m in sys.modules), "modules": len(sys.modules)}))
+""" % (HEAVY,)
+
+
+def sample(db_url: str, path: str) -> dict:
+    env = dict(os.environ, DATABASE_URL=db_url, AUTO_MIGRATE="0")
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE, path], cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = (time.perf_counter() - started) * 1000
+    if out.returncode != 0:
+        raise SystemExit(out.stderr.strip() or f"probe exited with {out.returncode}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = wall
+    return result
+
+
+def summarize(samples: list) -> dict:
+    keys = ("process_ms", "import_ms", "first_request_ms")
+    stats = {k: {"median": round(statistics.median(s[k] for s in samples), 1),
+                 "min": round(min(s[k] for s in samples), 1),
+                 "max": round(max(s[k] for s in samples), 1)} for k in keys}
+    stats["heavy_modules"] = sorted({m for s in samples for m in s["heavy"]})
+    stats["modules"] = samples[-1]["modules"]
+    stats["statuses"] = sorted({s["status"] for s in samples})
+    return stats
+
+
+def compare(stats: dict, baseline: dict, tolerance: float, noise_ms: float) -> list:
+    problems = []
+    for k in ("import_ms", "first_request_ms"):
+        old, new = baseline[k]["median"], stats[k]["median"]
+        if new > old * (1 + tolerance) and new - old > noise_ms:
+            problems.append(f"{k}: median {old} -> {new}")
+    return problems
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--db", default=os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(ROOT, "pos.db")))
+    p.add_argument("--path", default="/login", help="first request to send (default /login)")
+    p.add_argument("--runs", type=int, default=10)
+    p.add_argument("--save", metavar="FILE", help="write the results as a baseline")
+    p.add_argument("--compare", metavar="FILE", help="fail if slower than this baseline")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    p.add_argument("--noise-ms", type=float, default=20.0, help="ignore slowdowns smaller than this")
+    args = p.parse_args(argv)
+
+    samples = [sample(args.db, args.path) for _ in range(args.runs)]
+    stats = summarize(samples)
+    print(f"{args.runs} cold starts, first request GET {args.path} -> {stats['statuses']}")
+    print(f"{'':<18}{'median':>9}{'min':>9}{'max':>9}")
+    for k in ("process_ms", "import_ms", "first_request_ms"):
+        s = stats[k]
+        print(f"{k:<18}{s['median']:>9}{s['min']:>9}{s['max']:>9}")
+    print(f"modules loaded: {stats['modules']}; heavy modules loaded: {', '.join(stats['heavy_modules']) or 'none'}")
+
+    if args.save:
+        meta = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "runs": args.runs,
+                "path": args.path}
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, **stats}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(stats, json.load(f), args.tolerance, args.noise_ms)
+        for line in problems:
+            print(f"REGRESSION {line}")
+        if problems:
+            return 1
+        print(f"no regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
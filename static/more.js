@@ -0,0 +1,118 @@
+// Infinite scroll for paged lists: when the "load more" link comes into
+// view, fetch the next page from the list's JSON endpoint (data-api) and
+// append one row per item to [data-rows], drawn by the renderer named in
+// data-rows. Without JS the link still works as a plain next-page link.
+(function () {
+  var target = document.querySelector("[data-rows]");
+  var link = document.querySelector("a[data-more]");
+  if (!target || !link || !link.getAttribute("data-api") || !window.IntersectionObserver || !window.fetch) return;
+
+  function cell(tr, text) {
+    var td = document.createElement("td");
+    td.textContent = text == null ? "" : text;
+    tr.appendChild(td);
+    return td;
+  }
+
+  function money(v) {
+    return (v || 0).toFixed(2);
+  }
+
+  // "/x/0/y" url_for templates from data-* attributes, with 0 replaced by the id
+  function url(name, id) {
+    return target.getAttribute("data-" + name + "-url").replace(/\/0(?=\/|$)/, "/" + id);
+  }
+
+  function button(td, href, label) {
+    var a = document.createElement("a");
+    a.className = "btn";
+    a.href = href;
+    a.textContent = label;
+    td.appendChild(a);
+  }
+
+  function deleteForm(td, action) {
+    var form = document.createElement("form");
+    form.method = "post";
+    form.action = action;
+    form.onsubmit = function () { return confirm("ลบ?"); };
+    var b = document.createElement("button");
+    b.className = "btn danger";
+    b.textContent = "ลบ";
+    form.appendChild(b);
+    td.appendChild(form);
+  }
+
+  var RENDER = {
+    members: function (tr, m) {
+      cell(tr, m.name); cell(tr, m.phone); cell(tr, m.points);
+    },
+    menu: function (tr, i) {
+      var td = cell(tr, "");
+      if (i.thumb_url) {
+        var img = document.createElement("img");
+        img.src = i.thumb_url;
+        img.className = "thumb";
+        img.loading = "lazy";
+        td.appendChild(img);
+      }
+      cell(tr, i.name); cell(tr, money(i.price)); cell(tr, i.category_id);
+      button(cell(tr, ""), url("recipes", i.id), "สูตร");
+      deleteForm(cell(tr, ""), url("delete", i.id));
+    },
+    inventory: function (tr, s) {
+      cell(tr, s.name); cell(tr, s.quantity == null ? 0 : s.quantity); cell(tr, s.unit);
+    },
+    categories: function (tr, c) {
+      cell(tr, c.name);
+      deleteForm(cell(tr, ""), url("delete", c.id));
+    },
+    orders: function (tr, o) {
+      cell(tr, "#" + o.id); cell(tr, o.table || "-");
+      cell(tr, o.closed_at ? o.closed_at.replace("T", " ").slice(0, 16) : "");
+      cell(tr, money(o.total_amount));
+      button(cell(tr, ""), url("receipt", o.id), "ใบเสร็จ");
+    }
+  };
+  var render = RENDER[target.getAttribute("data-rows")];
+  if (!render) return;
+
+  var io = new IntersectionObserver(function (entries) {
+    if (entries[0].isIntersecting) load();
+  }, { rootMargin: "400px" });
+  var busy = false;
+
+  function withCursor(href, next) {
+    var u = new URL(href, location.href);
+    u.searchParams.set("after", next);
+    return u.pathname + u.search;
+  }
+
+  function load() {
+    if (busy) return;
+    busy = true;
+    fetch(link.getAttribute("data-api"), { credentials: "same-origin", headers: { Accept: "application/json" } })
+      .then(function (r) {
+        if (!r.ok) throw new Error(r.status);
+        return r.json();
+      })
+      .then(function (page) {
+        page.items.forEach(function (item) {
+          var tr = document.createElement("tr");
+          render(tr, item);
+          target.appendChild(tr);
+        });
+        if (page.next) {
+          link.setAttribute("href", withCursor(link.getAttribute("href"), page.next));
+          link.setAttribute("data-api", withCursor(link.getAttribute("data-api"), page.next));
+        } else {
+          io.disconnect();
+          link.parentNode.removeChild(link);
+        }
+        busy = false;
+      })
+      .catch(function () { io.disconnect(); });
+  }
+
+  io.observe(link);
+})();
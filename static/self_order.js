@@ -0,0 +1,180 @@
+// Self-ordering page: the cart lives in localStorage, so adding items
+// needs no round trip. Checkout POSTs the cart as JSON with a key that is
+// generated once per checkout and kept until the server answers, so a
+// retry after a dropped connection can never add the lines twice.
+// Without JS the page falls back to the server-side cart forms.
+(function () {
+  var panel = document.getElementById("cart");
+  if (!panel || !window.localStorage || !window.fetch || !window.JSON) return;
+
+  if ("serviceWorker" in navigator) {
+    navigator.serviceWorker.register(panel.dataset.sw).catch(function () {});
+  }
+  if (panel.dataset.serverCart === "1") return;  // finish the server-side cart first
+
+  var storeKey = "pos-cart:" + panel.dataset.token;
+
+  function load() {
+    try {
+      var s = JSON.parse(localStorage.getItem(storeKey));
+      if (s && s.items) return s;
+    } catch (e) {}
+    return { items: {}, pending: null };
+  }
+  function save() { localStorage.setItem(storeKey, JSON.stringify(state)); }
+  var state = load();
+  var message = "";
+  var hint = panel.querySelector("p.hint");
+
+  function newKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    var s = "";
+    for (var i = 0; i < 32; i++) s += Math.floor(Math.random() * 16).toString(16);
+    return s;
+  }
+  function money(v) { return v.toFixed(2); }
+  function el(tag, text, cls) {
+    var e = document.createElement(tag);
+    if (text !== undefined) e.textContent = text;
+    if (cls) e.className = cls;
+    return e;
+  }
+
+  function linesTable(items, removable) {
+    var table = el("table"), total = 0;
+    var head = el("tr");
+    ["เมนู", "จำนวน", "รวม", ""].forEach(function (h) { head.appendChild(el("th", h)); });
+    table.appendChild(head);
+    Object.keys(items).forEach(function (id) {
+      var it = items[id], tr = el("tr"), sub = it.qty * it.price;
+      total += sub;
+      tr.appendChild(el("td", it.name));
+      tr.appendChild(el("td", String(it.qty)));
+      tr.appendChild(el("td", money(sub)));
+      var td = el("td");
+      if (removable) {
+        var b = el("button", "ลบ", "btn danger");
+        b.type = "button";
+        b.onclick = function () { delete state.items[id]; save(); render(); };
+        td.appendChild(b);
+      }
+      tr.appendChild(td);
+      table.appendChild(tr);
+    });
+    var foot = el("tr"), label = el("th", "รวมทั้งหมด");
+    label.colSpan = 2;
+    foot.appendChild(label);
+    foot.appendChild(el("th", money(total) + " ฿"));
+    foot.appendChild(el("th"));
+    table.appendChild(foot);
+    return table;
+  }
+
+  function render() {
+    panel.textContent = "";
+    panel.appendChild(el("h3", "ตะกร้าของคุณ"));
+    if (message) panel.appendChild(el("p", message, "notice"));
+    if (state.pending) {
+      panel.appendChild(el("p", "กำลังส่งออเดอร์… (จะลองใหม่อัตโนมัติจนกว่าจะส่งสำเร็จ)"));
+      panel.appendChild(linesTable(state.pending.items, false));
+      var retry = el("button", "ลองส่งอีกครั้ง", "btn");
+      retry.type = "button";
+      retry.onclick = submit;
+      panel.appendChild(retry);
+    }
+    if (Object.keys(state.items).length) {
+      if (state.pending) panel.appendChild(el("h3", "รายการถัดไป"));
+      panel.appendChild(linesTable(state.items, true));
+      if (!state.pending) {
+        var send = el("button", "ส่งออเดอร์เข้าครัว", "btn");
+        send.type = "button";
+        send.onclick = checkout;
+        panel.appendChild(send);
+      }
+    } else if (!state.pending) {
+      panel.appendChild(el("p", "ยังไม่มีรายการ"));
+    }
+    if (hint) panel.appendChild(hint);
+  }
+
+  function checkout() {
+    if (state.pending || !Object.keys(state.items).length) return;
+    state.pending = { key: newKey(), items: state.items };
+    state.items = {};
+    save();
+    submit();
+  }
+
+  // server errors are retried with a growing delay while the order is
+  // pending; when offline the "online" event resends instead
+  var sending = false, retryTimer = null, retryDelay = 0;
+  function retryLater() {
+    if (retryTimer || !state.pending || navigator.onLine === false) return false;
+    retryDelay = Math.min(retryDelay ? retryDelay * 2 : 2000, 60000);
+    retryTimer = setTimeout(function () { retryTimer = null; submit(); }, retryDelay);
+    return true;
+  }
+
+  function submit() {
+    if (!state.pending || sending) return;
+    clearTimeout(retryTimer);
+    retryTimer = null;
+    sending = true;
+    message = "";
+    render();
+    var p = state.pending;
+    var lines = Object.keys(p.items).map(function (id) {
+      return { item_id: Number(id), qty: p.items[id].qty };
+    });
+    fetch(panel.dataset.submit, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ key: p.key, lines: lines })
+    }).then(function (r) {
+      // a proxy's 502 page is HTML: only parse bodies that say they are JSON
+      var json = /^application\/json/.test(r.headers.get("Content-Type") || "");
+      return (json ? r.json() : Promise.resolve({})).then(function (body) { return { status: r.status, body: body }; });
+    }).then(function (res) {
+      sending = false;
+      if (res.status < 500) retryDelay = 0;
+      if (res.status === 200) {
+        state.pending = null;
+        message = "ส่งออเดอร์เข้าครัวแล้ว! แจ้งพนักงานเมื่อพร้อมชำระเงิน";
+      } else if (res.status >= 400 && res.status < 500) {
+        // rejected (e.g. an item left the menu): give the lines back to edit
+        Object.keys(p.items).forEach(function (id) { state.items[id] = p.items[id]; });
+        state.pending = null;
+        message = "ส่งออเดอร์ไม่สำเร็จ: " + ((res.body.details || []).join(", ") || res.body.error || res.status);
+      } else {
+        message = retryLater()
+          ? "ส่งออเดอร์ไม่สำเร็จ จะลองใหม่อัตโนมัติใน " + retryDelay / 1000 + " วินาที"
+          : "ส่งออเดอร์ไม่สำเร็จ จะลองส่งใหม่เมื่อกลับมาออนไลน์";
+      }
+      save();
+      render();
+    }).catch(function () {
+      sending = false;
+      message = retryLater()
+        ? "การเชื่อมต่อขัดข้อง จะลองใหม่อัตโนมัติใน " + retryDelay / 1000 + " วินาที"
+        : "การเชื่อมต่อขัดข้อง จะลองส่งใหม่เมื่อกลับมาออนไลน์";
+      render();
+    });
+  }
+
+  document.querySelectorAll("form.add[data-item]").forEach(function (form) {
+    form.addEventListener("submit", function (e) {
+      e.preventDefault();
+      var id = form.dataset.item, qty = parseInt(form.qty.value, 10) || 1;
+      var it = state.items[id] || { name: form.dataset.name, price: parseFloat(form.dataset.price), qty: 0 };
+      it.qty += Math.max(1, qty);
+      state.items[id] = it;
+      message = "";
+      save();
+      render();
+    });
+  });
+  window.addEventListener("online", submit);
+
+  render();
+  if (state.pending) submit();
+})();
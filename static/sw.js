@@ -0,0 +1,54 @@
+// Service worker for the self-ordering pages (registered with scope /p/).
+// Menu images are content-addressed, so they are served cache-first; the
+// page shell and static assets are network-first with a short timeout and
+// fall back to the cached copy on flaky Wi-Fi. Order submits (POST) are
+// never intercepted.
+var CACHE = "pos-self-order-v1";
+var NETWORK_TIMEOUT_MS = 3000;
+
+self.addEventListener("install", function () { self.skipWaiting(); });
+
+self.addEventListener("activate", function (event) {
+  event.waitUntil(
+    caches.keys().then(function (keys) {
+      return Promise.all(keys.filter(function (k) { return k !== CACHE; }).map(function (k) { return caches.delete(k); }));
+    }).then(function () { return self.clients.claim(); })
+  );
+});
+
+function cacheFirst(request) {
+  return caches.open(CACHE).then(function (cache) {
+    return cache.match(request).then(function (hit) {
+      return hit || fetch(request).then(function (resp) {
+        if (resp.ok) cache.put(request, resp.clone());
+        return resp;
+      });
+    });
+  });
+}
+
+function networkFirst(request) {
+  return caches.open(CACHE).then(function (cache) {
+    var network = fetch(request).then(function (resp) {
+      if (resp.ok) cache.put(request, resp.clone());
+      return resp;
+    });
+    var timeout = new Promise(function (resolve) {
+      setTimeout(function () { cache.match(request).then(resolve); }, NETWORK_TIMEOUT_MS);
+    });
+    return Promise.race([network.catch(function () { return cache.match(request); }), timeout])
+      .then(function (resp) { return resp || network; });
+  });
+}
+
+self.addEventListener("fetch", function (event) {
+  var req = event.request;
+  if (req.method !== "GET") return;
+  var url = new URL(req.url);
+  if (url.origin !== self.location.origin) return;
+  if (url.pathname.indexOf("/static/uploads/") === 0) {
+    event.respondWith(cacheFirst(req));
+  } else if (url.pathname.indexOf("/static/") === 0 || (url.pathname.indexOf("/p/") === 0 && req.mode === "navigate")) {
+    event.respondWith(networkFirst(req));
+  }
+});
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["AUTO_MIGRATE"] = "1"
+os.environ["JOB_MODE"] = "inline"
+
+
+@pytest.fixture(scope="session")
+def app():
+    import app as appmod
+
+    appmod.app.config["TESTING"] = True
+    return appmod.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def shop(app, client):
+    """A new shop, with `client` logged in as its owner."""
+    from models import db, Shop, User
+
+    with app.app_context():
+        email = f"{User.query.count()}@example.com"
+        client.post("/register", data={"email": email, "password": "x", "shop_name": "ร้านทดสอบ"})
+        yield db.session.get(Shop, User.query.filter_by(email=email).one().shop_id)
+
+
+@pytest.fixture
+def open_bill(app, client):
+    """Factory: register a shop called `shop_name` and open a bill on one of its tables."""
+    from models import db, MenuItem, Order, OrderItem, Table, User
+
+    def make(shop_name):
+        email = f"{len(User.query.all())}@example.com"
+        client.post("/register", data={"email": email, "password": "x", "shop_name": shop_name})
+        user = User.query.filter_by(email=email).one()
+        table = Table(shop_id=user.shop_id, name="T1")
+        item = MenuItem(shop_id=user.shop_id, name="ข้าวมันไก่", price=50.0)
+        db.session.add_all([table, item])
+        db.session.flush()
+        order = Order(shop_id=user.shop_id, table_id=table.id, status="OPEN", total_amount=100.0)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, menu_item_id=item.id, quantity=2, unit_price=50.0))
+        db.session.commit()
+        return order.id
+
+    with app.app_context():
+        yield make
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from models import db, MenuItem, Order, OrderItem, Table
+from utils.archive import archive_batch
+from utils.listings import paid_orders_page
+
+
+def _walk(shop_id, limit=7):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = paid_orders_page(shop_id, cursor=cursor, limit=limit)
+        ids += [o.id for o, _ in page.rows]
+        pages += 1
+        if page.next_cursor is None:
+            return ids, pages
+        cursor = page.next_cursor
+
+
+def test_history_pages_hot_first_then_archive(app, shop):
+    table, item = Table(shop_id=shop.id, name="T1"), MenuItem(shop_id=shop.id, name="ข้าว", price=50.0)
+    db.session.add_all([table, item])
+    db.session.flush()
+    now = datetime.utcnow()
+    for n in range(40):
+        closed = now - timedelta(days=5 + n * 12)
+        o = Order(shop_id=shop.id, table_id=table.id, status="PAID", created_at=closed, closed_at=closed, total_amount=50.0)
+        db.session.add(o)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=o.id, menu_item_id=item.id, quantity=1, unit_price=50.0))
+    db.session.commit()
+    before, _ = _walk(shop.id)
+
+    moved, _ = archive_batch(now - timedelta(days=180), batch=100)
+    db.session.commit()
+    assert moved > 20
+
+    unions = []
+    listen = lambda conn, cur, statement, *a: unions.append(statement) if "UNION ALL" in statement else None
+    event.listen(db.engine, "before_cursor_execute", listen)
+    try:
+        first = paid_orders_page(shop.id, limit=7)
+        assert unions == []  # the newest bills are all hot
+        after, pages = _walk(shop.id)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listen)
+    assert after == before
+    assert [o.id for o, _ in first.rows] == before[:7]
+    assert 0 < len(unions) < pages
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from models import db, Cart
+from utils.cart_store import DatabaseCartStore
+
+KEY = "c" * 16 + ":1"
+
+
+def test_database_remove_extends_expiry(app):
+    store = DatabaseCartStore(app, ttl=3600)
+    store._thread = object()  # no sweeper thread in tests
+    with app.app_context():
+        store.add(KEY, 1, 2)
+        store.add(KEY, 2, 1)
+        cart = db.session.get(Cart, KEY)
+        cart.expires_at = datetime.utcnow() + timedelta(seconds=60)
+        db.session.commit()
+        store.remove(KEY, 1)
+        assert db.session.get(Cart, KEY).expires_at > datetime.utcnow() + timedelta(seconds=3000)
+        assert store.get(KEY) == {2: 1}
+        store.remove("d" * 16 + ":1", 1)
+        assert db.session.get(Cart, "d" * 16 + ":1") is None
+
+
+def test_database_len_is_counted_by_the_sweep(app):
+    store = DatabaseCartStore(app, ttl=3600, sweep_interval=3600)
+    store._thread = object()
+    with app.app_context():
+        before = len(store)
+        store.add("e" * 16 + ":1", 1, 1)
+        assert len(store) == before  # no COUNT per scrape
+        store.sweep()
+        assert len(store) == before + 1
@@ -0,0 +1,20 @@
+from models import db, Job, Order, Payment, Receipt, SalesDaily
+
+
+def test_closing_a_paid_bill_again_changes_nothing(client, open_bill):
+    order_id = open_bill("ร้านทดสอบ")
+    first = client.post(f"/orders/{order_id}/close", data={"method": "CASH"})
+    assert first.status_code == 302
+    again = client.post(f"/orders/{order_id}/mark_paid")
+    assert again.status_code == 302 and again.location.endswith(f"/receipt/{order_id}")
+    cash_again = client.post(f"/orders/{order_id}/close", data={"method": "CASH"})
+    assert cash_again.location.endswith(f"/receipt/{order_id}")
+
+    order = db.session.get(Order, order_id)
+    payments = Payment.query.filter_by(order_id=order_id).all()
+    assert order.status == "PAID" and order.closed_at is not None
+    assert [(p.method, p.created_at) for p in payments] == [("CASH", order.closed_at)]
+    assert Receipt.query.filter_by(order_id=order_id).count() == 1
+    assert Job.query.count() == 0  # JOB_MODE=inline: order_closed ran once, nothing queued
+    daily = SalesDaily.query.filter_by(shop_id=order.shop_id).one()
+    assert (daily.order_count, daily.total_amount) == (1, 100.0)
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+from models import db, Job, Member
+from utils import jobs
+
+
+def _queued(name):
+    j = Job(name=name, payload="{}", status="QUEUED", attempts=0, max_attempts=3, run_at=datetime.utcnow(),
+            created_at=datetime.utcnow())
+    db.session.add(j)
+    db.session.commit()
+    return j.id
+
+
+def test_job_that_lost_its_lock_is_not_applied(app):
+    @jobs.job("steal_test")
+    def handler(payload):
+        db.session.add(Member(shop_id=1, name="stolen", phone="0800000000", points=1))
+        # meanwhile requeue_stale + another worker's claim took the job over
+        db.session.execute(update(Job).where(Job.name == "steal_test").values(locked_by="other"))
+
+    with app.app_context():
+        job_id = _queued("steal_test")
+        assert jobs._claim("me", 10) == [job_id]
+        assert jobs._run_one(job_id, "me") is False
+        assert Member.query.filter_by(name="stolen").count() == 0
+        j = db.session.get(Job, job_id)
+        assert (j.status, j.locked_by) == ("RUNNING", "me")  # the simulated takeover was rolled back with it
+
+
+def test_job_is_marked_done_with_its_writes(app):
+    @jobs.job("ok_test")
+    def handler(payload):
+        db.session.add(Member(shop_id=1, name="kept", phone="0800000001", points=1))
+
+    with app.app_context():
+        job_id = _queued("ok_test")
+        assert jobs._claim("me", 10) == [job_id]
+        assert jobs._run_one(job_id, "me") is True
+        assert db.session.get(Job, job_id).status == "DONE"
+        assert Member.query.filter_by(name="kept").count() == 1
@@ -0,0 +1,22 @@
+from models import db, MenuItem, OrderItem, Table
+
+
+def test_items_added_events_carry_line_ids(app, client, shop):
+    table = Table(shop_id=shop.id, name="T1")
+    item = MenuItem(shop_id=shop.id, name="ผัดไทย", price=60.0)
+    db.session.add_all([table, item])
+    db.session.commit()
+    events = app.extensions["events"]
+    cursor = events.cursor(shop.id)
+
+    resp = client.post(f"/api/tables/{table.id}/order",
+                       json={"lines": [{"item_id": item.id, "qty": 2}, {"item_id": item.id, "qty": 1, "note": "ไม่เผ็ด"}]})
+    assert resp.status_code == 200
+    added = [e for e in events.since(shop.id, cursor) if e.type == "items_added"]
+    line_ids = [i for (i,) in db.session.query(OrderItem.id).filter(OrderItem.order_id == added[0].data["order_id"])
+                .order_by(OrderItem.id)]
+    assert [it["id"] for it in added[0].data["items"]] == line_ids
+
+    page = client.get("/kitchen").get_data(as_text=True)
+    assert all(f'data-line="{i}"' in page for i in line_ids)
+    assert f"last_id={cursor + 2}" in page  # order_created + items_added
@@ -0,0 +1,31 @@
+import html
+import re
+
+from models import db, Member, MenuItem
+
+
+def _more_links(page: str):
+    m = re.search(r'<a class="btn" data-more href="([^"]+)" data-api="([^"]+)"', page)
+    return html.unescape(m.group(1)), html.unescape(m.group(2))
+
+
+def test_load_more_reads_the_json_endpoint(client, shop):
+    db.session.add_all([Member(shop_id=shop.id, name=f"m{n:03d}", phone=f"08{n:08d}", points=n) for n in range(60)])
+    db.session.commit()
+
+    page = client.get("/members?limit=25").get_data(as_text=True)
+    assert 'data-rows="members"' in page
+    href, api = _more_links(page)
+    assert api.startswith("/api/members?") and href.startswith("?")
+    data = client.get(api).get_json()
+    assert [m["name"] for m in data["items"]] == [f"m{n:03d}" for n in range(25, 60)]
+    assert data["next"] is None
+
+
+def test_menu_json_has_thumbnail_and_row_urls(client, shop):
+    db.session.add(MenuItem(shop_id=shop.id, name="ข้าวมันไก่", price=50.0))
+    db.session.commit()
+    page = client.get("/menu").get_data(as_text=True)
+    assert 'data-rows="menu"' in page and 'data-delete-url="/menu/0/delete"' in page
+    item = client.get("/api/menu").get_json()["items"][0]
+    assert set(item) >= {"id", "name", "price", "category_id", "thumb_url"}
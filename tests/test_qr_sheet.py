@@ -0,0 +1,15 @@
+import utils.qr_sheet as qr_sheet
+from models import db, Table
+
+
+def test_sheet_revalidation_does_not_render(app, client, shop, monkeypatch):
+    monkeypatch.setitem(app.config, "QR_SHEET_WORKERS", 0)  # render in this process
+    db.session.add_all([Table(shop_id=shop.id, name=f"โต๊ะ {n}") for n in range(1, 4)])
+    db.session.commit()
+    first = client.get("/tables/qr-sheet.png")
+    assert first.status_code == 200 and first.data.startswith(b"\x89PNG")
+
+    qr_sheet.sheet_cache.clear()
+    monkeypatch.setattr(qr_sheet, "render_card", lambda args: (_ for _ in ()).throw(AssertionError("rendered")))
+    again = client.get("/tables/qr-sheet.png", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304 and again.headers["X-Page-Count"] == "1"
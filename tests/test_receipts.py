@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from models import db, Order, Receipt, Shop
+from utils import receipts
+from utils.receipts import GS, qr_command
+
+
+def test_qr_command_counts_utf8_bytes():
+    data = "ร้านข้าวมันไก่"
+    cmd = qr_command(data)
+    store = GS + b"(k"
+    start = cmd.index(store + bytes([(len(data.encode("utf-8")) + 3) & 0xFF]))
+    assert cmd[start + 5:start + 8] == b"1P0"
+    assert data.encode("utf-8") in cmd
+
+
+def test_escpos_for_open_bill_of_thai_shop(client, open_bill):
+    order_id = open_bill("ร้านข้าวมันไก่")
+    resp = client.get(f"/receipt/{order_id}.escpos")
+    assert resp.status_code == 200
+    assert resp.data.startswith(b"\x1b@")
+    assert "ร้านข้าวมันไก่".encode("utf-8") in resp.data  # inside the PromptPay QR
+
+
+def test_concurrent_first_view_reuses_the_stored_receipt(app, client, open_bill, monkeypatch):
+    order_id = open_bill("ร้านใบเสร็จ")
+    order = db.session.get(Order, order_id)
+    order.status, order.closed_at = "PAID", datetime.utcnow()  # paid before receipts were stored
+    db.session.commit()
+    shop = db.session.get(Shop, order.shop_id)
+
+    real_snapshot = receipts.snapshot
+
+    def racing_snapshot(order, shop):
+        # another worker freezes the same bill between our lookup and our insert
+        with db.engine.begin() as conn:
+            conn.execute(Receipt.__table__.insert().values(
+                order_id=order.id, shop_id=order.shop_id, shop_name=shop.name, total_amount=0.0,
+                lines="[]", html="stored first", etag="first", created_at=datetime.utcnow()))
+        return real_snapshot(order, shop)
+
+    monkeypatch.setattr(receipts, "snapshot", racing_snapshot)
+    with app.test_request_context():
+        r = receipts.get_receipt(order, shop)
+    assert r.etag == "first"
+    assert Receipt.query.filter_by(order_id=order_id).count() == 1
@@ -0,0 +1,17 @@
+from models import db, ItemSalesDaily, Order
+
+
+def test_rollups_check_compares_counters_with_order_lines(app, client, open_bill):
+    order_id = open_bill("ร้านยอดขาย")
+    assert client.post(f"/orders/{order_id}/close", data={"method": "CASH"}).status_code == 302
+    shop_id = str(db.session.get(Order, order_id).shop_id)
+    runner = app.test_cli_runner()
+
+    ok = runner.invoke(args=["rollups-check", "--shop-id", shop_id])
+    assert ok.exit_code == 0, ok.output
+
+    db.session.query(ItemSalesDaily).filter_by(shop_id=int(shop_id)).update(
+        {ItemSalesDaily.quantity: ItemSalesDaily.quantity + 1})
+    db.session.commit()
+    drift = runner.invoke(args=["rollups-check", "--shop-id", shop_id])
+    assert drift.exit_code == 1 and "counters=" in drift.output
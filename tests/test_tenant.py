@@ -0,0 +1,19 @@
+from datetime import date, timedelta
+
+from sqlalchemy import update
+
+from models import db, Shop
+
+
+def test_plan_expiry_written_elsewhere_applies_on_next_request(client, shop):
+    assert client.get("/dashboard").status_code == 200
+
+    # another worker renews/expires the plan: no local invalidation happens here
+    db.session.execute(update(Shop).where(Shop.id == shop.id).values(plan_expiry=date.today() - timedelta(days=1)))
+    db.session.commit()
+    r = client.get("/dashboard")
+    assert r.status_code == 302 and r.headers["Location"].endswith("/subscriptions")
+
+    db.session.execute(update(Shop).where(Shop.id == shop.id).values(plan_expiry=date.today() + timedelta(days=30)))
+    db.session.commit()
+    assert client.get("/dashboard").status_code == 200
@@ -0,0 +1,168 @@
+"""
+Hot/cold storage for bills.
+
+`order` / `order_item` keep open bills and recent history. `archive_batch`
+moves PAID bills closed before a cutoff, with their lines, into one pair of
+tables per month of `closed_at` (`order_archive_YYYY_MM`,
+`order_item_archive_YYYY_MM`, same columns, no foreign keys), so the live
+tables and their indexes stay the size of recent service. Every archived
+month is listed in `order_archive_month`.
+
+Reports and exports read through `paid_orders` / `order_lines`: they return
+`Order` / `OrderItem` themselves when the window touches no archived month,
+else an alias of the same entity over a UNION ALL of the hot table and the
+matching month tables only. Payments, stock movements, submissions and
+receipts keep their `order_id` and stay in their own tables.
+
+A plain table per month (rather than Postgres declarative partitions) works
+the same on SQLite, MySQL and Postgres, and a month is dropped or moved to
+cheaper storage by handling its two tables.
+"""
+
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from models import db, Order, OrderArchiveMonth, OrderItem, Receipt, Shop
+
+ARCHIVE_METADATA = MetaData()
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _next_month(m: date) -> date:
+    return (m + timedelta(days=32)).replace(day=1)
+
+
+def _copy_columns(table) -> list:
+    return [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+            for c in table.columns]
+
+
+def month_tables(month: date) -> tuple:
+    """(orders, lines) Table objects of one archived month."""
+    month = month_start(month)
+    with _tables_lock:
+        if month not in _tables:
+            suffix = f"{month.year:04d}_{month.month:02d}"
+            orders = Table(f"order_archive_{suffix}", ARCHIVE_METADATA, *_copy_columns(Order.__table__))
+            Index(f"ix_order_archive_{suffix}_shop_closed", orders.c.shop_id, orders.c.closed_at)
+            lines = Table(f"order_item_archive_{suffix}", ARCHIVE_METADATA, *_copy_columns(OrderItem.__table__))
+            Index(f"ix_order_item_archive_{suffix}_order", lines.c.order_id)
+            _tables[month] = (orders, lines)
+        return _tables[month]
+
+
+def archived_months(session, start: datetime | None = None, end: datetime | None = None) -> list:
+    """Archived months overlapping [start, end)."""
+    q = session.query(OrderArchiveMonth.month)
+    if start is not None:
+        q = q.filter(OrderArchiveMonth.month >= month_start(start))
+    if end is not None:
+        q = q.filter(OrderArchiveMonth.month < end)
+    return [m for (m,) in q.order_by(OrderArchiveMonth.month)]
+
+
+def paid_orders(session, start: datetime | None = None, end: datetime | None = None):
+    """`Order`, or an alias of it that also covers the archived months in [start, end)."""
+    months = archived_months(session, start, end)
+    if not months:
+        return Order
+    parts = [select(*Order.__table__.c)] + [select(*month_tables(m)[0].c) for m in months]
+    return aliased(Order, union_all(*parts).subquery("order_all"), adapt_on_names=True)
+
+
+def order_lines(session, start: datetime | None = None, end: datetime | None = None):
+    """`OrderItem`, or an alias of it that also covers the archived months in [start, end)."""
+    months = archived_months(session, start, end)
+    if not months:
+        return OrderItem
+    parts = [select(*OrderItem.__table__.c)] + [select(*month_tables(m)[1].c) for m in months]
+    return aliased(OrderItem, union_all(*parts).subquery("order_item_all"), adapt_on_names=True)
+
+
+def _register(month: date, orders: int, lines: int):
+    stmt = (update(OrderArchiveMonth).where(OrderArchiveMonth.month == month)
+            .values(orders=OrderArchiveMonth.orders + orders, lines=OrderArchiveMonth.lines + lines,
+                    updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False))
+    if db.session.execute(stmt).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(OrderArchiveMonth(month=month, orders=orders, lines=lines, updated_at=datetime.utcnow()))
+    except IntegrityError:
+        db.session.execute(stmt)
+
+
+def _candidates(cutoff: datetime, batch: int) -> list:
+    """[(id, shop_id, closed_at)] of the oldest PAID bills before `cutoff`."""
+    # the newest rows stay hot so SQLite/MySQL never hand out an archived id again
+    max_order = db.session.query(func.max(Order.id)).scalar()
+    max_line_order = (db.session.query(OrderItem.order_id)
+                      .filter(OrderItem.id == db.session.query(func.max(OrderItem.id)).scalar_subquery()).scalar())
+    keep = {i for i in (max_order, max_line_order) if i is not None}
+    rows = []
+    for (shop_id,) in db.session.query(Shop.id).order_by(Shop.id):
+        q = (db.session.query(Order.id, Order.shop_id, Order.closed_at)
+             .filter(Order.shop_id == shop_id, Order.status == "PAID", Order.closed_at < cutoff)
+             .order_by(Order.closed_at, Order.id).limit(batch - len(rows) + len(keep)))
+        rows += [r for r in q if r[0] not in keep][:batch - len(rows)]
+        if len(rows) >= batch:
+            break
+    return rows
+
+
+def _freeze_missing_receipts(ids: list):
+    # bills paid before receipts were stored; the receipt must outlive the hot row
+    from utils.receipts import freeze_receipt
+
+    have = {i for (i,) in db.session.query(Receipt.order_id).filter(Receipt.order_id.in_(ids))}
+    shops = {}
+    for order in Order.query.filter(Order.id.in_([i for i in ids if i not in have])):
+        shop = shops.get(order.shop_id) or shops.setdefault(order.shop_id, db.session.get(Shop, order.shop_id))
+        freeze_receipt(order, shop)
+    db.session.flush()
+
+
+def archive_batch(older_than: datetime, batch: int = 500) -> tuple:
+    """Move up to `batch` PAID bills closed before `older_than`, with their
+    lines, to the month tables. Returns (bills, lines) moved; caller commits."""
+    rows = _candidates(older_than, batch)
+    if not rows:
+        return 0, 0
+    by_month = {}
+    for order_id, _, closed_at in rows:
+        by_month.setdefault(month_start(closed_at), []).append(order_id)
+    _freeze_missing_receipts([r[0] for r in rows])
+    conn = db.session.connection()
+    moved = lines = 0
+    for month, ids in sorted(by_month.items()):
+        orders_t, lines_t = month_tables(month)
+        orders_t.create(conn, checkfirst=True)
+        lines_t.create(conn, checkfirst=True)
+        n_lines = conn.execute(insert(lines_t).from_select(
+            [c.name for c in OrderItem.__table__.c],
+            select(*OrderItem.__table__.c).where(OrderItem.order_id.in_(ids)))).rowcount
+        n_orders = conn.execute(insert(orders_t).from_select(
+            [c.name for c in Order.__table__.c],
+            select(*Order.__table__.c).where(Order.id.in_(ids)))).rowcount
+        db.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(ids)))
+        db.session.execute(delete(Order).where(Order.id.in_(ids)))
+        _register(month, n_orders, n_lines)
+        moved += n_orders
+        lines += n_lines
+    return moved, lines
+
+
+def archive_stats() -> list:
+    """[(month, bills, lines)] of the archive."""
+    return (db.session.query(OrderArchiveMonth.month, OrderArchiveMonth.orders, OrderArchiveMonth.lines)
+            .order_by(OrderArchiveMonth.month).all())
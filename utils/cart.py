@@ -0,0 +1,56 @@
+"""
+Self-ordering cart pricing.
+
+A cart is the `{item_id: qty}` mapping kept for a table. `price_cart`
+resolves every line at once, either from a menu snapshot (no queries) or
+with a single `IN` query, and drops items that are gone or belong to
+another shop.
+"""
+
+from dataclasses import dataclass
+
+from models import db, MenuItem
+
+
+@dataclass(frozen=True)
+class CartLine:
+    id: int
+    name: str
+    price: float
+    qty: int
+    note: str | None = None
+
+    @property
+    def subtotal(self) -> float:
+        return self.price * self.qty
+
+
+@dataclass(frozen=True)
+class PricedCart:
+    lines: tuple
+    total: float
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def price_cart(shop_id: int, cart: dict, menu=None) -> PricedCart:
+    wanted = {}
+    for k, v in cart.items():
+        try:
+            item_id, qty = int(k), int(v)
+        except (TypeError, ValueError):
+            continue
+        if qty > 0:
+            wanted[item_id] = wanted.get(item_id, 0) + qty
+    if not wanted:
+        return PricedCart((), 0.0)
+    if menu is not None:
+        found = {i: menu.items_by_id[i] for i in wanted if i in menu.items_by_id}
+        rows = [(it.id, it.name, it.price) for it in found.values()]
+    else:
+        rows = (db.session.query(MenuItem.id, MenuItem.name, MenuItem.price)
+                .filter(MenuItem.shop_id == shop_id, MenuItem.id.in_(wanted)).all())
+    by_id = {r[0]: r for r in rows}
+    lines = tuple(CartLine(i, by_id[i][1], by_id[i][2], q) for i, q in wanted.items() if i in by_id)
+    return PricedCart(lines, sum(l.subtotal for l in lines))
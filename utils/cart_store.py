@@ -0,0 +1,211 @@
+"""
+Server-side self-order carts.
+
+The browser keeps only an opaque random id in the `pos_cart` cookie; carts
+live here under "<cart id>:<table id>" as `{item_id: qty}`. Adding to,
+removing from or clearing a cart touches one entry, and every write pushes
+the cart's expiry `ttl` seconds out. Expired carts read as empty and are
+deleted by a sweeper thread started on first use.
+
+Backends (config `CART_STORE`):
+  - "memory"   : per-process LRU with TTL, for single-process installs.
+  - "database" : `cart` / `cart_item` tables, shared by every worker.
+  - "pkg.module:Class" : any class with the MemoryCartStore interface.
+"""
+
+import importlib
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Cart, CartItem
+
+COOKIE = "pos_cart"
+_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,43}$")
+
+
+def new_cart_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def cart_key(cart_id: str | None, table_id: int) -> str | None:
+    """Store key for this browser's cart at `table_id` (None without a valid id)."""
+    if not cart_id or not _ID_RE.match(cart_id):
+        return None
+    return f"{cart_id}:{table_id}"
+
+
+class MemoryCartStore:
+    def __init__(self, app=None, ttl: float = 3 * 3600, max_carts: int = 10000, sweep_interval: float = 300):
+        self.app = app
+        self.ttl = ttl
+        self.max_carts = max_carts
+        self.sweep_interval = sweep_interval
+        self._carts = OrderedDict()  # key -> (expires_at monotonic, {item_id: qty})
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self, key: str) -> dict:
+        self._ensure_sweeper()
+        with self._lock:
+            entry = self._carts.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return {}
+            self._carts.move_to_end(key)
+            return dict(entry[1])
+
+    def _entry(self, key: str) -> dict:
+        # caller holds the lock
+        entry = self._carts.pop(key, None)
+        items = entry[1] if entry is not None and entry[0] >= time.monotonic() else {}
+        self._carts[key] = (time.monotonic() + self.ttl, items)
+        while len(self._carts) > self.max_carts:
+            self._carts.popitem(last=False)
+        return items
+
+    def add(self, key: str, item_id: int, qty: int):
+        self._ensure_sweeper()
+        with self._lock:
+            items = self._entry(key)
+            items[item_id] = items.get(item_id, 0) + qty
+
+    def remove(self, key: str, item_id: int):
+        with self._lock:
+            if key in self._carts:
+                self._entry(key).pop(item_id, None)
+
+    def clear(self, key: str):
+        with self._lock:
+            self._carts.pop(key, None)
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            dead = [k for k, (exp, _) in self._carts.items() if exp < now]
+            for k in dead:
+                del self._carts[k]
+        return len(dead)
+
+    def __len__(self):
+        return len(self._carts)
+
+    def _ensure_sweeper(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="cart-sweeper", daemon=True)
+                    self._thread.start()
+
+    def _sweep_once(self):
+        self.sweep()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self._sweep_once()
+            except Exception:
+                if self.app is not None:
+                    self.app.logger.exception("cart sweeper failed")
+
+
+class DatabaseCartStore(MemoryCartStore):
+    """Carts in the `cart` / `cart_item` tables. Each write commits db.session.
+    `len()` is the count taken by the last sweep (or by `len()` itself when no
+    sweep ran for `sweep_interval`), so metrics scrapes don't COUNT the table."""
+
+    _counted = (float("-inf"), 0)  # (monotonic time, carts)
+
+    def get(self, key):
+        self._ensure_sweeper()
+        rows = db.session.execute(
+            select(CartItem.menu_item_id, CartItem.qty)
+            .join(Cart, Cart.key == CartItem.cart_key)
+            .where(CartItem.cart_key == key, Cart.expires_at > datetime.utcnow())
+        )
+        return {item_id: qty for item_id, qty in rows}
+
+    def _touch(self, key, create: bool = True):
+        expires = datetime.utcnow() + timedelta(seconds=self.ttl)
+        if db.session.execute(update(Cart).where(Cart.key == key).values(expires_at=expires)).rowcount or not create:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(Cart(key=key, expires_at=expires))
+        except IntegrityError:
+            pass  # created by a concurrent request
+
+    def add(self, key, item_id, qty):
+        self._ensure_sweeper()
+        self._touch(key)
+        stmt = (update(CartItem).where(CartItem.cart_key == key, CartItem.menu_item_id == item_id)
+                .values(qty=CartItem.qty + qty).execution_options(synchronize_session=False))
+        if not db.session.execute(stmt).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(CartItem(cart_key=key, menu_item_id=item_id, qty=qty))
+            except IntegrityError:
+                db.session.execute(stmt)
+        db.session.commit()
+
+    def remove(self, key, item_id):
+        self._touch(key, create=False)
+        db.session.execute(delete(CartItem).where(CartItem.cart_key == key, CartItem.menu_item_id == item_id))
+        db.session.commit()
+
+    def clear(self, key):
+        db.session.execute(delete(CartItem).where(CartItem.cart_key == key))
+        db.session.execute(delete(Cart).where(Cart.key == key))
+        db.session.commit()
+
+    def sweep(self):
+        expired = select(Cart.key).where(Cart.expires_at < datetime.utcnow())
+        db.session.execute(delete(CartItem).where(CartItem.cart_key.in_(expired)))
+        n = db.session.execute(delete(Cart).where(Cart.expires_at < datetime.utcnow())).rowcount
+        db.session.commit()
+        self._count()
+        return n
+
+    def _count(self) -> int:
+        self._counted = (time.monotonic(), db.session.query(db.func.count(Cart.key)).scalar())
+        return self._counted[1]
+
+    def __len__(self):
+        at, n = self._counted
+        return n if time.monotonic() - at < self.sweep_interval else self._count()
+
+    def _sweep_once(self):
+        with self.app.app_context():
+            try:
+                self.sweep()
+            finally:
+                db.session.remove()
+
+
+BACKENDS = {"memory": MemoryCartStore, "database": DatabaseCartStore}
+
+
+def _backend_class(name: str):
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def init_cart_store(app):
+    store = _backend_class(app.config.get("CART_STORE", "memory"))(
+        app, ttl=app.config.get("CART_TTL_SECONDS", 3 * 3600), max_carts=app.config.get("CART_MAX", 10000),
+        sweep_interval=app.config.get("CART_SWEEP_SECONDS", 300))
+    app.extensions["cart_store"] = store
+    return store
+
+
+def get_store():
+    return current_app.extensions["cart_store"]
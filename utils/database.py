@@ -0,0 +1,91 @@
+"""
+Engine configuration from the environment.
+
+`configure_database(app)` (before `db.init_app`) turns the `DB_POOL_*`
+variables into `SQLALCHEMY_ENGINE_OPTIONS` and registers the optional
+read-only replica from `DATABASE_READ_URL` as the `replica` bind.
+`init_database(app)` (after it) switches SQLite files to WAL so the
+kitchen and public pages keep reading while a bill is being written.
+
+`read_session()` is for read-only pages that tolerate replication lag
+(reports, dashboard): it is bound to the replica when one is configured
+and falls back to `db.session` otherwise.
+"""
+
+import os
+
+from flask import current_app, g
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from models import db
+
+REPLICA = "replica"
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def engine_options(url: str, env=os.environ) -> dict:
+    """Pool options for server databases. SQLite keeps SQLAlchemy's
+    defaults (its pools don't take overflow/recycle settings)."""
+    if _is_sqlite(url):
+        return {}
+    opts = {
+        "pool_pre_ping": env.get("DB_POOL_PRE_PING", "1") == "1",
+        "pool_recycle": int(env.get("DB_POOL_RECYCLE", "1800")),
+    }
+    for key, name in (("pool_size", "DB_POOL_SIZE"), ("max_overflow", "DB_MAX_OVERFLOW"), ("pool_timeout", "DB_POOL_TIMEOUT")):
+        if env.get(name):
+            opts[key] = int(env[name])
+    return opts
+
+
+def configure_database(app, env=os.environ):
+    url = app.config["SQLALCHEMY_DATABASE_URI"]
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(url, env)
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(env.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    app.config["SQLITE_WAL"] = env.get("SQLITE_WAL", "1") == "1"
+    read_url = env.get("DATABASE_READ_URL")
+    if read_url:
+        app.config.setdefault("SQLALCHEMY_BINDS", {})[REPLICA] = {"url": read_url, **engine_options(read_url, env)}
+
+
+def init_database(app):
+    busy_ms = app.config["SQLITE_BUSY_TIMEOUT_MS"]
+    wal = app.config["SQLITE_WAL"]
+
+    def _sqlite_pragmas(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        if wal:
+            # readers no longer wait for writers; NORMAL is durable in WAL
+            # mode except for the last commits on power loss
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA busy_timeout={int(busy_ms)}")
+        cur.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite" and not sa_event.contains(engine, "connect", _sqlite_pragmas):
+                sa_event.listen(engine, "connect", _sqlite_pragmas)
+
+    @app.teardown_appcontext
+    def _close_read_session(exc):
+        s = g.pop("_read_session", None)
+        if s is not None:
+            s.close()
+
+
+def has_replica() -> bool:
+    return REPLICA in current_app.config.get("SQLALCHEMY_BINDS", {})
+
+
+def read_session():
+    if not has_replica():
+        return db.session
+    s = g.get("_read_session")
+    if s is None:
+        s = g._read_session = Session(bind=db.engines[REPLICA], autoflush=False)
+    return s
@@ -0,0 +1,247 @@
+"""
+Per-shop pub/sub for the kitchen display (server-sent events).
+
+Events are queued on the SQLAlchemy session with `publish()` and only fanned
+out after the surrounding transaction commits, so the kitchen never sees an
+order that was rolled back.
+
+Backends (config `EVENT_BACKEND`):
+  - "memory"   : in-process fan-out, fine for a single worker.
+  - "database" : events are also written to `kitchen_event`; every worker
+                 runs one poller thread that fans new rows out to its local
+                 subscribers, so several gunicorn workers see the same stream.
+  - "pkg.module:Class" : any class with the MemoryBackend interface.
+"""
+
+import importlib
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from models import db, KitchenEvent
+
+KEEPALIVE_SECONDS = 15
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    shop_id: int
+    type: str
+    data: dict
+
+    def to_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, ensure_ascii=False)}\n\n"
+
+
+class MemoryBackend:
+    def __init__(self, app=None, history: int = 256, queue_size: int = 1000):
+        self._lock = threading.Lock()
+        self._subs = defaultdict(set)
+        self._history = defaultdict(lambda: deque(maxlen=history))
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._queue_size = queue_size
+
+    # called with the session still open (inside the transaction)
+    def stage(self, session, shop_id: int, type: str, data: dict):
+        session.info.setdefault("pending_events", []).append((shop_id, type, data))
+
+    # called after the transaction committed
+    def committed(self, pending):
+        for shop_id, type, data in pending:
+            self._dispatch(Event(next(self._ids), shop_id, type, data))
+
+    def _dispatch(self, ev: Event):
+        with self._lock:
+            self._history[ev.shop_id].append(ev)
+            self._last_id = max(self._last_id, ev.id)
+            subs = list(self._subs.get(ev.shop_id, ()))
+        for q in subs:
+            try:
+                q.put_nowait(ev)
+            except queue.Full:
+                pass  # stalled client; it resyncs with Last-Event-ID on reconnect
+
+    def cursor(self, shop_id: int) -> int:
+        with self._lock:
+            return self._last_id
+
+    def since(self, shop_id: int, last_id: int) -> list:
+        with self._lock:
+            return [e for e in self._history.get(shop_id, ()) if e.id > last_id]
+
+    def subscribe(self, shop_id: int) -> queue.Queue:
+        q = queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            self._subs[shop_id].add(q)
+        return q
+
+    def unsubscribe(self, shop_id: int, q: queue.Queue):
+        with self._lock:
+            self._subs[shop_id].discard(q)
+            if not self._subs[shop_id]:
+                self._subs.pop(shop_id, None)
+
+
+class DatabaseBackend(MemoryBackend):
+    lookback = 200  # ids from other workers may commit out of order
+
+    def __init__(self, app=None, poll_interval: float = 1.0, retention: timedelta = timedelta(minutes=30), **kw):
+        super().__init__(app, **kw)
+        self.app = app
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._seen = deque(maxlen=self.lookback * 4)
+        self._seen_set = set()
+        self._cursor = None
+        self._thread = None
+
+    def stage(self, session, shop_id, type, data):
+        session.add(KitchenEvent(shop_id=shop_id, type=type, payload=json.dumps(data, ensure_ascii=False), created_at=datetime.utcnow()))
+
+    def committed(self, pending):
+        pass  # the poller picks the rows up
+
+    def cursor(self, shop_id):
+        return db.session.query(db.func.max(KitchenEvent.id)).filter(KitchenEvent.shop_id == shop_id).scalar() or 0
+
+    def since(self, shop_id, last_id):
+        rows = KitchenEvent.query.filter(KitchenEvent.shop_id == shop_id, KitchenEvent.id > last_id).order_by(KitchenEvent.id).all()
+        return [self._to_event(r) for r in rows]
+
+    def subscribe(self, shop_id):
+        q = super().subscribe(shop_id)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="kitchen-events", daemon=True)
+                    self._thread.start()
+        return q
+
+    @staticmethod
+    def _to_event(row) -> Event:
+        return Event(row.id, row.shop_id, row.type, json.loads(row.payload))
+
+    def _mark_seen(self, ev_id: int) -> bool:
+        if ev_id in self._seen_set:
+            return False
+        if len(self._seen) == self._seen.maxlen:
+            self._seen_set.discard(self._seen[0])
+        self._seen.append(ev_id)
+        self._seen_set.add(ev_id)
+        return True
+
+    def _poll(self):
+        with self._lock:
+            shops = list(self._subs)
+        if self._cursor is None:
+            self._cursor = db.session.query(db.func.max(KitchenEvent.id)).scalar() or 0
+        if not shops:
+            return
+        rows = (
+            KitchenEvent.query
+            .filter(KitchenEvent.id > self._cursor - self.lookback, KitchenEvent.shop_id.in_(shops))
+            .order_by(KitchenEvent.id)
+            .all()
+        )
+        for row in rows:
+            self._cursor = max(self._cursor, row.id)
+            if self._mark_seen(row.id):
+                self._dispatch(self._to_event(row))
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - self.retention
+        KitchenEvent.query.filter(KitchenEvent.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+
+    def _run(self):
+        ticks = 0
+        while True:
+            try:
+                with self.app.app_context():
+                    self._poll()
+                    ticks += 1
+                    if ticks % 600 == 0:
+                        self._prune()
+                    db.session.remove()
+            except Exception:
+                self.app.logger.exception("kitchen event poller failed")
+            time.sleep(self.poll_interval)
+
+
+BACKENDS = {"memory": MemoryBackend, "database": DatabaseBackend}
+
+
+def _backend_class(name: str):
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def _on_commit(session):
+    pending = session.info.pop("pending_events", None)
+    if pending:
+        session.info["events_backend"].committed(pending)
+
+
+def _on_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("pending_events", None)
+
+
+def init_events(app):
+    backend = _backend_class(app.config.get("EVENT_BACKEND", "memory"))(app)
+    app.extensions["events"] = backend
+    if not sa_event.contains(Session, "after_commit", _on_commit):
+        sa_event.listen(Session, "after_commit", _on_commit)
+        sa_event.listen(Session, "after_soft_rollback", _on_rollback)
+    return backend
+
+
+def get_backend():
+    return current_app.extensions["events"]
+
+
+def publish(shop_id: int, type: str, data: dict):
+    """Queue a kitchen event; it is delivered when db.session commits."""
+    backend = get_backend()
+    db.session.info["events_backend"] = backend
+    backend.stage(db.session, shop_id, type, data)
+
+
+def stream(shop_id: int, last_id: int = 0):
+    """Generator of SSE frames for one shop. Call from a request context:
+    the backlog is read eagerly, the generator itself does not touch the DB."""
+    backend = get_backend()
+    q = backend.subscribe(shop_id)
+    backlog = backend.since(shop_id, last_id)
+
+    def gen():
+        replayed = {e.id for e in backlog}
+        try:
+            yield "retry: 3000\n\n"
+            for ev in backlog:
+                yield ev.to_sse()
+            while True:
+                try:
+                    ev = q.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if ev.id not in replayed:
+                    yield ev.to_sse()
+        finally:
+            backend.unsubscribe(shop_id, q)
+
+    return gen()
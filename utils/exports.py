@@ -0,0 +1,135 @@
+"""
+Streaming CSV / JSONL exports for accounting.
+
+Rows are read with `yield_per` (a server-side cursor on Postgres) and
+encoded in batches as they arrive, so memory use doesn't grow with the
+date range and the download starts after the first batch. Optional gzip
+is applied to the stream with a single zlib compressor.
+
+Each export is a (columns, query builder) pair; the builder gets the
+session, shop id and the [start, end) datetime window. Bills and their
+lines are read across live and archived months (utils/archive.py).
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+from models import Ingredient, Inventory, MenuItem, Payment, StockMovement, Table
+from utils.archive import order_lines, paid_orders
+
+BATCH = 1000
+
+
+def _paid_orders(s, shop_id, start, end):
+    Order = paid_orders(s, start, end)
+    return (s.query(Order.id, Order.table_id, Table.name, Order.created_at, Order.closed_at, Order.total_amount)
+            .outerjoin(Table, Table.id == Order.table_id)
+            .filter(Order.shop_id == shop_id, Order.status == "PAID", Order.closed_at >= start, Order.closed_at < end)
+            .order_by(Order.closed_at, Order.id))
+
+
+def _order_lines(s, shop_id, start, end):
+    Order, OrderItem = paid_orders(s, start, end), order_lines(s, start, end)
+    return (s.query(Order.id, Order.closed_at, OrderItem.id, OrderItem.menu_item_id, MenuItem.name,
+                    OrderItem.quantity, OrderItem.unit_price, OrderItem.quantity * OrderItem.unit_price, OrderItem.note)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+            .filter(Order.shop_id == shop_id, Order.status == "PAID", Order.closed_at >= start, Order.closed_at < end)
+            .order_by(Order.closed_at, Order.id, OrderItem.id))
+
+
+def _payments(s, shop_id, start, end):
+    # payments are reached through their bill's (shop_id, status, closed_at) index
+    Order = paid_orders(s, start, end)
+    return (s.query(Payment.id, Payment.order_id, Payment.method, Payment.amount, Payment.created_at)
+            .join(Order, Order.id == Payment.order_id)
+            .filter(Order.shop_id == shop_id, Order.status == "PAID", Order.closed_at >= start, Order.closed_at < end)
+            .order_by(Payment.created_at, Payment.id))
+
+
+def _stock_movements(s, shop_id, start, end):
+    return (s.query(StockMovement.id, StockMovement.created_at, StockMovement.ingredient_id, Ingredient.name,
+                    Ingredient.unit, StockMovement.delta, StockMovement.reason, StockMovement.order_id)
+            .outerjoin(Ingredient, Ingredient.id == StockMovement.ingredient_id)
+            .filter(StockMovement.shop_id == shop_id, StockMovement.created_at >= start, StockMovement.created_at < end)
+            .order_by(StockMovement.created_at, StockMovement.id))
+
+
+def _inventory(s, shop_id, start, end):
+    # current levels; the date range does not apply
+    return (s.query(Ingredient.id, Ingredient.name, Ingredient.unit, Inventory.quantity)
+            .outerjoin(Inventory, (Inventory.ingredient_id == Ingredient.id) & (Inventory.shop_id == shop_id))
+            .filter(Ingredient.shop_id == shop_id)
+            .order_by(Ingredient.name, Ingredient.id))
+
+
+EXPORTS = {
+    "orders": (("order_id", "table_id", "table", "created_at", "closed_at", "total_amount"), _paid_orders),
+    "order-lines": (("order_id", "closed_at", "line_id", "menu_item_id", "menu_item", "quantity", "unit_price",
+                     "amount", "note"), _order_lines),
+    "payments": (("payment_id", "order_id", "method", "amount", "created_at"), _payments),
+    "stock-movements": (("movement_id", "created_at", "ingredient_id", "ingredient", "unit", "delta", "reason",
+                         "order_id"), _stock_movements),
+    "inventory": (("ingredient_id", "ingredient", "unit", "quantity"), _inventory),
+}
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def export_rows(session, kind: str, shop_id: int, start: datetime, end: datetime):
+    columns, build = EXPORTS[kind]
+    q = build(session, shop_id, start, end).execution_options(yield_per=BATCH)
+    return columns, (tuple(r) for r in q)
+
+
+def _plain(v):
+    return v.isoformat(sep=" ") if isinstance(v, datetime) else v.isoformat() if isinstance(v, date) else v
+
+
+def csv_chunks(columns, rows, batch: int = BATCH):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    buf.write("\ufeff")  # BOM so Excel opens Thai text as UTF-8
+    w.writerow(columns)
+    n = 0
+    for row in rows:
+        w.writerow([_plain(v) for v in row])
+        n += 1
+        if n % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def jsonl_chunks(columns, rows, batch: int = BATCH):
+    out = []
+    for row in rows:
+        out.append(json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False))
+        if len(out) == batch:
+            yield "\n".join(out) + "\n"
+            out = []
+    if out:
+        yield "\n".join(out) + "\n"
+
+
+def encode(chunks, gzip: bool = False):
+    """UTF-8 bytes of `chunks`, gzip-compressed as one member if asked."""
+    if not gzip:
+        for c in chunks:
+            yield c.encode("utf-8")
+        return
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for c in chunks:
+        data = z.compress(c.encode("utf-8"))
+        if data:
+            yield data
+    yield z.flush()
+
+
+def stream_export(session, kind: str, fmt: str, shop_id: int, start: datetime, end: datetime, gzip: bool = False):
+    columns, rows = export_rows(session, kind, shop_id, start, end)
+    chunks = csv_chunks(columns, rows) if fmt == "csv" else jsonl_chunks(columns, rows)
+    return encode(chunks, gzip)
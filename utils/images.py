@@ -0,0 +1,133 @@
+"""
+Menu image upload pipeline.
+
+Uploads are stored once under their content hash (`<hash>.<ext>`), and
+resized variants are rendered in a background thread pool as
+`<hash>-<variant>.webp` / `.jpg`. Because names are content-addressed,
+duplicates are stored once and every file can be served as immutable.
+A variant requested before the pool has produced it is rendered on demand.
+"""
+
+import hashlib
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+VARIANTS = {"card": 400, "detail": 1080}  # longest edge in px
+FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}), "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True})}
+CANONICAL = ("detail", "jpg")  # what MenuItem.image_url points at
+ORIGINAL_EXTS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "MPO": "jpg"}
+
+_NAME_RE = re.compile(r"^(?P<hash>[0-9a-f]{20})-(?P<variant>[a-z]+)\.(?P<ext>webp|jpg)$")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _executor(workers: int = 2) -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+    return _pool
+
+
+def variant_name(digest: str, variant: str, ext: str) -> str:
+    return f"{digest}-{variant}.{ext}"
+
+
+def _original_path(upload_dir: str, digest: str):
+    for ext in set(ORIGINAL_EXTS.values()):
+        p = os.path.join(upload_dir, f"{digest}.{ext}")
+        if os.path.exists(p):
+            return p
+    return None
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def render_variant(upload_dir: str, digest: str, variant: str, ext: str) -> str | None:
+    """Render one variant from the stored original; returns its path."""
+    out = os.path.join(upload_dir, variant_name(digest, variant, ext))
+    if os.path.exists(out):
+        return out
+    from PIL import Image, ImageOps  # loaded on first use, keeps app import fast
+
+    src = _original_path(upload_dir, digest)
+    if src is None or variant not in VARIANTS or ext not in FORMATS:
+        return None
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        im = im.convert("RGB")
+        edge = VARIANTS[variant]
+        im.thumbnail((edge, edge), Image.LANCZOS)
+        fmt, opts = FORMATS[ext]
+        bio = io.BytesIO()
+        im.save(bio, format=fmt, **opts)
+    _write_atomic(out, bio.getvalue())
+    return out
+
+
+def process_all(upload_dir: str, digest: str):
+    for variant in VARIANTS:
+        for ext in FORMATS:
+            render_variant(upload_dir, digest, variant, ext)
+
+
+def store_upload(file_storage, upload_dir: str, workers: int = 2) -> str:
+    """Save an uploaded image by content hash and queue its variants.
+    Returns the public URL of the canonical variant."""
+    from PIL import Image, UnidentifiedImageError
+
+    data = file_storage.read()
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            fmt = im.format
+    except (UnidentifiedImageError, OSError):
+        raise InvalidImage(file_storage.filename)
+    if fmt not in ORIGINAL_EXTS:
+        raise InvalidImage(file_storage.filename)
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    original = os.path.join(upload_dir, f"{digest}.{ORIGINAL_EXTS[fmt]}")
+    if not os.path.exists(original):
+        os.makedirs(upload_dir, exist_ok=True)
+        _write_atomic(original, data)
+    _executor(workers).submit(process_all, upload_dir, digest)
+    return f"/static/uploads/{variant_name(digest, *CANONICAL)}"
+
+
+def parse_variant(filename: str):
+    """(hash, variant, ext) for a variant file name, else None."""
+    m = _NAME_RE.match(filename)
+    return (m["hash"], m["variant"], m["ext"]) if m else None
+
+
+def image_sources(url: str | None) -> dict | None:
+    """`src`/`srcset` data for templates; legacy uploads get a plain src."""
+    if not url:
+        return None
+    parsed = parse_variant(url.rsplit("/", 1)[-1])
+    if not parsed:
+        return {"src": url, "thumb": url, "webp": "", "jpg": ""}
+    digest, _, _ = parsed
+    base = url.rsplit("/", 1)[0]
+    srcset = lambda ext: ", ".join(f"{base}/{variant_name(digest, v, ext)} {w}w" for v, w in VARIANTS.items())
+    return {
+        "src": f"{base}/{variant_name(digest, 'card', 'jpg')}",
+        "thumb": f"{base}/{variant_name(digest, 'card', 'jpg')}",
+        "webp": srcset("webp"),
+        "jpg": srcset("jpg"),
+    }
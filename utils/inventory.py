@@ -0,0 +1,102 @@
+"""
+Set-based stock deduction and the stock movement ledger.
+
+Closing a bill costs a fixed number of statements regardless of its size:
+one query for the order lines, one for the stocked recipe rows, one
+batched UPDATE (executemany) and one bulk INSERT into `stock_movement`.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, insert, update
+
+from models import db, Inventory, OrderItem, Recipe, StockMovement
+
+
+def required_stock(order) -> dict:
+    """{ingredient_id: quantity} needed for every line of `order`, limited
+    to ingredients the shop keeps inventory for."""
+    qty_by_item = defaultdict(int)
+    for menu_item_id, qty in db.session.query(OrderItem.menu_item_id, OrderItem.quantity).filter(OrderItem.order_id == order.id):
+        qty_by_item[menu_item_id] += qty or 0
+    if not qty_by_item:
+        return {}
+    stocked = db.session.query(Inventory.ingredient_id).filter(Inventory.shop_id == order.shop_id)
+    rows = (
+        db.session.query(Recipe.menu_item_id, Recipe.ingredient_id, Recipe.quantity)
+        .filter(Recipe.menu_item_id.in_(qty_by_item), Recipe.ingredient_id.in_(stocked.scalar_subquery()))
+    )
+    need = defaultdict(float)
+    for menu_item_id, ingredient_id, per_unit in rows:
+        need[ingredient_id] += per_unit * qty_by_item[menu_item_id]
+    return dict(need)
+
+
+def apply_movements(shop_id: int, deltas: dict, reason: str, order_id: int | None = None):
+    """Add `deltas` ({ingredient_id: +/-qty}) to inventory with one batched
+    UPDATE and record them in the ledger. The caller commits."""
+    if not deltas:
+        return
+    inv = Inventory.__table__
+    db.session.execute(
+        update(inv)
+        .where(inv.c.shop_id == bindparam("b_shop"), inv.c.ingredient_id == bindparam("b_ing"))
+        .values(quantity=inv.c.quantity + bindparam("b_delta")),
+        [{"b_shop": shop_id, "b_ing": ing, "b_delta": d} for ing, d in deltas.items()],
+    )
+    now = datetime.utcnow()
+    db.session.execute(insert(StockMovement), [
+        {"shop_id": shop_id, "ingredient_id": ing, "order_id": order_id, "delta": d, "reason": reason, "created_at": now}
+        for ing, d in deltas.items()
+    ])
+
+
+def deduct_for_order(order):
+    need = required_stock(order)
+    apply_movements(order.shop_id, {ing: -qty for ing, qty in need.items()}, "SALE", order.id)
+
+
+def stock_drift(shop_id: int | None = None, tolerance: float = 1e-6) -> list:
+    """Inventory rows whose quantity differs from their ledger balance:
+    [(shop_id, ingredient_id, on_hand, ledger_balance)]."""
+    ledger = (
+        db.session.query(StockMovement.shop_id, StockMovement.ingredient_id, func.sum(StockMovement.delta).label("balance"))
+        .group_by(StockMovement.shop_id, StockMovement.ingredient_id)
+        .subquery()
+    )
+    q = db.session.query(
+        Inventory.shop_id, Inventory.ingredient_id, Inventory.quantity, func.coalesce(ledger.c.balance, 0.0)
+    ).outerjoin(ledger, (ledger.c.shop_id == Inventory.shop_id) & (ledger.c.ingredient_id == Inventory.ingredient_id))
+    if shop_id is not None:
+        q = q.filter(Inventory.shop_id == shop_id)
+    return [r for r in q if abs((r[2] or 0.0) - r[3]) > tolerance]
+
+
+def rebuild_stock(shop_id: int | None = None) -> int:
+    """Reset drifting inventory rows to their ledger balance."""
+    drift = stock_drift(shop_id)
+    inv = Inventory.__table__
+    if drift:
+        db.session.execute(
+            update(inv)
+            .where(inv.c.shop_id == bindparam("b_shop"), inv.c.ingredient_id == bindparam("b_ing"))
+            .values(quantity=bindparam("b_qty")),
+            [{"b_shop": s, "b_ing": i, "b_qty": bal} for s, i, _, bal in drift],
+        )
+    db.session.commit()
+    return len(drift)
+
+
+def adopt_stock(shop_id: int | None = None) -> int:
+    """Write ADJUST movements so the ledger matches current inventory
+    (stock that predates the ledger, or after a physical count)."""
+    drift = stock_drift(shop_id)
+    now = datetime.utcnow()
+    if drift:
+        db.session.execute(insert(StockMovement), [
+            {"shop_id": s, "ingredient_id": i, "order_id": None, "delta": (qty or 0.0) - bal, "reason": "ADJUST", "created_at": now}
+            for s, i, qty, bal in drift
+        ])
+    db.session.commit()
+    return len(drift)
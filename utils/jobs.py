@@ -0,0 +1,235 @@
+"""
+Embedded job queue for slow side effects, backed by the `job` table.
+
+`enqueue()` adds a Job row to the current transaction, so the job exists
+if and only if the change that needs it commits. A worker claims queued
+rows with a conditional UPDATE (safe with several workers), runs the
+handler and marks the row DONE in the handler's own transaction, so a job's
+database writes are applied exactly once. Failures are retried with
+exponential backoff up to `max_attempts`, then left as FAILED with the
+error for inspection (`flask jobs-status`).
+
+`JOB_MODE` picks who runs the jobs:
+  - `thread` (default): a background thread in each web process, woken
+    right after a commit that queued work;
+  - `worker`: only `flask --app app jobs-worker` processes;
+  - `inline`: the handler runs immediately inside the caller's
+    transaction (old synchronous behaviour; handy for tests).
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app, has_request_context
+from sqlalchemy import event as sa_event, func, update
+from sqlalchemy.orm import Session
+
+from models import db, Job
+from utils.metrics import Histogram, CounterMetric, LATENCY_BUCKETS, register
+
+JOB_WAIT_SECONDS = Histogram("pos_job_wait_seconds", "Time from enqueue (or retry time) to start.", ("job",),
+                             LATENCY_BUCKETS + (30.0, 60.0, 300.0))
+JOB_RUN_SECONDS = Histogram("pos_job_run_seconds", "Job handler run time.", ("job",))
+JOBS = CounterMetric("pos_jobs_total", "Finished job attempts by outcome (done/retry/failed/lost).", ("job", "outcome"))
+register(JOB_WAIT_SECONDS, JOB_RUN_SECONDS, JOBS)
+
+HANDLERS = {}
+VISIBILITY_TIMEOUT = timedelta(minutes=5)  # RUNNING longer than this = worker died
+
+
+def job(name: str):
+    """Register `fn(payload: dict)` as the handler for jobs called `name`.
+    Handlers use db.session and must not commit."""
+    def deco(fn):
+        HANDLERS[name] = fn
+        return fn
+    return deco
+
+
+def enqueue(name: str, payload: dict | None = None, shop_id: int | None = None, delay: float = 0,
+            max_attempts: int = 5):
+    """Queue `name` in the current transaction (the caller commits)."""
+    if name not in HANDLERS:
+        raise KeyError(f"no job handler registered for {name!r}")
+    payload = payload or {}
+    if current_app.config.get("JOB_MODE") == "inline":
+        HANDLERS[name](payload)
+        return None
+    j = Job(shop_id=shop_id, name=name, payload=json.dumps(payload, ensure_ascii=False), status="QUEUED",
+            attempts=0, max_attempts=max_attempts, run_at=datetime.utcnow() + timedelta(seconds=delay),
+            created_at=datetime.utcnow())
+    db.session.add(j)
+    db.session.info["jobs_queued"] = True
+    return j
+
+
+def requeue_stale() -> int:
+    """Give back RUNNING jobs whose worker died mid-run (caller commits)."""
+    return db.session.execute(
+        update(Job).where(Job.status == "RUNNING", Job.locked_at < datetime.utcnow() - VISIBILITY_TIMEOUT)
+        .values(status="QUEUED", locked_by=None, locked_at=None)
+    ).rowcount
+
+
+def _claim(worker_id: str, batch: int) -> list:
+    now = datetime.utcnow()
+    ids = [i for (i,) in db.session.query(Job.id).filter(Job.status == "QUEUED", Job.run_at <= now)
+           .order_by(Job.run_at, Job.id).limit(batch)]
+    if not ids:
+        db.session.rollback()
+        return []
+    claimed = []
+    for job_id in ids:
+        n = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == "QUEUED")
+            .values(status="RUNNING", locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        ).rowcount
+        if n:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def _run_one(job_id: int, worker_id: str) -> bool:
+    j = db.session.get(Job, job_id)
+    if j is None or j.status != "RUNNING" or j.locked_by != worker_id:
+        db.session.rollback()
+        return False
+    name, payload, queued_at = j.name, json.loads(j.payload or "{}"), j.run_at
+    JOB_WAIT_SECONDS.observe(max(0.0, (datetime.utcnow() - queued_at).total_seconds()), name)
+    started = time.perf_counter()
+    try:
+        HANDLERS[name](payload)
+        # handler's writes and DONE together, only while this worker still
+        # holds the job (requeue_stale may have handed it to another one)
+        owned = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == "RUNNING", Job.locked_by == worker_id)
+            .values(status="DONE", finished_at=datetime.utcnow(), last_error=None, locked_by=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if owned:
+            db.session.commit()
+            outcome = "done"
+        else:
+            db.session.rollback()
+            outcome = "lost"
+            current_app.logger.warning("job %s #%s: lock lost to another worker, changes discarded", name, job_id)
+    except Exception:
+        db.session.rollback()
+        err = traceback.format_exc(limit=5)
+        j = db.session.get(Job, job_id)
+        if j is None or j.status != "RUNNING" or j.locked_by != worker_id:
+            outcome = "lost"  # the job's current holder decides
+        else:
+            if j.attempts >= j.max_attempts:
+                j.status, j.finished_at = "FAILED", datetime.utcnow()
+                outcome = "failed"
+            else:
+                j.status, j.run_at = "QUEUED", datetime.utcnow() + timedelta(seconds=min(2 ** j.attempts, 600))
+                outcome = "retry"
+            j.last_error, j.locked_by, j.locked_at = err[-4000:], None, None
+        db.session.commit()
+        current_app.logger.warning("job %s #%s %s: %s", name, job_id, outcome, err.strip().splitlines()[-1])
+    JOB_RUN_SECONDS.observe(time.perf_counter() - started, name)
+    JOBS.inc(name, outcome)
+    return outcome == "done"
+
+
+def work(worker_id: str | None = None, batch: int = 20) -> int:
+    """Claim and run one batch of due jobs (app context required).
+    Returns the number of jobs attempted."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    ids = _claim(worker_id, batch)
+    for job_id in ids:
+        _run_one(job_id, worker_id)
+    return len(ids)
+
+
+def run_worker(app, poll: float = 1.0, batch: int = 20, once: bool = False, wake: threading.Event | None = None):
+    last_reap = 0.0
+    while True:
+        with app.app_context():
+            try:
+                if time.monotonic() - last_reap > 60:
+                    requeue_stale()
+                    db.session.commit()
+                    last_reap = time.monotonic()
+                n = work(batch=batch)
+            except Exception:
+                app.logger.exception("job worker loop failed")
+                n = 0
+            finally:
+                db.session.remove()
+        if once and n == 0:
+            return
+        if n == 0:
+            if wake is not None:
+                wake.wait(poll)
+                wake.clear()
+            else:
+                time.sleep(poll)
+
+
+def queue_stats() -> list:
+    """[(name, status, count, oldest run_at)]"""
+    return (db.session.query(Job.name, Job.status, func.count(Job.id), func.min(Job.run_at))
+            .group_by(Job.name, Job.status).order_by(Job.name, Job.status).all())
+
+
+def prune_jobs(older_than: timedelta) -> int:
+    n = (Job.query.filter(Job.status == "DONE", Job.finished_at < datetime.utcnow() - older_than)
+         .delete(synchronize_session=False))
+    db.session.commit()
+    return n
+
+
+class _ThreadRunner:
+    def __init__(self, app, poll: float):
+        self.app, self.poll = app, poll
+        self.wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=run_worker, args=(self.app, self.poll),
+                                                     kwargs={"wake": self.wake}, name="jobs", daemon=True)
+                    self._thread.start()
+
+    def notify(self):
+        self.ensure_started()
+        self.wake.set()
+
+
+def _after_commit(session):
+    # wake this process's runner; CLI/worker commits are left to polling
+    if session.info.pop("jobs_queued", False) and has_request_context():
+        runner = current_app.extensions.get("jobs")
+        if runner is not None:
+            runner.notify()
+
+
+def _after_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("jobs_queued", None)
+
+
+def init_jobs(app):
+    mode = app.config.setdefault("JOB_MODE", "thread")
+    runner = _ThreadRunner(app, float(app.config.get("JOB_POLL_SECONDS", 1.0))) if mode == "thread" else None
+    app.extensions["jobs"] = runner
+    if runner is not None:
+        @app.before_request
+        def _jobs_runner():
+            # also picks up work queued before a restart
+            runner.ensure_started()
+    if not sa_event.contains(Session, "after_commit", _after_commit):
+        sa_event.listen(Session, "after_commit", _after_commit)
+        sa_event.listen(Session, "after_soft_rollback", _after_rollback)
@@ -0,0 +1,111 @@
+"""
+Paged back-office lists (members, menu, stock, categories, paid orders).
+
+Each `*_page` returns a `Page` of rows for one shop, optionally narrowed
+by a prefix search, and each `*_to_dict` is the row shape of the JSON
+variants under `/api/...`. Searches use the (shop_id, name/phone) indexes.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from models import db, Category, Ingredient, Inventory, Member, MenuItem, Order, Table
+from utils.archive import archived_months, paid_orders
+from utils.images import image_sources
+from utils.pagination import decode_cursor, keyset_page, prefix_match, DEFAULT_LIMIT
+
+
+def _dialect(session) -> str:
+    return session.get_bind().dialect.name
+
+
+def members_page(shop_id: int, q: str = "", cursor=None, limit: int = DEFAULT_LIMIT):
+    """Members by name; a numeric `q` searches phone prefixes instead."""
+    query = Member.query.filter(Member.shop_id == shop_id)
+    if q and q.isdigit():
+        query = query.filter(prefix_match(Member.phone, q, _dialect(db.session)))
+        return keyset_page(query, (Member.phone, Member.id), lambda m: (m.phone, m.id), cursor, (str, int), limit)
+    if q:
+        query = query.filter(prefix_match(Member.name, q, _dialect(db.session)))
+    return keyset_page(query, (Member.name, Member.id), lambda m: (m.name, m.id), cursor, (str, int), limit)
+
+
+def member_to_dict(m: Member) -> dict:
+    return {"id": m.id, "name": m.name, "phone": m.phone, "points": m.points}
+
+
+def menu_page(shop_id: int, q: str = "", cursor=None, limit: int = DEFAULT_LIMIT):
+    query = MenuItem.query.filter(MenuItem.shop_id == shop_id)
+    if q:
+        query = query.filter(prefix_match(MenuItem.name, q, _dialect(db.session)))
+    return keyset_page(query, (MenuItem.name, MenuItem.id), lambda i: (i.name, i.id), cursor, (str, int), limit)
+
+
+def menu_item_to_dict(i: MenuItem) -> dict:
+    sources = image_sources(i.image_url)
+    return {"id": i.id, "name": i.name, "price": i.price, "category_id": i.category_id, "image_url": i.image_url,
+            "thumb_url": sources["thumb"] if sources else None}
+
+
+def stock_page(shop_id: int, q: str = "", cursor=None, limit: int = DEFAULT_LIMIT):
+    """(Ingredient, Inventory | None) rows by ingredient name."""
+    query = (db.session.query(Ingredient, Inventory)
+             .outerjoin(Inventory, (Inventory.ingredient_id == Ingredient.id) & (Inventory.shop_id == shop_id))
+             .filter(Ingredient.shop_id == shop_id))
+    if q:
+        query = query.filter(prefix_match(Ingredient.name, q, _dialect(db.session)))
+    return keyset_page(query, (Ingredient.name, Ingredient.id), lambda r: (r[0].name, r[0].id), cursor, (str, int), limit)
+
+
+def stock_to_dict(row) -> dict:
+    ing, inv = row
+    return {"ingredient_id": ing.id, "name": ing.name, "unit": ing.unit, "quantity": inv.quantity if inv else None}
+
+
+def categories_page(shop_id: int, q: str = "", cursor=None, limit: int = DEFAULT_LIMIT):
+    query = Category.query.filter(Category.shop_id == shop_id)
+    if q:
+        query = query.filter(prefix_match(Category.name, q, _dialect(db.session)))
+    return keyset_page(query, (Category.name, Category.id), lambda c: (c.name, c.id), cursor, (str, int), limit)
+
+
+def category_to_dict(c: Category) -> dict:
+    return {"id": c.id, "name": c.name}
+
+
+def paid_orders_page(shop_id: int, start: date | None = None, end: date | None = None, cursor=None,
+                     limit: int = DEFAULT_LIMIT, session=None):
+    """Newest paid bills first, (Order, table name) rows; `end` is inclusive.
+    Pages come from the hot `order` table alone while it fills them; archived
+    months are only unioned in (up to the cursor) once it runs out."""
+    s = session or db.session
+    lo = datetime.combine(start, time.min) if start is not None else None
+    hi = datetime.combine(end + timedelta(days=1), time.min) if end is not None else None
+
+    def page(entity):
+        query = (s.query(entity, Table.name)
+                 .outerjoin(Table, Table.id == entity.table_id)
+                 .filter(entity.shop_id == shop_id, entity.status == "PAID"))
+        if lo is not None:
+            query = query.filter(entity.closed_at >= lo)
+        if hi is not None:
+            query = query.filter(entity.closed_at < hi)
+        return keyset_page(query, (entity.closed_at, entity.id), lambda r: (r[0].closed_at, r[0].id), cursor,
+                           (datetime, int), limit, descending=True)
+
+    hot = page(Order)
+    if hot.next_cursor is not None:
+        return hot
+    after = decode_cursor(cursor, (datetime, int))
+    upper = hi
+    if after is not None and after[0] is not None:
+        upper = min(hi or datetime.max, after[0] + timedelta(seconds=1))
+    if not archived_months(s, lo, upper):
+        return hot
+    return page(paid_orders(s, lo, upper))
+
+
+def paid_order_to_dict(row) -> dict:
+    o, table_name = row
+    return {"id": o.id, "table_id": o.table_id, "table": table_name, "total_amount": o.total_amount,
+            "created_at": o.created_at.isoformat() if o.created_at else None,
+            "closed_at": o.closed_at.isoformat() if o.closed_at else None}
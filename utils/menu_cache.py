@@ -0,0 +1,143 @@
+"""
+In-process cache of per-shop menu snapshots for the public QR pages.
+
+A snapshot holds everything `/p/<token>` renders (shop name, categories,
+items, prices, image URLs). Each shop has a version counter; the staff
+views that edit the menu call `bump_menu_version()`, which drops the
+snapshot so the next scan rebuilds it. Snapshots also expire after
+`MENU_CACHE_TTL` seconds, which bounds staleness on other workers.
+"""
+
+import hashlib
+import json
+import secrets
+import string
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import astuple, dataclass, field
+
+from flask import current_app
+
+from models import db, Category, MenuItem, Shop, Table
+
+DEFAULT_TTL = 60.0
+TOKEN_CACHE_SIZE = 10000
+
+
+@dataclass(frozen=True)
+class MenuEntry:
+    id: int
+    category_id: int | None
+    name: str
+    price: float
+    image_url: str | None
+
+
+@dataclass(frozen=True)
+class CategoryEntry:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class MenuSnapshot:
+    shop_id: int
+    version: int
+    shop_name: str
+    categories: tuple
+    items: tuple
+    etag: str
+    items_by_id: dict = field(repr=False)
+    items_by_cat: dict = field(repr=False)
+
+
+@dataclass(frozen=True)
+class TableRef:
+    id: int
+    shop_id: int
+    name: str
+    token: str
+
+
+_lock = threading.Lock()
+_versions: dict = {}    # shop_id -> int
+_snapshots: dict = {}   # shop_id -> (expires_at, MenuSnapshot)
+_tokens = OrderedDict()  # token -> TableRef
+
+
+def _ttl() -> float:
+    return float(current_app.config.get("MENU_CACHE_TTL", DEFAULT_TTL))
+
+
+def menu_version(shop_id: int) -> int:
+    with _lock:
+        return _versions.get(shop_id, 0)
+
+
+def bump_menu_version(shop_id: int) -> int:
+    with _lock:
+        v = _versions[shop_id] = _versions.get(shop_id, 0) + 1
+        _snapshots.pop(shop_id, None)
+    return v
+
+
+def _build(shop_id: int, version: int) -> MenuSnapshot:
+    shop = db.session.get(Shop, shop_id)
+    cats = tuple(CategoryEntry(c.id, c.name) for c in
+                 db.session.query(Category.id, Category.name).filter(Category.shop_id == shop_id).order_by(Category.id))
+    items = tuple(MenuEntry(*row) for row in
+                  db.session.query(MenuItem.id, MenuItem.category_id, MenuItem.name, MenuItem.price, MenuItem.image_url)
+                  .filter(MenuItem.shop_id == shop_id).order_by(MenuItem.id))
+    items_by_cat = {c.id: [] for c in cats}
+    for it in items:
+        items_by_cat.setdefault(it.category_id, []).append(it)
+    # content hash, so every worker computes the same ETag for the same menu
+    digest = hashlib.sha1(json.dumps(
+        [shop.name if shop else "", [astuple(c) for c in cats], [astuple(i) for i in items]],
+        ensure_ascii=False, default=str,
+    ).encode("utf-8")).hexdigest()[:20]
+    return MenuSnapshot(
+        shop_id=shop_id, version=version, shop_name=shop.name if shop else "",
+        categories=cats, items=items, etag=digest,
+        items_by_id={it.id: it for it in items}, items_by_cat=items_by_cat,
+    )
+
+
+def get_menu(shop_id: int) -> MenuSnapshot:
+    now = time.monotonic()
+    with _lock:
+        version = _versions.get(shop_id, 0)
+        hit = _snapshots.get(shop_id)
+    if hit and hit[0] > now and hit[1].version == version:
+        return hit[1]
+    snap = _build(shop_id, version)
+    with _lock:
+        if _versions.get(shop_id, 0) == version:
+            _snapshots[shop_id] = (now + _ttl(), snap)
+    return snap
+
+
+def new_table_token(n: int = 16) -> str:
+    """A fresh self-order token for a table (used in /p/<token> and the QR)."""
+    alphabet = string.ascii_letters + string.digits
+    return "".join(secrets.choice(alphabet) for _ in range(n))
+
+
+def resolve_table_token(token: str) -> TableRef | None:
+    """token -> TableRef. Tokens never change once issued, so hits are
+    kept until evicted by size."""
+    with _lock:
+        ref = _tokens.get(token)
+        if ref is not None:
+            _tokens.move_to_end(token)
+            return ref
+    row = db.session.query(Table.id, Table.shop_id, Table.name, Table.token).filter(Table.token == token).first()
+    if row is None:
+        return None
+    ref = TableRef(*row)
+    with _lock:
+        _tokens[token] = ref
+        while len(_tokens) > TOKEN_CACHE_SIZE:
+            _tokens.popitem(last=False)
+    return ref
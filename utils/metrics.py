@@ -0,0 +1,219 @@
+"""
+Request instrumentation exposed as Prometheus text on `/metrics`.
+
+`init_metrics(app)` times every request per endpoint and, through
+SQLAlchemy engine events, counts the SQL statements each request runs and
+the time spent in them. Template renders and QR renders (utils/promptpay)
+get their own histograms. Numbers are per process; with several gunicorn
+workers, scrape each one or aggregate upstream.
+
+With `SLOW_REQUEST_MS` set, any request slower than that is logged with
+its SQL statements grouped by text, so an N+1 loop shows up as one
+statement repeated many times.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from flask import Response, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SLOW_LOG_MAX_STATEMENTS = 500
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> list:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(k, list(v)) for k, v in series]
+        for values, s in series:
+            base = _labels(self.labels, values)
+            for b, n in zip(self.buckets, s):
+                out.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + (_num(b),))} {n}")
+            out.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + ('+Inf',))} {s[-1]}")
+            out.append(f"{self.name}_sum{base} {_num(s[-2])}")
+            out.append(f"{self.name}_count{base} {s[-1]}")
+        return out
+
+
+class CounterMetric:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._lock = threading.Lock()
+        self._values = Counter()
+
+    def inc(self, *label_values, amount: int = 1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self) -> list:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in items]
+        return out
+
+
+class Gauge:
+    """Read at scrape time from a callback (`kind="counter"` for running totals
+    kept elsewhere, e.g. cache hits)."""
+
+    def __init__(self, name: str, help: str, fn, kind: str = "gauge"):
+        self.name, self.help, self.fn, self.kind = name, help, fn, kind
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {_num(self.fn())}"]
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values)) + "}"
+
+
+REQUEST_SECONDS = Histogram("pos_request_duration_seconds", "Request latency by endpoint.", ("endpoint", "method"))
+REQUESTS = CounterMetric("pos_requests_total", "Requests by endpoint and status code.", ("endpoint", "status"))
+SQL_STATEMENTS = Histogram("pos_request_sql_statements", "SQL statements executed per request.", ("endpoint",), COUNT_BUCKETS)
+SQL_SECONDS = Histogram("pos_request_sql_seconds", "Time spent in SQL per request.", ("endpoint",))
+TEMPLATE_SECONDS = Histogram("pos_template_render_seconds", "Jinja template render time.", ("template",))
+QR_RENDER_SECONDS = Histogram("pos_qr_render_seconds", "PromptPay QR PNG render time (cache misses only).")
+SLOW_REQUESTS = CounterMetric("pos_slow_requests_total", "Requests over SLOW_REQUEST_MS.", ("endpoint",))
+
+_registry = [REQUEST_SECONDS, REQUESTS, SQL_STATEMENTS, SQL_SECONDS, TEMPLATE_SECONDS, QR_RENDER_SECONDS, SLOW_REQUESTS]
+
+
+def register(*metrics):
+    """Add metrics defined in other modules to the /metrics output."""
+    _registry.extend(metrics)
+
+
+def gauge(name: str, help: str, fn, kind: str = "gauge"):
+    register(Gauge(name, help, fn, kind))
+
+
+def render() -> str:
+    lines = []
+    for m in _registry:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ("started", "sql_count", "sql_seconds", "statements", "_sql_started")
+
+    def __init__(self, keep_statements: bool):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.statements = [] if keep_statements else None
+        self._sql_started = []
+
+
+def _stats():
+    return g.get("_metrics") if has_request_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats()
+    if stats is not None:
+        stats._sql_started.append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats()
+    if stats is None or not stats._sql_started:
+        return
+    elapsed = time.perf_counter() - stats._sql_started.pop()
+    stats.sql_count += 1
+    stats.sql_seconds += elapsed
+    if stats.statements is not None and len(stats.statements) < SLOW_LOG_MAX_STATEMENTS:
+        stats.statements.append((statement, elapsed))
+
+
+def _endpoint() -> str:
+    return request.endpoint or "unmatched"
+
+
+def init_metrics(app):
+    slow_ms = float(app.config.get("SLOW_REQUEST_MS") or 0)
+
+    @app.before_request
+    def _start_request():
+        g._metrics = RequestStats(keep_statements=slow_ms > 0)
+
+    @app.after_request
+    def _finish_request(response):
+        stats = g.pop("_metrics", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = _endpoint()
+        REQUEST_SECONDS.observe(elapsed, endpoint, request.method)
+        REQUESTS.inc(endpoint, str(response.status_code))
+        SQL_STATEMENTS.observe(stats.sql_count, endpoint)
+        SQL_SECONDS.observe(stats.sql_seconds, endpoint)
+        if slow_ms and elapsed * 1000.0 >= slow_ms:
+            SLOW_REQUESTS.inc(endpoint)
+            _log_slow(app, endpoint, elapsed, stats)
+        return response
+
+    def _template_started(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault("_template_started", []).append(time.perf_counter())
+
+    def _template_done(sender, template, context, **extra):
+        started = g.get("_template_started") if has_request_context() else None
+        if started:
+            TEMPLATE_SECONDS.observe(time.perf_counter() - started.pop(), template.name or "<string>")
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_done, app, weak=False)
+
+    if not sa_event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        sa_event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        sa_event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _log_slow(app, endpoint: str, elapsed: float, stats: RequestStats):
+    grouped = Counter()
+    seconds = Counter()
+    for statement, t in stats.statements or ():
+        key = " ".join(statement.split())
+        grouped[key] += 1
+        seconds[key] += t
+    lines = [f"{n}x {seconds[s] * 1000.0:.1f}ms {s[:300]}" for s, n in grouped.most_common()]
+    app.logger.warning(
+        "slow request %s %s %s: %.1fms, %d SQL statements (%.1fms)%s",
+        request.method, request.full_path.rstrip("?"), endpoint, elapsed * 1000.0,
+        stats.sql_count, stats.sql_seconds * 1000.0, "".join("\n  " + l for l in lines),
+    )
+
+
+def metrics_response() -> Response:
+    return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,162 @@
+"""
+Versioned schema migrations (replaces calling `db.create_all()` at boot).
+
+Each step is a function of a SQLAlchemy Connection and is written to be
+idempotent, so a database created by an older `db.create_all()` can be
+brought forward from any point. Applied versions are recorded in
+`schema_version`. To change the schema, append a step to MIGRATIONS; never
+edit or reorder existing ones.
+
+    flask --app app db-upgrade
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, Cart, CartItem, Ingredient, Job, Member, MenuItem, OrderArchiveMonth, OrderSubmission, Receipt, SchemaVersion, StockMovement
+
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+def _create_indexes(conn, *tables):
+    for t in tables or db.metadata.tables.values():
+        for idx in t.indexes:
+            idx.create(conn, checkfirst=True)
+
+
+def m0001_baseline(conn):
+    # tables as they exist in the models (checkfirst: older installs keep theirs)
+    db.metadata.create_all(conn, checkfirst=True)
+
+
+def m0002_order_item_note(conn):
+    _add_column(conn, "order_item", "note", "VARCHAR(200)")
+
+
+def _mysql_open_table_guard(conn):
+    # MySQL ignores the partial index's WHERE (a plain UNIQUE(table_id) would
+    # allow one bill per table ever); index a column that is NULL unless OPEN
+    if conn.dialect.name != "mysql":
+        return
+    for idx in inspect(conn).get_indexes("order"):
+        if idx["name"] == "uq_order_open_table" and idx["column_names"] == ["table_id"]:
+            conn.execute(text("DROP INDEX uq_order_open_table ON `order`"))
+    if "open_table_id" not in {c["name"] for c in inspect(conn).get_columns("order")}:
+        conn.execute(text(
+            "ALTER TABLE `order` ADD COLUMN open_table_id INTEGER "
+            "AS (CASE WHEN status = 'OPEN' THEN table_id END) STORED, "
+            "ADD UNIQUE INDEX uq_order_open_table (open_table_id)"
+        ))
+
+
+def m0003_hot_path_indexes(conn):
+    # Order(shop_id, status[, closed_at]), Order(shop_id, table_id, status),
+    # OrderItem.order_id, Recipe.menu_item_id, Inventory(shop_id, ingredient_id),
+    # Member(shop_id, phone), MenuItem/Category/Table/Ingredient by shop_id,
+    # and the one-OPEN-order-per-table guard
+    dup = conn.execute(text(
+        "SELECT table_id FROM \"order\" WHERE status = 'OPEN' AND table_id IS NOT NULL "
+        "GROUP BY table_id HAVING COUNT(*) > 1"
+    )).scalars().all()
+    if dup:
+        raise RuntimeError(f"tables {dup} have more than one OPEN order; close or merge them, then re-run db-upgrade")
+    _create_indexes(conn)
+    _mysql_open_table_guard(conn)
+
+
+def m0004_listing_indexes(conn):
+    # (shop_id, name) on member / menu_item / ingredient for paged lists and prefix search
+    _create_indexes(conn, Member.__table__, MenuItem.__table__, Ingredient.__table__)
+
+
+def m0005_stock_movement_created_index(conn):
+    _create_indexes(conn, StockMovement.__table__)
+
+
+def m0006_order_submission(conn):
+    OrderSubmission.__table__.create(conn, checkfirst=True)
+
+
+def m0007_job(conn):
+    Job.__table__.create(conn, checkfirst=True)
+
+
+def m0008_receipt(conn):
+    Receipt.__table__.create(conn, checkfirst=True)
+
+
+def m0009_cart(conn):
+    Cart.__table__.create(conn, checkfirst=True)
+    CartItem.__table__.create(conn, checkfirst=True)
+
+
+def m0010_order_archive(conn):
+    # rows that outlive their bill (payments, stock movements, submissions,
+    # receipts) stop referencing order.id so old bills can be archived;
+    # SQLite doesn't enforce these constraints and can't drop them
+    if conn.dialect.name in ("postgresql", "mysql"):
+        drop = "DROP CONSTRAINT" if conn.dialect.name == "postgresql" else "DROP FOREIGN KEY"
+        quote = conn.dialect.identifier_preparer.quote
+        for table in ("payment", "stock_movement", "order_submission", "receipt"):
+            for fk in inspect(conn).get_foreign_keys(table):
+                if fk["referred_table"] == "order" and fk.get("name"):
+                    conn.execute(text(f"ALTER TABLE {quote(table)} {drop} {quote(fk['name'])}"))
+    OrderArchiveMonth.__table__.create(conn, checkfirst=True)
+
+
+def m0011_mysql_open_table_guard(conn):
+    # MySQL databases that ran an older m0003 have the plain unique index
+    _mysql_open_table_guard(conn)
+
+
+def m0012_name_sort_indexes(conn):
+    # Postgres only: (shop_id, name, id) with the default opclass for the list ORDER BY
+    _create_indexes(conn, Member.__table__, MenuItem.__table__, Ingredient.__table__)
+
+
+MIGRATIONS = [
+    (1, "baseline", m0001_baseline),
+    (2, "order_item.note", m0002_order_item_note),
+    (3, "hot path indexes", m0003_hot_path_indexes),
+    (4, "listing indexes", m0004_listing_indexes),
+    (5, "stock_movement (shop_id, created_at) index", m0005_stock_movement_created_index),
+    (6, "order_submission", m0006_order_submission),
+    (7, "job", m0007_job),
+    (8, "receipt", m0008_receipt),
+    (9, "cart, cart_item", m0009_cart),
+    (10, "order archive", m0010_order_archive),
+    (11, "one OPEN order per table on MySQL", m0011_mysql_open_table_guard),
+    (12, "name sort indexes", m0012_name_sort_indexes),
+]
+
+
+def current_version(engine) -> int:
+    if not inspect(engine).has_table(SchemaVersion.__tablename__):
+        return 0
+    with engine.connect() as conn:
+        return conn.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
+
+
+def upgrade(engine, target: int | None = None, log=print) -> list:
+    """Apply pending migrations in order, each in its own transaction."""
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+    done = current_version(engine)
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version <= done or (target is not None and version > target):
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(db.insert(SchemaVersion).values(version=version, name=name, applied_at=datetime.utcnow()))
+        log(f"applied migration {version:04d} {name}")
+        applied.append(version)
+    return applied
+
+
+def pending(engine) -> list:
+    done = current_version(engine)
+    return [(v, n) for v, n, _ in MIGRATIONS if v > done]
@@ -0,0 +1,189 @@
+"""
+Order service: every mutation of an open bill happens in one transaction.
+
+`add_to_table` finds or opens the table's OPEN order, inserts the new lines,
+marks the table BUSY and adds the line amounts to `Order.total_amount` with
+a SQL-side increment, so concurrent devices never overwrite each other's
+total. The caller commits once. The partial unique index
+`uq_order_open_table` guarantees at most one OPEN order per table; losing
+that race is handled by re-reading the winner's order.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from models import db, MenuItem, Order, OrderItem, OrderSubmission, Table
+from utils.cart import CartLine
+from utils.events import publish
+
+
+def find_open_order(shop_id: int, table_id: int) -> Order | None:
+    return Order.query.filter_by(shop_id=shop_id, table_id=table_id, status="OPEN").first()
+
+
+def open_order(shop_id: int, table_id: int) -> Order:
+    """The table's OPEN order, created (and the table marked BUSY) if needed.
+    Call it first in the transaction."""
+    order = find_open_order(shop_id, table_id)
+    if order:
+        return order
+    order = Order(shop_id=shop_id, table_id=table_id, status="OPEN", created_at=datetime.utcnow(), total_amount=0.0)
+    db.session.add(order)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # another device opened this table's bill first; nothing else has
+        # been written in this transaction yet, so a full rollback is safe
+        db.session.rollback()
+        order = find_open_order(shop_id, table_id)
+        if order is None:
+            raise
+        return order
+    db.session.execute(
+        update(Table).where(Table.id == table_id).values(status="BUSY")
+        .execution_options(synchronize_session=False)
+    )
+    publish(shop_id, "order_created", {"order_id": order.id, "table_id": table_id})
+    return order
+
+
+def add_lines(order: Order, lines) -> float:
+    """Insert `lines` (objects with id/name/price/qty/note, e.g. CartLine) into
+    `order` and bump its total by their amount. Returns the amount added."""
+    lines = [l for l in lines if l.qty > 0]
+    if not lines:
+        return 0.0
+    rows = [{"order_id": order.id, "menu_item_id": l.id, "quantity": l.qty, "unit_price": l.price, "note": l.note}
+            for l in lines]
+    if db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        ids = db.session.scalars(insert(OrderItem).returning(OrderItem.id, sort_by_parameter_order=True), rows).all()
+    else:  # e.g. MySQL: no RETURNING, the ORM inserts row by row
+        items = [OrderItem(**r) for r in rows]
+        db.session.add_all(items)
+        db.session.flush()
+        ids = [it.id for it in items]
+    amount = sum(l.price * l.qty for l in lines)
+    db.session.execute(
+        update(Order).where(Order.id == order.id).values(total_amount=Order.total_amount + amount)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(order, ["total_amount", "items"])
+    publish(order.shop_id, "items_added", {
+        "order_id": order.id, "table_id": order.table_id,
+        "items": [{"id": i, "name": l.name, "qty": l.qty, "note": l.note} for i, l in zip(ids, lines)],
+    })
+    return amount
+
+
+def add_to_table(shop_id: int, table_id: int, lines) -> Order:
+    order = open_order(shop_id, table_id)
+    add_lines(order, lines)
+    return order
+
+
+SUBMISSION_KEY_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def submit_once(shop_id: int, table_id: int, key: str, lines) -> tuple:
+    """Add `lines` to the table's bill once per client-generated `key` and
+    commit. Returns (OrderSubmission, duplicate); a retry of a submit that
+    already went through gets the original row back and adds nothing."""
+    done = OrderSubmission.query.filter_by(shop_id=shop_id, key=key).first()
+    if done:
+        return done, True
+    order = open_order(shop_id, table_id)
+    sub = OrderSubmission(shop_id=shop_id, table_id=table_id, key=key, order_id=order.id, created_at=datetime.utcnow())
+    db.session.add(sub)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # the same submit raced in on another connection and won
+        db.session.rollback()
+        done = OrderSubmission.query.filter_by(shop_id=shop_id, key=key).first()
+        if done is None:
+            raise
+        return done, True
+    sub.amount = add_lines(order, lines)
+    sub.line_count = len(lines)
+    db.session.commit()
+    return sub, False
+
+
+def prune_submissions(older_than: timedelta) -> int:
+    """Forget idempotency keys older than `older_than` (clients only retry
+    for minutes). Returns the number of rows deleted."""
+    n = (OrderSubmission.query.filter(OrderSubmission.created_at < datetime.utcnow() - older_than)
+         .delete(synchronize_session=False))
+    db.session.commit()
+    return n
+
+
+MAX_LINES = 100
+MAX_QTY = 999
+
+
+class LineError(ValueError):
+    def __init__(self, errors: list):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def resolve_lines(shop_id: int, raw_lines) -> list:
+    """Validate a batch of `{item_id, qty, note}` dicts against the shop's
+    menu with one query. Returns CartLines or raises LineError."""
+    if not isinstance(raw_lines, list) or not raw_lines:
+        raise LineError(["lines must be a non-empty list"])
+    if len(raw_lines) > MAX_LINES:
+        raise LineError([f"at most {MAX_LINES} lines per request"])
+    errors, parsed = [], []
+    for n, raw in enumerate(raw_lines):
+        try:
+            item_id, qty = int(raw["item_id"]), int(raw.get("qty", 1))
+        except (TypeError, ValueError, KeyError):
+            errors.append(f"line {n}: item_id and qty must be integers")
+            continue
+        note = raw.get("note") or None
+        if note is not None and (not isinstance(note, str) or len(note) > 200):
+            errors.append(f"line {n}: note must be text up to 200 characters")
+            continue
+        if not 1 <= qty <= MAX_QTY:
+            errors.append(f"line {n}: qty must be between 1 and {MAX_QTY}")
+            continue
+        parsed.append((n, item_id, qty, note.strip() if note else None))
+    ids = {item_id for _, item_id, _, _ in parsed}
+    menu = {
+        r.id: r for r in db.session.query(MenuItem.id, MenuItem.name, MenuItem.price)
+        .filter(MenuItem.shop_id == shop_id, MenuItem.id.in_(ids))
+    } if ids else {}
+    lines = []
+    for n, item_id, qty, note in parsed:
+        it = menu.get(item_id)
+        if it is None:
+            errors.append(f"line {n}: unknown menu item {item_id}")
+            continue
+        lines.append(CartLine(it.id, it.name, it.price, qty, note))
+    if errors:
+        raise LineError(errors)
+    return lines
+
+
+def order_to_dict(order: Order | None) -> dict | None:
+    if order is None:
+        return None
+    items = (OrderItem.query.filter_by(order_id=order.id)
+             .options(joinedload(OrderItem.menu_item)).order_by(OrderItem.id).all())
+    return {
+        "order_id": order.id,
+        "table_id": order.table_id,
+        "status": order.status,
+        "total_amount": order.total_amount,
+        "items": [
+            {"id": it.id, "menu_item_id": it.menu_item_id, "name": it.menu_item.name if it.menu_item else None,
+             "qty": it.quantity, "unit_price": it.unit_price, "note": it.note}
+            for it in items
+        ],
+    }
@@ -0,0 +1,90 @@
+"""
+Keyset pagination and prefix search for the back-office lists.
+
+A page is the next `limit` rows after an opaque cursor holding the sort
+key of the last row shown, so page 500 costs the same as page 1 (no
+OFFSET) and rows inserted meanwhile don't shift the pages. Sort keys
+always end in the primary key to make them unique.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from sqlalchemy import literal, tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+@dataclass(frozen=True)
+class Page:
+    rows: list
+    next_cursor: str | None
+
+
+def _plain(v):
+    return v.isoformat() if isinstance(v, (date, datetime)) else v
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([_plain(v) for v in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None, types: tuple) -> tuple | None:
+    """Cursor -> sort key values converted with `types`; None if missing or
+    malformed (a bad cursor restarts from the first page)."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            return None
+        return tuple(None if v is None else (datetime.fromisoformat(v) if t is datetime else t(v))
+                     for v, t in zip(values, types))
+    except (ValueError, TypeError):
+        return None
+
+
+def _after(columns: tuple, values: tuple, descending: bool):
+    # row-value comparison: one index range on SQLite >= 3.15 and Postgres
+    row, bound = tuple_(*columns), tuple_(*(literal(v) for v in values))
+    return row < bound if descending else row > bound
+
+
+def keyset_page(query, columns: tuple, key, cursor: str | None, types: tuple, limit: int = DEFAULT_LIMIT,
+                descending: bool = False) -> Page:
+    """One page of `query` ordered by `columns`. `key(row)` returns the
+    row's values for `columns` (used to build the next cursor)."""
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    after = decode_cursor(cursor, types)
+    if after is not None:
+        query = query.filter(_after(columns, after, descending))
+    query = query.order_by(*(c.desc() if descending else c.asc() for c in columns))
+    rows = query.limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return Page(rows, encode_cursor(key(rows[-1])) if more and rows else None)
+
+
+def prefix_match(column, prefix: str, dialect: str):
+    """Case-sensitive `column` starts with `prefix`, written so a plain
+    b-tree index on the column is used: GLOB on SQLite (its LIKE is
+    case-insensitive and skips the index), LIKE elsewhere (Postgres has a
+    varchar_pattern_ops index for this next to the default-opclass one the
+    ORDER BY uses)."""
+    if dialect == "sqlite":
+        escaped = "".join(f"[{ch}]" if ch in "*?[" else ch for ch in prefix)
+        return column.op("GLOB")(escaped + "*")
+    return column.startswith(prefix, autoescape=True)
+
+
+def page_args(args) -> tuple:
+    """(q, cursor, limit) from request args."""
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return (args.get("q") or "").strip(), args.get("after") or None, limit
@@ -3,9 +3,12 @@
 PromptPay QR generator (EMVCo-compliant) — Compatible with Thai banking apps.
 """
 
+from collections import OrderedDict
 from enum import Enum
-import qrcode
-import io, base64, re
+from functools import lru_cache
+import io, re, hashlib, threading, time
+
+from utils.metrics import QR_RENDER_SECONDS
 
 class PromptPayIDType(Enum):
     PHONE = 1
@@ -25,21 +28,93 @@ def _format_id(pp_id: str, kind: PromptPayIDType) -> str:
 def _tlv(tag: str, value: str) -> str:
     return f"{tag}{len(value):02d}{value}"
 
-def _crc16(payload: str) -> str:
-    crc = 0xFFFF
-    for c in payload.encode("utf-8"):
-        crc ^= (c << 8)
+def _make_crc_table() -> tuple:
+    table = []
+    for i in range(256):
+        crc = i << 8
         for _ in range(8):
             if (crc & 0x8000) != 0:
                 crc = ((crc << 1) ^ 0x1021) & 0xFFFF
             else:
                 crc = (crc << 1) & 0xFFFF
-    return f"{crc:04X}"
+        table.append(crc)
+    return tuple(table)
+
+_CRC_TABLE = _make_crc_table()  # CRC-16/CCITT-FALSE, poly 0x1021
+
+def _crc16_update(crc: int, data: bytes) -> int:
+    table = _CRC_TABLE
+    for c in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ c]
+    return crc
 
 def _sanitize_name(text: str, fallback: str = "PROMPTPAY"):
     text = (text or "").strip()
     return text if text else fallback
 
+class PromptPayTemplate:
+    """Payload builder for one merchant/receiver.
+
+    Everything except the amount (tag 54) and the reference (tag 62) is fixed
+    per merchant, so the fields before the amount are encoded once together
+    with their partial CRC state, and the fields between amount and
+    reference are kept pre-encoded.
+    """
+
+    def __init__(
+        self,
+        pp_id: str,
+        kind: PromptPayIDType,
+        merchant_name: str | None = None,
+        merchant_city: str | None = None,
+        dynamic: bool = True,
+    ):
+        pfi = _tlv("00", "01")
+        poi = _tlv("01", "12" if dynamic else "11")
+        guid = _tlv("00", "A000000677010111")
+        if kind == PromptPayIDType.PHONE:
+            acc = _tlv("01", _format_id(pp_id, kind))
+        else:
+            acc = _tlv("02", _format_id(pp_id, kind))
+        mai = _tlv("29", guid + acc)
+        currency = _tlv("53", "764")
+        country = _tlv("58", "TH")
+        m_name = _tlv("59", _sanitize_name(merchant_name, "PROMPTPAY"))
+        m_city = _tlv("60", _sanitize_name(merchant_city, "BANGKOK"))
+
+        self.dynamic = dynamic
+        self._prefix = pfi + poi + mai + currency
+        self._prefix_crc = _crc16_update(0xFFFF, self._prefix.encode("utf-8"))
+        self._middle = country + m_name + m_city
+        self._middle_bytes = self._middle.encode("utf-8")
+
+    @staticmethod
+    def _amount(amount: float | None) -> str:
+        return _tlv("54", f"{amount:.2f}") if amount is not None else ""
+
+    @staticmethod
+    def _suffix(reference: str | None) -> str:
+        addl = _tlv("62", _tlv("05", reference[:25])) if reference else ""
+        return addl + "6304"
+
+    def build(self, amount: float | None = None, reference: str | None = None) -> str:
+        txn_amt = self._amount(amount)
+        crc = _crc16_update(self._prefix_crc, txn_amt.encode("utf-8"))
+        crc = _crc16_update(crc, self._middle_bytes)
+        suffix = self._suffix(reference)
+        crc = _crc16_update(crc, suffix.encode("utf-8"))
+        return f"{self._prefix}{txn_amt}{self._middle}{suffix}{crc:04X}"
+
+@lru_cache(maxsize=1024)
+def get_template(
+    pp_id: str,
+    kind: PromptPayIDType,
+    merchant_name: str | None = None,
+    merchant_city: str | None = None,
+    dynamic: bool = True,
+) -> PromptPayTemplate:
+    return PromptPayTemplate(pp_id, kind, merchant_name, merchant_city, dynamic)
+
 def build_promptpay_payload(
     pp_id: str,
     kind: PromptPayIDType,
@@ -49,56 +124,80 @@ def build_promptpay_payload(
     reference: str | None = None,
     dynamic: bool | None = None,
 ) -> str:
-    pfi = _tlv("00", "01")
     if dynamic is None:
         dynamic = amount is not None
-    poi = _tlv("01", "12" if dynamic else "11")
+    return get_template(pp_id, kind, merchant_name, merchant_city, dynamic).build(amount, reference)
 
-    guid = _tlv("00", "A000000677010111")
-    if kind == PromptPayIDType.PHONE:
-        acc = _tlv("01", _format_id(pp_id, kind))
-    else:
-        acc = _tlv("02", _format_id(pp_id, kind))
-    mai = _tlv("29", guid + acc)
+class QRImageCache:
+    """LRU of rendered PNGs keyed by (payload, box_size), bounded by both
+    entry count and total bytes."""
 
-    currency = _tlv("53", "764")
-    txn_amt = _tlv("54", f"{amount:.2f}") if amount is not None else ""
-    country = _tlv("58", "TH")
+    def __init__(self, max_entries: int = 512, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
 
-    m_name = _tlv("59", _sanitize_name(merchant_name, "PROMPTPAY"))
-    m_city = _tlv("60", _sanitize_name(merchant_city, "BANGKOK"))
+    def get(self, key):
+        with self._lock:
+            png = self._data.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return png
 
-    addl = ""
-    if reference:
-        addl = _tlv("62", _tlv("05", reference[:25]))
+    def put(self, key, png: bytes):
+        if len(png) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._data[key] = png
+            self._bytes += len(png)
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted)
 
-    payload_wo_crc = pfi + poi + mai + currency + txn_amt + country + m_name + m_city + addl + "6304"
-    crc = _crc16(payload_wo_crc)
-    return payload_wo_crc + crc
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
 
-def build_promptpay_qr_png(
-    pp_id: str,
-    kind: PromptPayIDType,
-    amount: float | None = None,
-    merchant_name: str | None = None,
-    merchant_city: str | None = None,
-    reference: str | None = None,
-    dynamic: bool | None = None,
-    box_size: int = 8,
-) -> str:
-    data = build_promptpay_payload(
-        pp_id=pp_id,
-        kind=kind,
-        amount=amount,
-        merchant_name=merchant_name,
-        merchant_city=merchant_city,
-        reference=reference,
-        dynamic=dynamic,
-    )
-    qr = qrcode.QRCode(box_size=box_size, border=2)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    bio = io.BytesIO()
-    img.save(bio, format="PNG")
-    return base64.b64encode(bio.getvalue()).decode("utf-8")
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+qr_cache = QRImageCache()
+
+
+def payload_etag(payload: str, box_size: int = 8) -> str:
+    return hashlib.sha256(f"{box_size}:{payload}".encode("utf-8")).hexdigest()[:32]
+
+
+def render_qr_png(payload: str, box_size: int = 8) -> bytes:
+    """Raw PNG bytes for an EMV payload, served from `qr_cache` when possible."""
+    key = (payload, box_size)
+    png = qr_cache.get(key)
+    if png is None:
+        import qrcode  # loaded on first render, keeps app import fast
+
+        started = time.perf_counter()
+        qr = qrcode.QRCode(box_size=box_size, border=2)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        img = qr.make_image(fill_color="black", back_color="white")
+        bio = io.BytesIO()
+        img.save(bio, format="PNG")
+        png = bio.getvalue()
+        QR_RENDER_SECONDS.observe(time.perf_counter() - started)
+        qr_cache.put(key, png)
+    return png
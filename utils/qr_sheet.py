@@ -0,0 +1,163 @@
+"""
+Printable QR sheets for all tables of a shop.
+
+`ensure_tokens` gives every table of a shop a self-order token in one
+transaction. `render_sheet` draws one labelled card per table (QR +
+table name) in a process pool, since QR encoding and PIL drawing are CPU
+bound (both are imported on first use), then lays the cards out on A4
+pages as a multi-page PDF or a PNG of one page. Sheets are cached per
+process under `sheet_digest` (the layout and every table's name and
+token), so they are rebuilt only when a table is added, renamed or
+re-tokened; the same digest is the HTTP ETag, computed without rendering.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from models import db, Table
+from utils.menu_cache import new_table_token
+from utils.promptpay import QRImageCache
+
+DPI = 150
+PAGE = (1240, 1754)  # A4 at 150 dpi
+MARGIN = 60
+COLS, ROWS = 3, 4
+FORMATS = {"pdf": "application/pdf", "png": "image/png"}
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/tlwg/Loma.ttf",
+    "/usr/share/fonts/truetype/tlwg/Garuda.ttf",
+    "/usr/share/fonts/truetype/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # no Thai glyphs
+)
+
+sheet_cache = QRImageCache(max_entries=16, max_bytes=64 * 1024 * 1024)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def ensure_tokens(shop_id: int) -> list:
+    """All tables of the shop in the tables page's order, each with a token (one commit)."""
+    tables = Table.query.filter_by(shop_id=shop_id).order_by(Table.id).all()
+    missing = [t for t in tables if not t.token]
+    for t in missing:
+        t.token = new_table_token()
+    if missing:
+        db.session.commit()
+    return tables
+
+
+def find_font(path: str | None = None) -> str | None:
+    for p in ((path,) if path else ()) + FONT_CANDIDATES:
+        if p and os.path.exists(p):
+            return p
+    return None
+
+
+def _font(path: str | None, size: int):
+    from PIL import ImageFont
+
+    return ImageFont.truetype(path, size) if path else ImageFont.load_default(size)
+
+
+def _cell_size() -> tuple:
+    return (PAGE[0] - 2 * MARGIN) // COLS, (PAGE[1] - 2 * MARGIN) // ROWS
+
+
+def render_card(args) -> bytes:
+    """One card as PNG bytes: the QR for `url` with `title`/`subtitle` under
+    it. Runs in a pool worker, so it takes and returns plain values."""
+    import qrcode
+    from PIL import Image, ImageDraw
+
+    url, title, subtitle, font_path = args
+    w, h = _cell_size()
+    card = Image.new("L", (w, h), 255)
+    qr = qrcode.QRCode(border=2, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(url)
+    qr.make(fit=True)
+    qr.box_size = max(1, min(w - 40, h - 110) // (qr.modules_count + 2 * qr.border))  # whole pixels per module
+    img = qr.make_image(fill_color="black", back_color="white").get_image().convert("L")
+    side = img.size[0]
+    card.paste(img, ((w - side) // 2, 10))
+    draw = ImageDraw.Draw(card)
+    draw.rectangle((0, 0, w - 1, h - 1), outline=200)
+    for text, size, y in ((title, 40, side + 18), (subtitle, 22, side + 66)):
+        font = _font(font_path, size)
+        tw = draw.textlength(text, font=font)
+        draw.text(((w - tw) / 2, y), text, fill=0, font=font)
+    bio = io.BytesIO()
+    card.save(bio, format="PNG")
+    return bio.getvalue()
+
+
+def sheet_digest(shop_name: str, cards: list, fmt: str, page: int | None) -> str:
+    h = hashlib.sha256(f"{fmt}:{page}:{PAGE}:{COLS}x{ROWS}:{shop_name}".encode("utf-8"))
+    for url, title in cards:
+        h.update(f"\0{url}\0{title}".encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def _pages(pngs: list) -> list:
+    from PIL import Image
+
+    w, h = _cell_size()
+    per_page = COLS * ROWS
+    pages = []
+    for start in range(0, len(pngs), per_page):
+        page = Image.new("L", PAGE, 255)
+        for i, png in enumerate(pngs[start:start + per_page]):
+            r, c = divmod(i, COLS)
+            with Image.open(io.BytesIO(png)) as card:
+                page.paste(card, (MARGIN + c * w, MARGIN + r * h))
+        pages.append(page)
+    return pages or [Image.new("L", PAGE, 255)]
+
+
+def page_count(n_cards: int) -> int:
+    return max(1, -(-n_cards // (COLS * ROWS)))
+
+
+def render_sheet(shop_name: str, cards: list, fmt: str = "pdf", page: int | None = None,
+                 font_path: str | None = None, workers: int = 0) -> tuple:
+    """(digest, bytes) for `cards` = [(url, table name)]. A PDF holds every
+    page; a PNG is one page (`page`, 1-based). `workers` = 0 renders in
+    this process."""
+    digest = sheet_digest(shop_name, cards, fmt, page)
+    data = sheet_cache.get(digest)
+    if data is not None:
+        return digest, data
+    if fmt == "png":
+        per_page = COLS * ROWS
+        start = (max(1, page or 1) - 1) * per_page
+        cards = cards[start:start + per_page]
+    jobs = [(url, title, shop_name, font_path) for url, title in cards]
+    if workers and len(jobs) > 1:
+        pngs = list(_executor(workers).map(render_card, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        pngs = [render_card(j) for j in jobs]
+    pages = _pages(pngs)
+    bio = io.BytesIO()
+    if fmt == "pdf":
+        from PIL import Image
+
+        pages = [p.convert("1", dither=Image.Dither.NONE) for p in pages]
+        pages[0].save(bio, format="PDF", save_all=True, append_images=pages[1:], resolution=DPI)
+    else:
+        pages[0].save(bio, format="PNG", optimize=True)
+    data = bio.getvalue()
+    sheet_cache.put(digest, data)
+    return digest, data
@@ -0,0 +1,136 @@
+"""
+Receipts: a frozen snapshot per PAID bill, and ESC/POS output.
+
+When a bill is paid, `freeze_receipt` copies its lines (menu names as they
+were at that moment), total and shop name into a Receipt row and renders
+`_receipt_body.html` once. Views serve that stored HTML with its ETag, so
+reprints don't touch OrderItem/MenuItem. Bills still OPEN are rendered live
+from an unsaved Receipt.
+
+`escpos_bytes` writes the same snapshot as a raw ESC/POS job for 58/80 mm
+thermal printers: Thai text in code page 874 (TIS-620) and, for unpaid
+bills, the PromptPay QR as the printer's own QR command (GS ( k), so
+nothing has to be rasterized.
+"""
+
+import hashlib
+import json
+import unicodedata
+from datetime import datetime
+
+from flask import render_template
+from sqlalchemy.exc import IntegrityError
+
+from models import db, MenuItem, OrderItem, Receipt
+
+
+def receipt_lines(order) -> list:
+    rows = (db.session.query(OrderItem.quantity, OrderItem.unit_price, OrderItem.note, MenuItem.name)
+            .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+            .filter(OrderItem.order_id == order.id)
+            .order_by(OrderItem.id))
+    return [{"name": name or "-", "qty": qty, "unit_price": price, "amount": round(qty * price, 2), "note": note}
+            for qty, price, note, name in rows]
+
+
+def snapshot(order, shop) -> Receipt:
+    """An unsaved Receipt for `order` as it is now."""
+    r = Receipt(order_id=order.id, shop_id=order.shop_id, shop_name=shop.name, closed_at=order.closed_at,
+                total_amount=float(order.total_amount or 0.0), created_at=datetime.utcnow())
+    r.lines = json.dumps(receipt_lines(order), ensure_ascii=False)
+    r.html = render_template("_receipt_body.html", receipt=r, items=json.loads(r.lines))
+    r.etag = hashlib.sha1(r.html.encode("utf-8")).hexdigest()
+    return r
+
+
+def freeze_receipt(order, shop) -> Receipt:
+    """Store the receipt of a bill that has just been paid (caller commits)."""
+    r = snapshot(order, shop)
+    db.session.add(r)
+    return r
+
+
+def get_receipt(order, shop) -> Receipt:
+    """The stored receipt of a PAID bill (frozen on first view for bills paid
+    before receipts were stored), or a live one for an OPEN bill."""
+    if order.status != "PAID":
+        return snapshot(order, shop)
+    r = Receipt.query.filter_by(order_id=order.id).first()
+    if r is None:
+        try:
+            with db.session.begin_nested():
+                r = freeze_receipt(order, shop)
+        except IntegrityError:
+            # a concurrent first view stored it first
+            r = Receipt.query.filter_by(order_id=order.id).one()
+        db.session.commit()
+    return r
+
+
+# ESC/POS
+
+ESC, GS = b"\x1b", b"\x1d"
+INIT = ESC + b"@"
+ALIGN_LEFT, ALIGN_CENTER = ESC + b"a\x00", ESC + b"a\x01"
+BOLD_ON, BOLD_OFF = ESC + b"E\x01", ESC + b"E\x00"
+DOUBLE_ON, DOUBLE_OFF = GS + b"!\x11", GS + b"!\x00"
+CUT = GS + b"V\x42\x00"  # feed to the cutter, partial cut
+
+
+def _cols(text: str) -> int:
+    # Thai vowel/tone marks print above or below the previous letter
+    return sum(1 for c in text if unicodedata.category(c) != "Mn")
+
+
+def _fit(text: str, width: int) -> list:
+    """Wrap `text` into lines of at most `width` printed columns."""
+    lines, cur, n = [], "", 0
+    for c in text:
+        w = 0 if unicodedata.category(c) == "Mn" else 1
+        if n + w > width:
+            lines.append(cur)
+            cur, n = "", 0
+        cur += c
+        n += w
+    return lines + [cur] if cur or not lines else lines
+
+
+def _row(left: str, right: str, width: int) -> str:
+    pad = width - _cols(left) - _cols(right)
+    return left + " " * max(1, pad) + right
+
+
+def qr_command(data: str, module: int = 6) -> bytes:
+    """GS ( k: store `data` as a model 2 QR (error level M) and print it.
+    The length field counts bytes, so UTF-8 text (e.g. a Thai merchant name
+    in a PromptPay payload) is stored as is."""
+    body = data.encode("utf-8")
+    n = len(body) + 3
+    return (GS + b"(k\x04\x001A2\x00"
+            + GS + b"(k\x03\x001C" + bytes([module])
+            + GS + b"(k\x03\x001E1"
+            + GS + b"(k" + bytes([n & 0xFF, n >> 8]) + b"1P0" + body
+            + GS + b"(k\x03\x001Q0")
+
+
+def escpos_bytes(receipt: Receipt, width: int = 32, code_page: int = 21, qr_payload: str | None = None) -> bytes:
+    """A complete print job for `receipt`, `width` characters per line."""
+    def text(s):
+        return s.encode("cp874", "replace") + b"\n"
+
+    out = [INIT, ESC + b"t" + bytes([code_page]), ALIGN_CENTER, BOLD_ON, DOUBLE_ON]
+    out += [text(l) for l in _fit(receipt.shop_name or "", width // 2)]
+    out += [DOUBLE_OFF, BOLD_OFF, text(f"ใบเสร็จ #{receipt.order_id}")]
+    if receipt.closed_at:
+        out.append(text(receipt.closed_at.strftime("%Y-%m-%d %H:%M")))
+    out += [ALIGN_LEFT, text("-" * width)]
+    for it in json.loads(receipt.lines):
+        out += [text(l) for l in _fit(it["name"], width)]
+        if it.get("note"):
+            out += [text(l) for l in _fit(f"  * {it['note']}", width)]
+        out.append(text(_row(f"  {it['qty']} x {it['unit_price']:.2f}", f"{it['amount']:.2f}", width)))
+    out += [text("-" * width), BOLD_ON, text(_row("รวม", f"{receipt.total_amount:.2f}", width)), BOLD_OFF]
+    if qr_payload:
+        out += [ALIGN_CENTER, text("สแกนจ่ายด้วย PromptPay"), qr_command(qr_payload), b"\n"]
+    out += [ALIGN_CENTER, text("ขอบคุณที่ใช้บริการ"), ESC + b"d\x03", CUT]
+    return b"".join(out)
@@ -0,0 +1,208 @@
+"""
+Pre-aggregated sales rollups (per shop, per day and per hour, plus
+per-menu-item daily quantity/revenue counters for top sellers).
+
+`record_sale` runs in the `order_closed` job queued when a bill is paid
+(utils/jobs.py), so dashboard/reports only read a handful of rows; the
+rollups trail the PAID bills by however long that job waits in the queue
+(immediately with JOB_MODE=inline).
+`rebuild_rollups` recomputes everything from `Order` history, archived
+months included (backfill).
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import bindparam, case, func, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ItemSalesDaily, MenuItem, Order, OrderItem, SalesDaily, SalesHourly
+from utils.archive import order_lines, paid_orders
+
+
+def _bump(model, keys: dict, amount: float, count: int = 1):
+    stmt = (
+        update(model)
+        .filter_by(**keys)
+        .values(order_count=model.order_count + count, total_amount=model.total_amount + amount)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(stmt).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**keys, order_count=count, total_amount=amount))
+    except IntegrityError:
+        # another worker inserted the row first
+        db.session.execute(stmt)
+
+
+def record_sale(order: Order):
+    """Add a PAID order to its shop's daily/hourly rollups (caller commits)."""
+    if not order.closed_at:
+        return
+    day = order.closed_at.date()
+    amount = float(order.total_amount or 0.0)
+    _bump(SalesDaily, {"shop_id": order.shop_id, "day": day}, amount)
+    _bump(SalesHourly, {"shop_id": order.shop_id, "day": day, "hour": order.closed_at.hour}, amount)
+    record_item_sales(order)
+
+
+def record_item_sales(order: Order):
+    """Add the order's lines to the per-item daily counters: one grouped
+    read of the lines, one executemany UPDATE, one bulk INSERT."""
+    day = order.closed_at.date()
+    lines = {
+        mid: (int(q or 0), float(r or 0.0)) for mid, q, r in
+        db.session.query(OrderItem.menu_item_id, func.sum(OrderItem.quantity), func.sum(OrderItem.quantity * OrderItem.unit_price))
+        .filter(OrderItem.order_id == order.id).group_by(OrderItem.menu_item_id)
+    }
+    if not lines:
+        return
+    existing = {mid for (mid,) in db.session.query(ItemSalesDaily.menu_item_id).filter(
+        ItemSalesDaily.shop_id == order.shop_id, ItemSalesDaily.day == day, ItemSalesDaily.menu_item_id.in_(lines))}
+    t = ItemSalesDaily.__table__
+    if existing:
+        db.session.execute(
+            update(t)
+            .where(t.c.shop_id == order.shop_id, t.c.day == day, t.c.menu_item_id == bindparam("b_item"))
+            .values(quantity=t.c.quantity + bindparam("b_qty"), revenue=t.c.revenue + bindparam("b_rev")),
+            [{"b_item": mid, "b_qty": q, "b_rev": r} for mid, (q, r) in lines.items() if mid in existing],
+        )
+    missing = [
+        {"shop_id": order.shop_id, "menu_item_id": mid, "day": day, "quantity": q, "revenue": r}
+        for mid, (q, r) in lines.items() if mid not in existing
+    ]
+    if not missing:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(ItemSalesDaily), missing)
+    except IntegrityError:
+        # a concurrent close created some of the rows; fall back to row by row
+        for row in missing:
+            stmt = (update(t).where(t.c.shop_id == row["shop_id"], t.c.day == day, t.c.menu_item_id == row["menu_item_id"])
+                    .values(quantity=t.c.quantity + row["quantity"], revenue=t.c.revenue + row["revenue"]))
+            if not db.session.execute(stmt).rowcount:
+                db.session.execute(insert(ItemSalesDaily), [row])
+
+
+def sales_summary(shop_id: int, today: date, session=None) -> dict:
+    """Totals for today / last 7 days / this month / all time in one query.
+    The read helpers take an optional `session` (e.g. a replica reader)."""
+    month_start = today.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    amt = SalesDaily.total_amount
+    row = (session or db.session).query(
+        func.coalesce(func.sum(amt), 0.0),
+        func.coalesce(func.sum(case((SalesDaily.day == today, amt), else_=0.0)), 0.0),
+        func.coalesce(func.sum(case((SalesDaily.day >= today - timedelta(days=7), amt), else_=0.0)), 0.0),
+        func.coalesce(func.sum(case(((SalesDaily.day >= month_start) & (SalesDaily.day < next_month), amt), else_=0.0)), 0.0),
+    ).filter(SalesDaily.shop_id == shop_id).one()
+    return {"total": row[0], "day": row[1], "week": row[2], "month": row[3]}
+
+
+def hourly_sales(shop_id: int, day: date, session=None) -> list:
+    rows = (
+        (session or db.session).query(SalesHourly.hour, SalesHourly.order_count, SalesHourly.total_amount)
+        .filter_by(shop_id=shop_id, day=day)
+        .order_by(SalesHourly.hour)
+        .all()
+    )
+    return [(h, n, amt) for h, n, amt in rows]
+
+
+TOP_ITEM_METRICS = ("quantity", "revenue")
+
+
+def top_items(shop_id: int, start: date | None = None, end: date | None = None, by: str = "quantity", limit: int = 5,
+              session=None) -> list:
+    """[(name, quantity, revenue)] from the per-item counters; `end` is inclusive."""
+    qty, rev = func.sum(ItemSalesDaily.quantity), func.sum(ItemSalesDaily.revenue)
+    q = (
+        (session or db.session).query(MenuItem.name, qty, rev)
+        .join(MenuItem, MenuItem.id == ItemSalesDaily.menu_item_id)
+        .filter(ItemSalesDaily.shop_id == shop_id)
+    )
+    if start is not None:
+        q = q.filter(ItemSalesDaily.day >= start)
+    if end is not None:
+        q = q.filter(ItemSalesDaily.day <= end)
+    order_col = rev if by == "revenue" else qty
+    return [(n, int(a or 0), float(b or 0.0)) for n, a, b in
+            q.group_by(ItemSalesDaily.menu_item_id, MenuItem.name)
+            .order_by(order_col.desc(), ItemSalesDaily.menu_item_id).limit(limit)]
+
+
+def top_items_from_orders(shop_id: int, start: date | None = None, end: date | None = None, by: str = "quantity", limit: int = 5) -> list:
+    """Same result as `top_items` (ties broken the same way), computed with
+    one GROUP BY over the raw order lines; `flask rollups-check` compares
+    the two."""
+    window = (start and datetime.combine(start, time.min), end and datetime.combine(end + timedelta(days=1), time.min))
+    Order, OrderItem = paid_orders(db.session, *window), order_lines(db.session, *window)
+    qty, rev = func.sum(OrderItem.quantity), func.sum(OrderItem.quantity * OrderItem.unit_price)
+    q = (
+        db.session.query(MenuItem.name, qty, rev)
+        .select_from(OrderItem)
+        .join(Order, Order.id == OrderItem.order_id)
+        .join(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+        .filter(Order.shop_id == shop_id, Order.status == "PAID")
+    )
+    if start is not None:
+        q = q.filter(Order.closed_at >= start)
+    if end is not None:
+        q = q.filter(Order.closed_at < end + timedelta(days=1))
+    order_col = rev if by == "revenue" else qty
+    return [(n, int(a or 0), float(b or 0.0)) for n, a, b in
+            q.group_by(OrderItem.menu_item_id, MenuItem.name)
+            .order_by(order_col.desc(), OrderItem.menu_item_id).limit(limit)]
+
+
+def rebuild_rollups(shop_id: int | None = None, batch_size: int = 5000) -> int:
+    """Recompute rollups from PAID orders. Returns the number of orders scanned."""
+    daily, hourly = {}, {}
+    Order, OrderItem = paid_orders(db.session), order_lines(db.session)
+    q = db.session.query(Order.shop_id, Order.closed_at, Order.total_amount).filter(
+        Order.status == "PAID", Order.closed_at.isnot(None)
+    )
+    if shop_id is not None:
+        q = q.filter(Order.shop_id == shop_id)
+    scanned = 0
+    for sid, closed_at, total in q.yield_per(batch_size):
+        scanned += 1
+        amount = float(total or 0.0)
+        for acc, key in ((daily, (sid, closed_at.date())), (hourly, (sid, closed_at.date(), closed_at.hour))):
+            n, s = acc.get(key, (0, 0.0))
+            acc[key] = (n + 1, s + amount)
+
+    items = {}
+    lq = (
+        db.session.query(Order.shop_id, Order.closed_at, OrderItem.menu_item_id, OrderItem.quantity, OrderItem.unit_price)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .filter(Order.status == "PAID", Order.closed_at.isnot(None))
+    )
+    if shop_id is not None:
+        lq = lq.filter(Order.shop_id == shop_id)
+    for sid, closed_at, mid, qty, price in lq.yield_per(batch_size):
+        key = (sid, mid, closed_at.date())
+        q, r = items.get(key, (0, 0.0))
+        items[key] = (q + (qty or 0), r + (qty or 0) * (price or 0.0))
+
+    for model in (SalesDaily, SalesHourly, ItemSalesDaily):
+        dq = model.query
+        if shop_id is not None:
+            dq = dq.filter_by(shop_id=shop_id)
+        dq.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(SalesDaily, [
+        {"shop_id": sid, "day": d, "order_count": n, "total_amount": s}
+        for (sid, d), (n, s) in daily.items()
+    ])
+    db.session.bulk_insert_mappings(SalesHourly, [
+        {"shop_id": sid, "day": d, "hour": h, "order_count": n, "total_amount": s}
+        for (sid, d, h), (n, s) in hourly.items()
+    ])
+    db.session.bulk_insert_mappings(ItemSalesDaily, [
+        {"shop_id": sid, "menu_item_id": mid, "day": d, "quantity": q, "revenue": r}
+        for (sid, mid, d), (q, r) in items.items()
+    ])
+    db.session.commit()
+    return scanned
@@ -0,0 +1,29 @@
+"""
+Tenant (shop) context for authenticated requests.
+
+`load_user` fetches the user together with their shop in one query and
+parks the shop on `g`, so `shop_required` and the route handlers share it
+instead of each running `Shop.query.get(...)`. Nothing outlives the
+request, so a change to a shop (plan expiry, PromptPay receiver, point
+rate) is seen by every worker on its next request.
+"""
+
+from flask import g
+from flask_login import current_user
+from sqlalchemy.orm import joinedload
+
+from models import db, User
+
+
+def load_user(user_id):
+    user = db.session.get(User, int(user_id), options=[joinedload(User.shop)])
+    if user is not None:
+        g.shop = user.shop
+    return user
+
+
+def current_shop():
+    """The signed-in user's shop, resolved once per request."""
+    if "shop" not in g:
+        g.shop = current_user.shop if current_user.is_authenticated else None
+    return g.shop